@@ -0,0 +1,56 @@
+import os
+import tempfile
+from argparse import ArgumentParser
+
+from benchmark.replay_server import ReplayConfig, ReplayServer
+
+
+def main(args):
+    config = ReplayConfig(latency=args.latency, jitter=args.jitter, rate_limit_probability=args.rate_limit_probability,
+                          max_rate=args.max_rate, retry_after=args.retry_after, invalid_rate=args.invalid_rate,
+                          missing_rate=args.missing_rate, recorded_path=args.recorded_path)
+    server = ReplayServer(config).start()
+    print(f"Replay server listening on {server.url}")
+    # the scrapers write to a throwaway data folder and read the urls of the server from the environment
+    data_path = args.data_path or tempfile.mkdtemp(prefix="scraper-benchmark-")
+    os.environ.update(server.environment, DATA_PATH=data_path, TEMP_PATH=os.path.join(data_path, "tmp"))
+    from benchmark.suite import BenchmarkSuite, load_results, print_results, write_results
+    from utility.rate_limiter import MUSICBRAINZ_RATE_LIMITER
+    from utility.token_pool import SPOTIFY_AUTH_TOKEN
+
+    if args.rate is not None:
+        for rate_limiter in (*SPOTIFY_AUTH_TOKEN.rate_limiters, MUSICBRAINZ_RATE_LIMITER):
+            rate_limiter.rate = rate_limiter.max_rate = args.rate
+    suite = BenchmarkSuite(server, size=args.size, concurrency=args.concurrency, verbose=args.verbose)
+    try:
+        results = suite.run(args.scenarios)
+    finally:
+        server.stop()
+    print_results(results, load_results(args.baseline) if args.baseline else None)
+    if args.output:
+        write_results(results, args.output)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(prog="python -m benchmark",
+                            description="Measures the scrapers against a local stand-in of the Spotify and MusicBrainz apis")
+    parser.add_argument('-s', '--scenarios', help=f'Scenarios to run, all of them by default', nargs='+',
+                        choices=['tracks-batch', 'tracks-batch-async', 'artists-single', 'artists-single-async',
+                                 'playlists', 'playlists-async', 'aliases'])
+    parser.add_argument('-z', '--size', help=f'Number of ids scraped by each scenario, a tenth for playlists and aliases', type=int, default=200)
+    parser.add_argument('-n', '--concurrency', help=f'Number of concurrent requests of the async scenarios', type=int, default=8)
+    parser.add_argument('-r', '--rate', help=f'Overrides the rate of the rate limiters, in requests per second', type=float)
+    parser.add_argument('-l', '--latency', help=f'Latency of the server, in seconds', type=float, default=0.05)
+    parser.add_argument('-j', '--jitter', help=f'Random latency added to each response, in seconds', type=float, default=0.02)
+    parser.add_argument('-p', '--rate-limit-probability', help=f'Share of the requests answered 429', type=float, default=0.0)
+    parser.add_argument('-m', '--max-rate', help=f'Requests per second above which the server answers 429', type=float)
+    parser.add_argument('-a', '--retry-after', help=f'Retry-After of the 429 responses, in seconds', type=float, default=1.0)
+    parser.add_argument('-i', '--invalid-rate', help=f'Share of the ids rejected with a 400, failing their whole batch', type=float, default=0.0)
+    parser.add_argument('-x', '--missing-rate', help=f'Share of the ids missing from the responses', type=float, default=0.0)
+    parser.add_argument('-rp', '--recorded-path', help=f'Spotify data folder whose stored items are replayed')
+    parser.add_argument('-d', '--data-path', help=f'Data folder of the scrapers, a temporary folder by default')
+    parser.add_argument('-b', '--baseline', help=f'Results of a previous run to compare with')
+    parser.add_argument('-o', '--output', help=f'Writes the results to a json file, to be used as a baseline')
+    parser.add_argument('-v', '--verbose', help=f'Shows the output of the scrapers', action='store_true')
+    main(parser.parse_args())
@@ -0,0 +1,83 @@
+import json
+from argparse import ArgumentParser
+from typing import Any
+
+from benchmark.mapper import DEFAULT_MAPPINGS
+from benchmark.replay_server import ReplayConfig, ReplayServer
+from spotify.fields import build_fields_filter
+from spotify.util import load_mapping
+from utility.variables import SPOTIFY_FIELDS_ENDPOINTS
+
+
+def load_mapping_or_default(endpoint: str) -> dict | None:
+    """
+    Returns:
+        dict | None: `mapping.json` of the endpoint, the default mapping of the benchmarks when it has none.
+    """
+    mapping = load_mapping(endpoint)
+    return mapping if mapping is not None else DEFAULT_MAPPINGS.get(endpoint)
+
+
+def resolve(data: Any, path: str) -> Any:
+    """
+    Returns:
+        Any: Values of a dotted path of `mapping.json` in a json value, the values of the items of a list are
+            listed, e.g. the ids of the artists for `artists[].id`.
+    """
+    keys = path.split('.')
+    for i, key in enumerate(keys):
+        if isinstance(data, list):
+            return [resolve(item, '.'.join(keys[i:])) for item in data]
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key.replace('[]', ''))
+    return data
+
+
+def leaf_paths(tree: dict, prefix: str = "") -> list[str]:
+    """
+    Returns:
+        list[str]: Dotted paths of the fields returned whole by a filter tree.
+    """
+    paths = []
+    for key, value in tree.items():
+        paths += [prefix + key] if value is True else leaf_paths(value, f"{prefix}{key}.")
+    return paths
+
+
+def main(args):
+    server = ReplayServer(ReplayConfig(latency=0, jitter=0, collection_size=args.collection_size)).start()
+    try:
+        print(f"{'endpoint':<12}{'items':>8}{'unfiltered':>14}{'filtered':>12}{'ratio':>8}")
+        for endpoint in args.endpoints:
+            fields_filter = build_fields_filter(endpoint, load=load_mapping_or_default)
+            unfiltered_size = filtered_size = 0
+            for i in range(args.size):
+                path = f"/v1/{endpoint}/{endpoint}{i:06d}"
+                unfiltered = server.handle("GET", path, b"")[1]
+                filtered = server.handle("GET", f"{path}?fields={fields_filter.to_param()}", b"")[1]
+                # the filtered response must hold every value the mappings and loaders read
+                for field_path in leaf_paths(fields_filter.tree):
+                    if resolve(filtered, field_path) != resolve(unfiltered, field_path):
+                        raise AssertionError(f"The filtered {endpoint} item {i} differs on {field_path}")
+                unfiltered_size += len(json.dumps(unfiltered))
+                filtered_size += len(json.dumps(filtered))
+            if filtered_size >= unfiltered_size:
+                raise AssertionError(f"The filtered {endpoint} items are not smaller than the unfiltered ones")
+            print(f"{endpoint:<12}{args.size:>8}{unfiltered_size:>14}{filtered_size:>12}"
+                  f"{filtered_size / unfiltered_size:>8.2f}")
+            print(f"fields={fields_filter.to_param()}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(prog="python -m benchmark.fields",
+                            description="Compares the size of the responses requested with and without the "
+                                        "fields filter of the mappings")
+    parser.add_argument('-e', '--endpoints', help=f'Endpoints whose items are requested', nargs='+',
+                        choices=SPOTIFY_FIELDS_ENDPOINTS, default=SPOTIFY_FIELDS_ENDPOINTS)
+    parser.add_argument('-z', '--size', help=f'Number of items requested', type=int, default=100)
+    parser.add_argument('-c', '--collection-size', help=f'Number of tracks of the first page of a playlist',
+                        type=int, default=100)
+    main(parser.parse_args())
@@ -0,0 +1,96 @@
+import json
+import time
+from argparse import ArgumentParser
+from itertools import islice
+from typing import Any, Callable
+
+from benchmark.replay_server import ReplayConfig, ReplayServer
+from spotify.models.playlist_model import PlaylistModel
+from spotify.models.track_model import TrackModel
+from spotify.util import load_mapping, open_item_store
+from utility.mapper import JsonToObjectMapper
+
+# mappings used when the data folder has no `mapping.json`, they read the fields of the models
+DEFAULT_MAPPINGS = {
+    'tracks': {
+        'spotify_id': 'id', 'audio_name': 'name', 'uri': 'uri', 'href': 'href',
+        'external_url': 'external_urls.spotify', 'explicit': 'explicit', 'popularity': 'popularity', 'type': 'type',
+        'duration_ms': 'duration_ms', 'preview_url': 'preview_url', 'disc_number': 'disc_number',
+        'artists': 'artists[].id', 'album': 'album.id', 'available_markets': 'available_markets[]',
+    },
+    'playlists': {
+        'spotify_id': 'id', 'playlist_name': 'name', 'description': 'description', 'nb_followers': 'followers.total',
+        'collaborative': 'collaborative', 'snapshot_id': 'snapshot_id', 'href': 'href',
+        'external_url': 'external_urls.spotify', 'uri': 'uri', 'tracks': 'tracks.items[].track.id',
+    },
+}
+MODELS = {'tracks': TrackModel, 'playlists': PlaylistModel}
+
+
+class InterpretedMapper(JsonToObjectMapper):
+    """The mapper as it was before the mappings were compiled, splitting every path of every object."""
+
+    def map(self, json_data: dict[str, Any], cls: type) -> Any:
+        obj_data = {}
+        for attr, json_path in self.mapping.items():
+            obj_data[attr] = self.extract_value(json_data, json_path)
+        return cls(**obj_data)
+
+
+def load_items(endpoint: str, size: int) -> list[dict]:
+    """
+    Returns:
+        list[dict]: Up to `size` items of the item store of the endpoint, synthetic items of the replay server
+            when the store is empty.
+    """
+    items = [json.loads(data) for _, data in islice(open_item_store(endpoint).items_bytes(), size)]
+    if items:
+        return items
+    server = ReplayServer(ReplayConfig(latency=0, jitter=0)).start()
+    try:
+        return [server.handle("GET", f"/v1/{endpoint}/{endpoint}{i:06d}", b"")[1] for i in range(size)]
+    finally:
+        server.stop()
+
+
+def measure(map: Callable[[dict, type], Any], items: list[dict], cls: type, repeat: int) -> float:
+    """
+    Returns:
+        float: Best time of `repeat` runs mapping every item, in seconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            map(item, cls)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(args):
+    print(f"{'endpoint':<12}{'items':>8}{'mapping':>10}{'interpreted':>14}{'compiled':>12}{'speedup':>10}")
+    for endpoint in args.endpoints:
+        mapping = load_mapping(endpoint)
+        source = "stored"
+        if mapping is None:
+            mapping, source = DEFAULT_MAPPINGS[endpoint], "default"
+        items = load_items(endpoint, args.size)
+        interpreted, compiled = InterpretedMapper(mapping), JsonToObjectMapper(mapping)
+        # both mappers must build the same objects before they are compared
+        for item in items:
+            if vars(interpreted.map(item, MODELS[endpoint])) != vars(compiled.map(item, MODELS[endpoint])):
+                raise AssertionError(f"The compiled mapper differs on {endpoint} item {item.get('id')}")
+        interpreted_seconds = measure(interpreted.map, items, MODELS[endpoint], args.repeat)
+        compiled_seconds = measure(compiled.map, items, MODELS[endpoint], args.repeat)
+        print(f"{endpoint:<12}{len(items):>8}{source:>10}{interpreted_seconds:>13.3f}s{compiled_seconds:>11.3f}s"
+              f"{interpreted_seconds / compiled_seconds:>9.2f}x")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(prog="python -m benchmark.mapper",
+                            description="Compares the compiled mapper with the interpreted one on stored items")
+    parser.add_argument('-e', '--endpoints', help=f'Endpoints whose items are mapped', nargs='+',
+                        choices=list(DEFAULT_MAPPINGS), default=list(DEFAULT_MAPPINGS))
+    parser.add_argument('-z', '--size', help=f'Number of items mapped', type=int, default=10000)
+    parser.add_argument('-r', '--repeat', help=f'Number of runs, the best one is kept', type=int, default=5)
+    main(parser.parse_args())
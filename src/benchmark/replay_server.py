@@ -0,0 +1,336 @@
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# endpoints of the stand-in spotify api and the field of their paginated collection
+PAGINATED_FIELDS = {'playlists': 'tracks', 'albums': 'tracks', 'audiobooks': 'chapters'}
+MARKETS = ['CA', 'US', 'FR', 'GB']
+
+
+class ReplayConfig:
+    """
+    Behaviour of the `ReplayServer`. Every rate is a fraction between 0 and 1.
+
+    Attributes:
+        latency (float): Time the server takes to answer a request, in seconds.
+        jitter (float): Random time added to the latency, up to this many seconds.
+        rate_limit_probability (float): Share of the requests answered 429 with a `Retry-After`.
+        max_rate (float | None): Requests per second above which the server answers 429, None for no ceiling.
+        retry_after (float): Value of the `Retry-After` header of the 429 responses, in seconds.
+        invalid_rate (float): Share of the ids rejected with a 400, the batches holding one fail whole.
+        missing_rate (float): Share of the ids that do not exist, a batch returns null for them.
+        page_size (int): Number of items per page of a paginated collection.
+        collection_size (int): Number of tracks of a playlist or album, or chapters of an audiobook.
+        recorded_path (str | None): Data folder whose stored items are served instead of the synthetic ones,
+            e.g. the `data` folder of a previous scrape. None serves synthetic items only.
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, rate_limit_probability: float = 0.0,
+                 max_rate: float | None = None, retry_after: float = 1.0, invalid_rate: float = 0.0,
+                 missing_rate: float = 0.0, page_size: int = 100, collection_size: int = 250,
+                 recorded_path: str | None = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_probability = rate_limit_probability
+        self.max_rate = max_rate
+        self.retry_after = retry_after
+        self.invalid_rate = invalid_rate
+        self.missing_rate = missing_rate
+        self.page_size = page_size
+        self.collection_size = collection_size
+        self.recorded_path = recorded_path
+
+
+class ReplayServer:
+    """
+    Local stand-in of the Spotify and MusicBrainz apis, used to measure the scrapers without the live apis.
+
+    Serves `/v1/{endpoint}/{id}`, `/v1/{endpoint}?ids=`, the pages of the paginated collections, the token
+    endpoint `/api/token` and the MusicBrainz search `/ws/2/artist`. The items are synthetic, or replayed from
+    the item stores of `recorded_path`, and every id is deterministically valid, invalid or missing, so two
+    runs with the same config send the same requests.
+
+    The server injects the latency, the 429 responses and the failing ids of its `ReplayConfig`, and counts
+    the requests it receives by kind.
+    """
+
+    def __init__(self, config: ReplayConfig | None = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        Args:
+            config (ReplayConfig, optional): Behaviour of the server. Defaults to None, for the default config.
+            host (str, optional): Address the server listens on. Defaults to "127.0.0.1".
+            port (int, optional): Port the server listens on. Defaults to 0, for any free port.
+        """
+        self.config = config if config is not None else ReplayConfig()
+        self.__lock = threading.Lock()
+        self.__counts: dict[str, int] = {}
+        self.__request_times: list[float] = []
+        self.__stores = {}
+        self.__server = ThreadingHTTPServer((host, port), self.__handler_class())
+        self.__server.daemon_threads = True
+        self.__thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def environment(self) -> dict[str, str]:
+        """
+        Returns:
+            dict[str, str]: Environment variables pointing the scrapers to this server, read by `variables.py`.
+        """
+        return {
+            'SPOTIFY_API_URL': f"{self.url}/v1",
+            'SPOTIFY_AUTH_URL': f"{self.url}/api/token",
+            'MUSICBRAINZ_WS_URL': f"{self.url}/ws/2",
+            'SPOTIFY_CLIENT_ID': "replay-client",
+            'SPOTIFY_CLIENT_SECRET': "replay-secret",
+            'SPOTIFY_CLIENT_CREDENTIALS': "",
+        }
+
+    def start(self) -> 'ReplayServer':
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name="replay-server", daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def counts(self) -> dict[str, int]:
+        """
+        Returns:
+            dict[str, int]: Number of requests received by kind, e.g. `item`, `batch`, `page`, `token`,
+                `musicbrainz` and `rate_limited`, and in `total`.
+        """
+        with self.__lock:
+            return dict(self.__counts)
+
+    def reset_counts(self):
+        with self.__lock:
+            self.__counts = {}
+
+    # ------------------------------------- REQUESTS -------------------------------------
+
+    def __count(self, kind: str):
+        with self.__lock:
+            self.__counts[kind] = self.__counts.get(kind, 0) + 1
+            self.__counts['total'] = self.__counts.get('total', 0) + 1
+
+    def __is_rate_limited(self) -> bool:
+        if random.random() < self.config.rate_limit_probability:
+            return True
+        if self.config.max_rate is None:
+            return False
+        # sliding window of the last second
+        now = time.monotonic()
+        with self.__lock:
+            self.__request_times = [t for t in self.__request_times if t > now - 1]
+            if len(self.__request_times) >= self.config.max_rate:
+                return True
+            self.__request_times.append(now)
+            return False
+
+    def __has_share(self, id: str, salt: str, rate: float) -> bool:
+        # deterministic per id, the same ids fail on every run
+        return zlib.crc32(f"{salt}:{id}".encode()) % 10000 < rate * 10000
+
+    def handle(self, method: str, path: str, body: bytes) -> tuple[int, dict | None, dict[str, str]]:
+        """Answers a request received by the server.
+
+        Returns:
+            tuple[int, dict | None, dict[str, str]]: Status code, json body and headers of the response.
+        """
+        url = urlparse(path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        parts = url.path.strip('/').split('/')
+        time.sleep(self.config.latency + random.random() * self.config.jitter)
+
+        if method == 'POST' and url.path == '/api/token':
+            self.__count('token')
+            return 200, {'access_token': f"replay-{time.time_ns()}", 'token_type': 'Bearer', 'expires_in': 3600}, {}
+        if self.__is_rate_limited():
+            self.__count('rate_limited')
+            return 429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}}, \
+                {'Retry-After': str(self.config.retry_after)}
+        if parts[:3] == ['ws', '2', 'artist']:
+            self.__count('musicbrainz')
+            return 200, self.__musicbrainz_artists(query.get('query', '')), {}
+        if len(parts) < 2 or parts[0] != 'v1':
+            self.__count('not_found')
+            return 404, {'error': {'status': 404, 'message': 'Not found.'}}, {}
+
+        endpoint = parts[1]
+        if len(parts) == 2 and 'ids' in query:
+            self.__count('batch')
+            ids = query['ids'].split(',')
+            if any(self.__has_share(id, 'invalid', self.config.invalid_rate) for id in ids):
+                return 400, {'error': {'status': 400, 'message': 'invalid id'}}, {}
+            items = [None if self.__has_share(id, 'missing', self.config.missing_rate) else self.__item(endpoint, id)
+                     for id in ids]
+            return 200, {endpoint: items}, {}
+        if len(parts) == 3:
+            self.__count('item')
+            id = parts[2]
+            if self.__has_share(id, 'invalid', self.config.invalid_rate):
+                return 400, {'error': {'status': 400, 'message': 'invalid id'}}, {}
+            if self.__has_share(id, 'missing', self.config.missing_rate):
+                return 404, {'error': {'status': 404, 'message': 'Non existing id'}}, {}
+            return 200, self.__filter(self.__item(endpoint, id), query), {}
+        if len(parts) == 4:
+            self.__count('page')
+            offset = int(query.get('offset', 0))
+            limit = int(query.get('limit', self.config.page_size))
+            return 200, self.__filter(self.__page(endpoint, parts[2], parts[3], offset, limit), query), {}
+        self.__count('not_found')
+        return 404, {'error': {'status': 404, 'message': 'Not found.'}}, {}
+
+    @staticmethod
+    def __filter(payload: dict, query: dict[str, str]) -> dict:
+        """Keeps the fields listed by the `fields` parameter of the request, like the api does."""
+        if 'fields' not in query:
+            return payload
+        # imported here, the server is created before the environment read by `variables.py` points to it
+        from spotify.fields import FieldsFilter
+        return FieldsFilter.from_param(query['fields']).apply(payload)
+
+    def __handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self.__reply(*server.handle('GET', self.path, b""))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                self.__reply(*server.handle('POST', self.path, body))
+
+            def __reply(self, status: int, payload: dict | None, headers: dict[str, str]):
+                data = json.dumps(payload).encode('utf-8') if payload is not None else b""
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    # -------------------------------------- ITEMS --------------------------------------
+
+    def __recorded_item(self, endpoint: str, id: str) -> dict | None:
+        if self.config.recorded_path is None:
+            return None
+        with self.__lock:
+            store = self.__stores.get(endpoint)
+            if store is None:
+                # imported late, the environment of the scrapers is set once the server is started
+                from spotify.util import open_item_store
+                store = open_item_store(endpoint, source_data_path=self.config.recorded_path)
+                self.__stores[endpoint] = store
+        return store.get(id)
+
+    def __item(self, endpoint: str, id: str) -> dict:
+        recorded = self.__recorded_item(endpoint, id)
+        if recorded is not None:
+            return recorded
+        if endpoint == 'tracks':
+            return self.__track(id)
+        if endpoint == 'artists':
+            return self.__artist(id)
+        item = self.__base(endpoint, id)
+        if endpoint == 'albums':
+            item.update({'album_type': 'album', 'total_tracks': self.config.collection_size,
+                         'release_date': '2020-01-01', 'label': 'Replay', 'popularity': self.__number(id, 100),
+                         'available_markets': MARKETS, 'genres': [], 'artists': [self.__simple_artist(id)]})
+        elif endpoint == 'playlists':
+            item.update({'description': '', 'snapshot_id': 'replay', 'public': True, 'collaborative': False,
+                         'owner': {'id': 'replay', 'display_name': 'Replay'},
+                         'followers': {'href': None, 'total': self.__number(id, 100000)}})
+        elif endpoint == 'audiobooks':
+            item.update({'authors': [{'name': f"Author {id}"}], 'narrators': [{'name': f"Narrator {id}"}],
+                         'description': '', 'edition': 'Unabridged', 'publisher': 'Replay', 'explicit': False,
+                         'media_type': 'audio', 'total_chapters': self.config.collection_size,
+                         'languages': ['en'], 'available_markets': MARKETS})
+        field = PAGINATED_FIELDS.get(endpoint)
+        if field is not None:
+            item[field] = self.__page(endpoint, id, field, 0, self.config.page_size)
+        return item
+
+    def __page(self, endpoint: str, id: str, field: str, offset: int, limit: int) -> dict:
+        total = self.config.collection_size
+        items = []
+        for index in range(offset, min(total, offset + limit)):
+            child_id = f"{id}x{index}"
+            if field == 'chapters':
+                items.append({**self.__base('chapters', child_id), 'chapter_number': index,
+                              'duration_ms': 600000, 'explicit': False, 'release_date': '2020-01-01'})
+            elif endpoint == 'playlists':
+                items.append({'added_at': '2020-01-01T00:00:00Z', 'track': self.__track(child_id)})
+            else:
+                track = self.__track(child_id)
+                del track['album']
+                items.append(track)
+        base = f"{self.url}/v1/{endpoint}/{id}/{field}"
+        return {
+            'href': f"{base}?offset={offset}&limit={limit}",
+            'items': items,
+            'limit': limit,
+            'offset': offset,
+            'total': total,
+            'next': f"{base}?offset={offset + limit}&limit={limit}" if offset + limit < total else None,
+            'previous': None,
+        }
+
+    def __base(self, endpoint: str, id: str) -> dict:
+        type = endpoint[:-1]
+        return {
+            'id': id,
+            'name': f"{type.capitalize()} {id}",
+            'type': type,
+            'uri': f"spotify:{type}:{id}",
+            'href': f"{self.url}/v1/{endpoint}/{id}",
+            'external_urls': {'spotify': f"https://open.spotify.com/{type}/{id}"},
+            'images': [],
+        }
+
+    def __track(self, id: str) -> dict:
+        return {**self.__base('tracks', id), 'duration_ms': 180000 + self.__number(id, 60000), 'explicit': False,
+                'popularity': self.__number(id, 100), 'track_number': 1, 'disc_number': 1, 'is_local': False,
+                'available_markets': MARKETS, 'artists': [self.__simple_artist(id)],
+                'album': {**self.__base('albums', f"{id}a"), 'album_type': 'album', 'release_date': '2020-01-01',
+                          'artists': [self.__simple_artist(id)]}}
+
+    def __artist(self, id: str) -> dict:
+        return {**self.__base('artists', id), 'genres': ['replay'], 'popularity': self.__number(id, 100),
+                'followers': {'href': None, 'total': self.__number(id, 100000)}}
+
+    def __simple_artist(self, id: str) -> dict:
+        artist = self.__base('artists', f"{id}r")
+        del artist['images']
+        return artist
+
+    @staticmethod
+    def __number(id: str, upper: int) -> int:
+        return zlib.crc32(id.encode()) % upper
+
+    @staticmethod
+    def __musicbrainz_artists(name: str) -> dict:
+        return {'created': '2020-01-01T00:00:00Z', 'count': 1, 'offset': 0, 'artists': [{
+            'id': f"{zlib.crc32(name.encode()):08x}-replay",
+            'name': name,
+            'score': 100,
+            'aliases': [{'name': f"{name} alias", 'sort-name': name, 'type': 'Artist name', 'primary': None}],
+        }]}
@@ -0,0 +1,152 @@
+import contextlib
+import io
+import json
+import time
+from typing import Callable
+
+from benchmark.replay_server import ReplayServer
+from musicbrainz.loader import AliasLoader
+from musicbrainz.util import open_musicbrainz_registry
+from spotify.async_scraper import AsyncSpotifyScraper
+from spotify.scraper import SpotifyScraper
+from spotify.util import open_id_registry
+from utility.id_registry import CACHED, IdRegistry
+from utility.rate_limiter import MUSICBRAINZ_RATE_LIMITER
+from utility.token_pool import SPOTIFY_AUTH_TOKEN
+
+
+class BenchmarkResult:
+    """
+    Throughput of one scenario of the benchmark.
+
+    Attributes:
+        name (str): Name of the scenario.
+        items (int): Number of items cached by the scenario.
+        seconds (float): Duration of the scenario.
+        requests (dict[str, int]): Requests received by the replay server, by kind.
+        wait_time (float): Time the scrapers spent sleeping in the rate limiters, in seconds.
+    """
+
+    def __init__(self, name: str, items: int, seconds: float, requests: dict[str, int], wait_time: float):
+        self.name = name
+        self.items = items
+        self.seconds = seconds
+        self.requests = requests
+        self.wait_time = wait_time
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'items': self.items,
+            'seconds': self.seconds,
+            'items_per_second': self.items_per_second,
+            'requests': self.requests,
+            'wait_time': self.wait_time,
+        }
+
+
+class BenchmarkSuite:
+    """
+    Runs the scrapers against a `ReplayServer` and measures their throughput. Every scenario scrapes its own
+    ids, so the scenarios do not depend on each other, and results can be compared to a previous run.
+
+    The project modules read the api urls when they are imported, the environment of the server must be set
+    before this module is imported.
+    """
+
+    def __init__(self, server: ReplayServer, size: int = 200, concurrency: int = 8, verbose: bool = False):
+        """
+        Args:
+            server (ReplayServer): Running replay server, the scrapers are pointed to it.
+            size (int, optional): Number of ids scraped by each scenario. Defaults to 200.
+            concurrency (int, optional): Number of requests in flight of the concurrent scenarios. Defaults to 8.
+            verbose (bool, optional): Shows the output of the scrapers. Defaults to False.
+        """
+        self.server = server
+        self.size = size
+        self.concurrency = concurrency
+        self.verbose = verbose
+        self.scenarios: dict[str, Callable[[str], BenchmarkResult]] = {
+            'tracks-batch': lambda name: self.__spotify(name, 'tracks', 50, SpotifyScraper),
+            'tracks-batch-async': lambda name: self.__spotify(name, 'tracks', 50, self.__async_scraper),
+            'artists-single': lambda name: self.__spotify(name, 'artists', 1, SpotifyScraper),
+            'artists-single-async': lambda name: self.__spotify(name, 'artists', 1, self.__async_scraper),
+            'playlists': lambda name: self.__spotify(name, 'playlists', 1, SpotifyScraper, size=self.size // 10),
+            'playlists-async': lambda name: self.__spotify(name, 'playlists', 1, self.__async_scraper,
+                                                           size=self.size // 10),
+            'aliases': self.__aliases,
+        }
+
+    def run(self, names: list[str] | None = None) -> dict[str, BenchmarkResult]:
+        """
+        Args:
+            names (list[str], optional): Scenarios to run. Defaults to None, for every scenario.
+
+        Returns:
+            dict[str, BenchmarkResult]: Result of each scenario.
+        """
+        results = {}
+        for name in names if names is not None else self.scenarios:
+            print(f"Running {name} ...")
+            results[name] = self.scenarios[name](name)
+        return results
+
+    def __async_scraper(self, endpoint: str):
+        return AsyncSpotifyScraper(endpoint, concurrency=self.concurrency)
+
+    def __spotify(self, name: str, endpoint: str, batchmode: int, create_scraper: Callable,
+                  size: int | None = None) -> BenchmarkResult:
+        registry = open_id_registry(endpoint)
+        registry.add_ids(f"{name}{i:06d}" for i in range(size if size is not None else self.size))
+        scraper = create_scraper(endpoint)
+        return self.__measure(name, registry, SPOTIFY_AUTH_TOKEN, lambda: scraper.scrape_items(batchmode=batchmode))
+
+    def __aliases(self, name: str) -> BenchmarkResult:
+        registry = open_musicbrainz_registry("aliases")
+        registry.add_named_ids((f"{name}{i:06d}", f"Artist {i}") for i in range(self.size // 10))
+        loader = AliasLoader("aliases")
+        return self.__measure(name, registry, MUSICBRAINZ_RATE_LIMITER, loader.load_aliases_items)
+
+    def __measure(self, name: str, registry: IdRegistry, rate_limiter, scrape: Callable[[], None]) -> BenchmarkResult:
+        cached = registry.count(CACHED)
+        wait_time = rate_limiter.total_wait_time
+        self.server.reset_counts()
+        output = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+        start = time.perf_counter()
+        with output:
+            scrape()
+        seconds = time.perf_counter() - start
+        return BenchmarkResult(name, registry.count(CACHED) - cached, seconds, self.server.counts(),
+                               rate_limiter.total_wait_time - wait_time)
+
+
+def print_results(results: dict[str, BenchmarkResult], baseline: dict[str, dict] | None = None):
+    """Prints the results as a table, along with the change of throughput since a baseline run.
+
+    Args:
+        results (dict[str, BenchmarkResult]): Results of the scenarios.
+        baseline (dict[str, dict], optional): Results of a previous run, as written by `write_results`.
+            Defaults to None.
+    """
+    print(f"{'scenario':<22}{'items':>8}{'seconds':>10}{'items/s':>10}{'requests':>10}{'429s':>6}{'sleeping':>10}"
+          f"{'vs baseline':>13}")
+    for name, result in results.items():
+        change = ""
+        if baseline is not None and name in baseline and baseline[name]['items_per_second'] > 0:
+            change = f"{result.items_per_second / baseline[name]['items_per_second'] - 1:+.1%}"
+        print(f"{name:<22}{result.items:>8}{result.seconds:>10.2f}{result.items_per_second:>10.1f}"
+              f"{result.requests.get('total', 0):>10}{result.requests.get('rate_limited', 0):>6}"
+              f"{result.wait_time:>9.1f}s{change:>13}")
+
+
+def write_results(results: dict[str, BenchmarkResult], path: str):
+    with open(path, "w") as f:
+        json.dump({name: result.to_dict() for name, result in results.items()}, f, indent=2)
+
+
+def load_results(path: str) -> dict[str, dict]:
+    with open(path, "r") as f:
+        return json.load(f)
@@ -2,7 +2,7 @@ import json
 import threading
 import time
 from queue import Queue
-from typing import List
+from typing import Iterator, List
 from os.path import abspath, join as joinpath
 
 import mysql.connector
@@ -17,15 +17,34 @@ from spotify.models.chapter_model import ChapterModel
 from spotify.models.playlist_model import PlaylistModel
 from spotify.models.track_model import TrackModel
 from spotify.parser import SpotifyParser
-from spotify.util import setup_spotify_folders
-from utility.variables import DATABASE_HOST, DATABASE_USER, DATABASE_PASSWORD, DATABASE_NAME, MUSICBRAINZ_DATA_PATH, SPOTIFY_DATA_PATH
+from spotify.util import open_item_manifest, open_item_store
+from utility.variables import DATABASE_HOST, DATABASE_USER, DATABASE_PASSWORD, DATABASE_NAME, MUSICBRAINZ_DATA_PATH, SPOTIFY_DATA_PATH, \
+    DATABASE_INSERT_QUEUE_SIZE, PARSE_CHUNK_SIZE
+from utility.manifest import ItemManifest
 from tqdm import tqdm
 import os
 import math
 
 class DatabaseInserter:
-    def __init__(self, data_type: str):
+    def __init__(self, data_type: str, changed_only: bool = False, processes: int = 1,
+                 chunk_size: int = PARSE_CHUNK_SIZE, snapshot: bool = False):
+        """
+        Args:
+            data_type (str): Data to insert, one of DATA_CHOICES.
+            changed_only (bool, optional): Only inserts the items added or changed since the previous insert of
+                the data type, see `ItemManifest`. Defaults to False.
+            processes (int, optional): Number of worker processes parsing the items. Defaults to 1.
+            chunk_size (int, optional): Number of items sent to a worker process at a time.
+                Defaults to PARSE_CHUNK_SIZE.
+            snapshot (bool, optional): Reads the parsed items from the snapshot of their endpoint, taken by the
+                first insert step parsing them, see `ParsedSnapshot`. Ignored with changed_only. Defaults to False.
+        """
         self.__data_type = data_type
+        self.__changed_only = changed_only
+        self.__processes = processes
+        self.__chunk_size = chunk_size
+        self.__snapshot = snapshot
+        self.__manifests: List[ItemManifest] = []
         self.__db = mysql.connector.connect(
             host=DATABASE_HOST,
             user=DATABASE_USER,
@@ -73,6 +92,16 @@ class DatabaseInserter:
                 self.__insert_audiobooks_chapters()
             case _:
                 print(f"Error: The function to insert data for {self.__data_type} has not been implemented yet.")
+        # the items are only recorded once they are inserted
+        for manifest in self.__manifests:
+            manifest.commit()
+
+    def __open_manifest(self, endpoint: str) -> ItemManifest | None:
+        if not self.__changed_only:
+            return None
+        manifest = open_item_manifest(endpoint, f"insert_{self.__data_type}")
+        self.__manifests.append(manifest)
+        return manifest
 
     def __insert_genres(self):
         cursor = self.__db.cursor()
@@ -104,8 +133,9 @@ class DatabaseInserter:
         print(f"Successfully inserted {num_genres} albums in {end_time - start_time} seconds")
 
     def __insert_albums(self):
-        parser = SpotifyParser('albums', AlbumModel)
-        albums: List[AlbumModel] = parser.parse_all()
+        parser = SpotifyParser('albums', AlbumModel, processes=self.__processes, chunk_size=self.__chunk_size,
+                               snapshot=self.__snapshot)
+        albums: Iterator[AlbumModel] = parser.iter(manifest=self.__open_manifest('albums'))
         cursor = self.__db.cursor()
 
         start_time = time.time()
@@ -136,8 +166,9 @@ class DatabaseInserter:
         print(f"Successfully inserted {num_albums} albums in {end_time - start_time} seconds")
 
     def __insert_artists(self):
-        parser = SpotifyParser('artists', ArtistModel)
-        artists: List[ArtistModel] = parser.parse_all()
+        parser = SpotifyParser('artists', ArtistModel, processes=self.__processes, chunk_size=self.__chunk_size,
+                               snapshot=self.__snapshot)
+        artists: Iterator[ArtistModel] = parser.iter(manifest=self.__open_manifest('artists'))
         cursor = self.__db.cursor()
 
         start_time = time.time()
@@ -167,11 +198,11 @@ class DatabaseInserter:
         print(f"Successfully inserted {num_artists} artists in {end_time - start_time} seconds")
 
     def __insert_artists_genres(self):
-        parser = SpotifyParser('artists', ArtistModel)
-        artists: List[ArtistModel] = parser.parse_all(
-            middleware=lambda mapped_object, json_data: (
-                setattr(mapped_object, 'genres', json_data.get('genres')) or mapped_object
-            )
+        parser = SpotifyParser('artists', ArtistModel, processes=self.__processes, chunk_size=self.__chunk_size,
+                               snapshot=self.__snapshot)
+        artists: Iterator[ArtistModel] = parser.iter(
+            manifest=self.__open_manifest('artists'),
+            fields=['genres']
         )
         cursor = self.__db.cursor()
         start_time = time.time()
@@ -210,9 +241,8 @@ class DatabaseInserter:
         print(f"Successfully inserted {num_inserts} artists and genres in {end_time - start_time} seconds")
 
     def __insert_aliases(self):
-        data_path, csv_file_path, items_folder_path, mapper_file_path = setup_spotify_folders("aliases", source_data_path=MUSICBRAINZ_DATA_PATH, create_ids_csv=False)
-        artists_spot_id = [f.replace(".json", "") for f in os.listdir(items_folder_path) if
-                           os.path.isfile(os.path.join(items_folder_path, f)) and f.endswith('.json')]
+        aliases_store = open_item_store("aliases", source_data_path=MUSICBRAINZ_DATA_PATH)
+        artists_spot_id = list(aliases_store.ids())
 
         cursor = self.__db.cursor()
         format = ",".join(["%s"]*len(artists_spot_id))
@@ -222,8 +252,7 @@ class DatabaseInserter:
         start_time = time.time()
 
         def get_alias_names(artist_id):
-            with open(os.path.join(items_folder_path, f"{artist_id}.json"), "r") as f:
-                return json.load(f)['aliases']
+            return aliases_store.get(artist_id)['aliases']
         values = []
         for spot_id, artist_id in artists_spot_id:
             for alias_name in get_alias_names(spot_id):
@@ -236,12 +265,11 @@ class DatabaseInserter:
         print(f"Successfully inserted {len(values)} aliases in {end_time - start_time} seconds")
 
     def __insert_chapters_genres(self):
-        parser = SpotifyParser('chapters', ChapterModel)
-        chapters: List[ChapterModel] = parser.parse_all()
-        queue = Queue()
-
-        for chapter in chapters:
-            queue.put(chapter)
+        parser = SpotifyParser('chapters', ChapterModel, processes=self.__processes, chunk_size=self.__chunk_size,
+                               snapshot=self.__snapshot)
+        chapters: Iterator[ChapterModel] = parser.iter(manifest=self.__open_manifest('chapters'))
+        # bounded, the items are parsed as the workers insert them
+        queue = Queue(maxsize=DATABASE_INSERT_QUEUE_SIZE)
 
         def worker():
             db = mysql.connector.connect(
@@ -252,8 +280,11 @@ class DatabaseInserter:
             )
             cursor = db.cursor()
 
-            while not queue.empty():
+            while True:
                 chapter = queue.get()
+                if chapter is None:
+                    queue.task_done()
+                    break
                 try:
                     check_query = "SELECT EXISTS(SELECT 1 FROM Chapter WHERE spotify_id = %s)"
                     cursor.execute(check_query, (chapter.spotify_id,))
@@ -285,6 +316,14 @@ class DatabaseInserter:
             thread.start()
             threads.append(thread)
 
+        try:
+            for chapter in chapters:
+                queue.put(chapter)
+        finally:
+            # one end marker per worker, also when parsing fails so the workers stop and the error is raised
+            for thread in threads:
+                queue.put(None)
+
         # Wait for all tasks in the queue to be processed
         queue.join()
 
@@ -302,12 +341,11 @@ class DatabaseInserter:
         print(f"Finished inserting chapters in {end_time - start_time} seconds")
 
     def __insert_playlists(self):
-        parser = SpotifyParser('playlists', PlaylistModel)
-        playlists: List[PlaylistModel] = parser.parse_all()
-        queue = Queue()
-
-        for playlist in playlists:
-            queue.put(playlist)
+        parser = SpotifyParser('playlists', PlaylistModel, processes=self.__processes, chunk_size=self.__chunk_size,
+                               snapshot=self.__snapshot)
+        playlists: Iterator[PlaylistModel] = parser.iter(manifest=self.__open_manifest('playlists'))
+        # bounded, the items are parsed as the workers insert them
+        queue = Queue(maxsize=DATABASE_INSERT_QUEUE_SIZE)
 
         def worker():
             db = mysql.connector.connect(
@@ -318,8 +356,11 @@ class DatabaseInserter:
             )
             cursor = db.cursor()
 
-            while not queue.empty():
+            while True:
                 playlist: PlaylistModel = queue.get()
+                if playlist is None:
+                    queue.task_done()
+                    break
                 try:
                     check_query = "SELECT EXISTS(SELECT 1 FROM Playlist WHERE spotify_id = %s)"
                     cursor.execute(check_query, (playlist.spotify_id,))
@@ -347,6 +388,14 @@ class DatabaseInserter:
             thread.start()
             threads.append(thread)
 
+        try:
+            for playlist in playlists:
+                queue.put(playlist)
+        finally:
+            # one end marker per worker, also when parsing fails so the workers stop and the error is raised
+            for thread in threads:
+                queue.put(None)
+
         queue.join()
 
         for thread in threads:
@@ -363,61 +412,30 @@ class DatabaseInserter:
 
     def __insert_tracks(self):
         start_time = time.time()
-        parser = SpotifyParser('tracks', TrackModel)
-        tracks: List[TrackModel] = parser.parse_all()
-        q = Queue()
-        tracks_to_insert = Queue()
+        parser = SpotifyParser('tracks', TrackModel, processes=self.__processes, chunk_size=self.__chunk_size,
+                               snapshot=self.__snapshot)
         batch_count = 10000
-        for track in tracks:
-            q.put(track)
-        
-        del tracks
-        
-        def get_items(q:Queue, count):
-            items = []
-            for _ in range(count):
-                if (q.empty()):
-                    break
-                items.append(q.get())
-            return items
-        
-        check_query = f"SELECT spotify_id from Audio where spotify_id in ({",".join((["%s"]*batch_count))})"
-        print("Remove all spotify ids to remove...")
-        while(not q.empty()):
-            items = get_items(q, batch_count)    
-            if len(items) != batch_count:
-                query = f"SELECT spotify_id from Audio where spotify_id in ({",".join((["%s"]*len(items)))})"
-            else:
-                query = check_query
-            tracks_ids = map(lambda t: t.spotify_id, items)
-            cursor = self.__db.cursor()
-            cursor.execute(query, list(tracks_ids))
-            existing_ids = set(cursor.fetchall())
-            filtered_tracks = filter(lambda track: track.spotify_id not in existing_ids, items)
-            for t in filtered_tracks:
-                tracks_to_insert.put(t)
-        
-        print("Insert new tracks to tables ...")
+        # the tracks are parsed, filtered and inserted one batch at a time
+        batches: Iterator[List[TrackModel]] = parser.iter_batches(batch_count, manifest=self.__open_manifest('tracks'))
+
         insert_audio_stmt = """INSERT INTO Audio (spotify_id, audio_name, uri, href, external_url, explicit) VALUES (%s, %s, %s, %s, %s, %s)"""
         insert_track_stmt = """INSERT INTO Track (track_id, popularity, type, duration_ms, preview_url, disc_number) VALUES (%s, %s, %s, %s, %s, %s)"""
-        select_id_query =f"SELECT spotify_id, audio_id FROM Audio where spotify_id in ({",".join(["%s"]*batch_count)})"
-        while(not tracks_to_insert.empty()):
-            items: List[TrackModel] = get_items(tracks_to_insert, batch_count)
-            audio_tuples = map(lambda t: (t.spotify_id, t.audio_name, t.uri, t.href, t.external_url,t.explicit), items)
+        print("Insert new tracks to tables ...")
+        for items in batches:
             cursor = self.__db.cursor()
-            stmt_tuples = list(audio_tuples)
+            query = f"SELECT spotify_id from Audio where spotify_id in ({",".join(["%s"]*len(items))})"
+            cursor.execute(query, [t.spotify_id for t in items])
+            existing_ids = {spotify_id for spotify_id, in cursor.fetchall()}
+            items = [track for track in items if track.spotify_id not in existing_ids]
+            if not items:
+                continue
+            stmt_tuples = [(t.spotify_id, t.audio_name, t.uri, t.href, t.external_url, t.explicit) for t in items]
             cursor.executemany(insert_audio_stmt, stmt_tuples)
-            ids = map(lambda t: t[0], stmt_tuples)
-            if (len(items) != batch_count):
-                query = f"SELECT spotify_id, audio_id FROM Audio where spotify_id in ({",".join(["%s"]*len(items))})"
-            else:
-                query = select_id_query
-            cursor.execute(query, list(ids))
-            spot_audio_id = cursor.fetchall()
-            audio_spot_id = {spot_id: audio_id for spot_id, audio_id in spot_audio_id}
+            query = f"SELECT spotify_id, audio_id FROM Audio where spotify_id in ({",".join(["%s"]*len(items))})"
+            cursor.execute(query, [t[0] for t in stmt_tuples])
+            audio_spot_id = {spot_id: audio_id for spot_id, audio_id in cursor.fetchall()}
             records = map(lambda t: (audio_spot_id[t.spotify_id], t.popularity, t.type, t.duration_ms, t.preview_url, t.disc_number), items)
             cursor.executemany(insert_track_stmt, list(records))
-        
 
         count_query = "SELECT COUNT(*) FROM Track"
         cursor = self.__db.cursor()
@@ -428,12 +446,11 @@ class DatabaseInserter:
         print(f"Finished inserting tracks in {end_time - start_time} seconds")
 
     def __insert_audiobooks(self):
-        parser = SpotifyParser('audiobooks', AudiobookModel)
-        audiobooks: List[AudiobookModel] = parser.parse_all()
-        queue = Queue()
-
-        for audiobook in audiobooks:
-            queue.put(audiobook)
+        parser = SpotifyParser('audiobooks', AudiobookModel, processes=self.__processes, chunk_size=self.__chunk_size,
+                               snapshot=self.__snapshot)
+        audiobooks: Iterator[AudiobookModel] = parser.iter(manifest=self.__open_manifest('audiobooks'))
+        # bounded, the items are parsed as the workers insert them
+        queue = Queue(maxsize=DATABASE_INSERT_QUEUE_SIZE)
 
         def worker():
             db = mysql.connector.connect(
@@ -444,8 +461,11 @@ class DatabaseInserter:
             )
             cursor = db.cursor()
 
-            while not queue.empty():
+            while True:
                 audiobook: AudiobookModel = queue.get()
+                if audiobook is None:
+                    queue.task_done()
+                    break
                 try:
                     check_query = "SELECT EXISTS(SELECT 1 FROM Audio WHERE spotify_id = %s)"
                     cursor.execute(check_query, (audiobook.spotify_id,))
@@ -488,6 +508,14 @@ class DatabaseInserter:
             thread.start()
             threads.append(thread)
 
+        try:
+            for audiobook in audiobooks:
+                queue.put(audiobook)
+        finally:
+            # one end marker per worker, also when parsing fails so the workers stop and the error is raised
+            for thread in threads:
+                queue.put(None)
+
         queue.join()
 
         for thread in threads:
@@ -503,11 +531,11 @@ class DatabaseInserter:
         print(f"Finished inserting audiobooks in {end_time - start_time} seconds")
 
     def __insert_tracks_artists(self):
-        parser = SpotifyParser('tracks', TrackModel)
-        tracks: List[TrackModel] = parser.parse_all(
-            middleware=lambda mapped_object, json_data: (
-                setattr(mapped_object, 'artists', json_data.get('artists')) or mapped_object
-            )
+        parser = SpotifyParser('tracks', TrackModel, processes=self.__processes, chunk_size=self.__chunk_size,
+                               snapshot=self.__snapshot)
+        tracks: Iterator[TrackModel] = parser.iter(
+            manifest=self.__open_manifest('tracks'),
+            fields=['artists']
         )
 
         # Use buffered cursor to avoid "Unread result found" error
@@ -548,11 +576,11 @@ class DatabaseInserter:
         print(f"Successfully inserted {num_inserts} track-artist relationships in {end_time - start_time} seconds")
 
     def __insert_tracks_albums(self):
-        parser = SpotifyParser('tracks', TrackModel)
-        tracks: List[TrackModel] = parser.parse_all(
-            middleware=lambda mapped_object, json_data: (
-                setattr(mapped_object, 'album', json_data.get('album')) or mapped_object
-            )
+        parser = SpotifyParser('tracks', TrackModel, processes=self.__processes, chunk_size=self.__chunk_size,
+                               snapshot=self.__snapshot)
+        tracks: Iterator[TrackModel] = parser.iter(
+            manifest=self.__open_manifest('tracks'),
+            fields=['album']
         )
 
         # Use buffered cursor to avoid "Unread result found" error
@@ -597,11 +625,11 @@ class DatabaseInserter:
         print(f"Successfully inserted {num_inserts} track-album relationships in {end_time - start_time} seconds")
 
     def __insert_available_markets_albums(self):
-        parser = SpotifyParser('albums', AlbumModel)
-        albums: List[AlbumModel] = parser.parse_all(
-            middleware=lambda mapped_object, json_data: (
-                setattr(mapped_object, 'available_markets', json_data.get('available_markets')) or mapped_object
-            )
+        parser = SpotifyParser('albums', AlbumModel, processes=self.__processes, chunk_size=self.__chunk_size,
+                               snapshot=self.__snapshot)
+        albums: Iterator[AlbumModel] = parser.iter(
+            manifest=self.__open_manifest('albums'),
+            fields=['available_markets']
         )
 
         # Use buffered cursor to avoid "Unread result found" error
@@ -644,11 +672,11 @@ class DatabaseInserter:
         print(f"Successfully inserted {num_inserts} market-album relationships in {end_time - start_time} seconds")
 
     def __insert_available_markets_tracks(self):
-        parser = SpotifyParser('tracks', TrackModel)
-        tracks: List[TrackModel] = parser.parse_all(
-            middleware=lambda mapped_object, json_data: (
-                setattr(mapped_object, 'available_markets', json_data.get('available_markets')) or mapped_object
-            )
+        parser = SpotifyParser('tracks', TrackModel, processes=self.__processes, chunk_size=self.__chunk_size,
+                               snapshot=self.__snapshot)
+        tracks: Iterator[TrackModel] = parser.iter(
+            manifest=self.__open_manifest('tracks'),
+            fields=['available_markets']
         )
 
         # Use buffered cursor to avoid "Unread result found" error
@@ -697,11 +725,11 @@ class DatabaseInserter:
         print(f"Successfully inserted {num_inserts} market-track relationships in {end_time - start_time} seconds")
 
     def __insert_playlists_tracks(self):
-        parser = SpotifyParser('playlists', PlaylistModel)
-        playlists: List[PlaylistModel] = parser.parse_all(
-            middleware=lambda mapped_object, json_data: (
-                setattr(mapped_object, 'tracks', json_data.get('tracks')) or mapped_object
-            )
+        parser = SpotifyParser('playlists', PlaylistModel, processes=self.__processes, chunk_size=self.__chunk_size,
+                               snapshot=self.__snapshot)
+        playlists: Iterator[PlaylistModel] = parser.iter(
+            manifest=self.__open_manifest('playlists'),
+            fields=['tracks']
         )
 
         # Use buffered cursor to avoid "Unread result found" error
@@ -749,8 +777,9 @@ class DatabaseInserter:
         print(f"Successfully inserted {num_inserts} market-track relationships in {end_time - start_time} seconds")
 
     def __insert_audiobooks_authors(self):
-        parser = SpotifyParser('authors', AuthorModel)
-        audiobooks: List[AuthorModel] = parser.parse_all()
+        parser = SpotifyParser('authors', AuthorModel, processes=self.__processes, chunk_size=self.__chunk_size,
+                               snapshot=self.__snapshot)
+        audiobooks: Iterator[AuthorModel] = parser.iter(manifest=self.__open_manifest('authors'))
 
         cursor = self.__db.cursor(buffered=True)
         start_time = time.time()
@@ -795,8 +824,9 @@ class DatabaseInserter:
         print(f"Successfully inserted {num_inserts} audiobook-author relationships in {end_time - start_time} seconds")
 
     def __insert_authors(self):
-        parser = SpotifyParser('authors', AuthorModel)
-        audiobooks: List[AuthorModel] = parser.parse_all()
+        parser = SpotifyParser('authors', AuthorModel, processes=self.__processes, chunk_size=self.__chunk_size,
+                               snapshot=self.__snapshot)
+        audiobooks: Iterator[AuthorModel] = parser.iter(manifest=self.__open_manifest('authors'))
 
         cursor = self.__db.cursor(buffered=True)
 
@@ -813,11 +843,11 @@ class DatabaseInserter:
                 #     print(f"Author already exists: {author['name']}")
 
     def __insert_audiobooks_chapters(self):
-        parser = SpotifyParser('audiobooks', AudiobookModel)
-        audiobooks: List[AudiobookModel] = parser.parse_all(
-            middleware=lambda mapped_object, json_data: (
-                setattr(mapped_object, 'chapters', json_data.get('chapters')) or mapped_object
-            )
+        parser = SpotifyParser('audiobooks', AudiobookModel, processes=self.__processes, chunk_size=self.__chunk_size,
+                               snapshot=self.__snapshot)
+        audiobooks: Iterator[AudiobookModel] = parser.iter(
+            manifest=self.__open_manifest('audiobooks'),
+            fields=['chapters']
         )
 
         cursor = self.__db.cursor(buffered=True)
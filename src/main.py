@@ -3,38 +3,153 @@ from utility import variables as var
 from database.inserter import DatabaseInserter
 from musicbrainz.loader import AliasLoader
 from spotify import loader, scraper
+from spotify.async_scraper import AsyncSpotifyScraper
+from spotify.crawler import GraphCrawler
+from spotify.paginator import expand_stored_items
+from spotify.scheduler import ScrapeScheduler
+from spotify.search_enumerator import SearchEnumerator, generate_shards
+from spotify.util import list_stored_ids, migrate_items_to_packed, open_id_registry, setup_spotify_folders
+from musicbrainz.util import open_musicbrainz_registry, setup_musicbrainz_folders
 from argparse import ArgumentParser
+from datetime import datetime
 
-from utility.auth_token import SPOTIFY_AUTH_TOKEN
-from utility.variables import DATA_CHOICES
+from utility.metrics import SCRAPE_METRICS
+from utility.token_pool import SPOTIFY_AUTH_TOKEN
+from utility.retry_queue import RetryQueue
+from utility.variables import DATA_CHOICES, MUSICBRAINZ_DATA_PATH, PARSE_CHUNK_SIZE, SCRAPE_LEASE_DURATION, SPOTIFY_CRAWL_MAX_DEPTH, \
+    SPOTIFY_PAGINATED_FIELDS, SPOTIFY_REVALIDATED_ENDPOINTS, SPOTIFY_SCRAPE_ENDPOINTS, SPOTIFY_SEARCH_TYPES, SPOTIFY_STORE_ENDPOINTS
+
+
+def create_scraper(endpoint: str, concurrency: int, leased: bool = False):
+    # use the concurrent engine only when more than one request can be in flight
+    if concurrency > 1:
+        return AsyncSpotifyScraper(endpoint, concurrency=concurrency, leased=leased)
+    return scraper.SpotifyScraper(endpoint, leased=leased)
+
+
+def import_ids_csv():
+    for endpoint in SPOTIFY_SCRAPE_ENDPOINTS:
+        _, csv_file_path, _, _ = setup_spotify_folders(endpoint)
+        added = open_id_registry(endpoint).import_csv(csv_file_path, cached_ids=list_stored_ids(endpoint))
+        print(f"Imported {added} new {endpoint} ids from {csv_file_path}")
+
+
+def export_ids_csv():
+    for endpoint in SPOTIFY_SCRAPE_ENDPOINTS:
+        _, csv_file_path, _, _ = setup_spotify_folders(endpoint)
+        open_id_registry(endpoint).export_csv(csv_file_path)
+        print(f"Exported {endpoint} registry to {csv_file_path}")
+    _, csv_file_path, _ = setup_musicbrainz_folders("aliases")
+    open_musicbrainz_registry("aliases").export_csv(csv_file_path, include_names=True)
+    print(f"Exported aliases registry to {csv_file_path}")
+
+
+def open_all_registries():
+    registries = {endpoint: open_id_registry(endpoint) for endpoint in SPOTIFY_SCRAPE_ENDPOINTS}
+    registries["aliases"] = open_musicbrainz_registry("aliases")
+    return registries
+
+
+def list_dead_letters():
+    for endpoint, registry in open_all_registries().items():
+        for id, attempts, last_attempt, error in RetryQueue(registry).dead_letters():
+            last_attempt = datetime.fromtimestamp(last_attempt).isoformat() if last_attempt else None
+            print(f"{endpoint},{id},{attempts},{last_attempt},{error}")
+
+
+def requeue_dead_letters():
+    for endpoint, registry in open_all_registries().items():
+        requeued = RetryQueue(registry).requeue_dead_letters()
+        print(f"Requeued {requeued} dead-letter {endpoint} ids")
+
+
+def migrate_to_packed(choice: str):
+    endpoints = SPOTIFY_STORE_ENDPOINTS if choice == "all" else [choice]
+    for endpoint in endpoints:
+        if endpoint == "aliases":
+            continue
+        migrated = migrate_items_to_packed(endpoint)
+        print(f"Migrated {migrated} {endpoint} items to the packed store")
+    if choice in ("all", "aliases"):
+        migrated = migrate_items_to_packed("aliases", source_data_path=MUSICBRAINZ_DATA_PATH)
+        print(f"Migrated {migrated} aliases items to the packed store")
+
+
+def expand_pages(choice: str):
+    endpoints = list(SPOTIFY_PAGINATED_FIELDS) if choice == "all" else [choice]
+    for endpoint in endpoints:
+        expanded = expand_stored_items(endpoint)
+        print(f"Expanded the pages of {expanded} {endpoint} items")
+
+
+def crawl(max_depth: int):
+    discovered = GraphCrawler(max_depth=max_depth).crawl()
+    for endpoint, count in discovered.items():
+        print(f"Discovered {count} new {endpoint} ids")
+
+
+def search_enumerate(choice: str, concurrency: int, prefix_length: int):
+    types = list(SPOTIFY_SEARCH_TYPES) if choice == "all" else \
+        [type for type, endpoint in SPOTIFY_SEARCH_TYPES.items() if endpoint == choice]
+    new_ids = SearchEnumerator(concurrency=concurrency).enumerate(generate_shards(types, prefix_length=prefix_length))
+    for endpoint, count in new_ids.items():
+        print(f"Added {count} new {endpoint} ids from the search api")
+
+
+def schedule(concurrency: int, crawl_depth: int | None, leased: bool):
+    counts = ScrapeScheduler(concurrency=concurrency, crawl_depth=crawl_depth, leased=leased).run()
+    for endpoint, endpoint_counts in counts.items():
+        print(f"Scraped {endpoint_counts['cached']} {endpoint} items")
+
+
+def refresh(choice: str):
+    endpoints = SPOTIFY_REVALIDATED_ENDPOINTS if choice == "all" else [choice]
+    for endpoint in endpoints:
+        requeued = open_id_registry(endpoint).requeue_cached()
+        print(f"Requeued {requeued} cached {endpoint} ids, unchanged items are skipped by the next scrape")
 
 
 def main(args):
     # SPOTIFY_AUTH_TOKEN.get_authorization()
+    if args.migrate_to_packed:
+        migrate_to_packed(args.migrate_to_packed)
+    if args.import_ids_csv:
+        import_ids_csv()
+    if args.refresh:
+        refresh(args.refresh)
     if args.scrape_playlists:
         # spotify doesn't scrape playlists with batchmode
-        playlists_scraper = scraper.SpotifyScraper("playlists")
+        playlists_scraper = create_scraper("playlists", args.concurrency, args.lease)
         playlists_scraper.scrape_items()
         pass
+    if args.expand_pages:
+        expand_pages(args.expand_pages)
     if args.load_info_from_playlists:
-        loader.load_info_from_playlists()
+        loader.load_info_from_playlists(harvest=args.harvest_tracks, processes=args.processes)
+    if args.search_enumerate:
+        search_enumerate(args.search_enumerate, args.concurrency, args.search_prefix_length)
+    if args.schedule:
+        # the scheduler crawls the scraped entities as it goes
+        schedule(args.concurrency, args.crawl, args.lease)
+    elif args.crawl is not None:
+        crawl(args.crawl)
     if args.scrape_tracks:
         # 45 tracks per batch
-        tracks_scraper = scraper.SpotifyScraper("tracks")
+        tracks_scraper = create_scraper("tracks", args.concurrency, args.lease)
         tracks_scraper.scrape_items(batchmode=50)
     if args.scrape_artists:
         # 45 tracks per batch
-        artists_scraper = scraper.SpotifyScraper("artists")
+        artists_scraper = create_scraper("artists", args.concurrency, args.lease)
         artists_scraper.scrape_items(batchmode=45)
     if args.scrape_albums:
         # 20 tracks per batch
-        albums_scraper = scraper.SpotifyScraper("albums")
+        albums_scraper = create_scraper("albums", args.concurrency, args.lease)
         albums_scraper.scrape_items(batchmode=20)
     if args.scrape_audiobooks:
-        audiobooks_scraper = scraper.SpotifyScraper("audiobooks")
+        audiobooks_scraper = create_scraper("audiobooks", args.concurrency, args.lease)
         audiobooks_scraper.scrape_items(batchmode=45)
     if args.load_genres:
-        loader.load_genres()
+        loader.load_genres(processes=args.processes, rebuild=args.full_rebuild)
     if args.generate_artist_ids:
         artists_generate = scraper.SpotifyScraper("artists")
         artists_generate.generate_artists_ids()
@@ -43,23 +158,34 @@ def main(args):
         playlists_generate.generate_playlist_ids()
     if args.load_musicbrainz_ids:
         loader_musicbrainz = AliasLoader("aliases")
-        loader_musicbrainz.write_artist_data_to_csv()
+        loader_musicbrainz.write_artist_data_to_csv(rebuild=args.full_rebuild)
     if args.generate_musicbrainz_aliases_json:
         generate_musicbrainz = AliasLoader("aliases")
         generate_musicbrainz.load_aliases_items()
     if args.load_authors_from_audiobooks:
-        loader.load_authors_from_audiobooks()
+        loader.load_authors_from_audiobooks(rebuild=args.full_rebuild)
     if args.load_chapters_from_audiobooks:
-        loader.load_chapters_from_audiobooks()
+        loader.load_chapters_from_audiobooks(rebuild=args.full_rebuild)
     if args.db_to_csv:
         dump_to_csv.convert_tables_to_csv()
+    if args.export_ids_csv:
+        export_ids_csv()
+    if args.list_dead_letters:
+        list_dead_letters()
+    if args.requeue_dead_letters:
+        requeue_dead_letters()
+    if SCRAPE_METRICS.has_data():
+        # the metrics file is also flushed periodically while the scrapes run
+        SCRAPE_METRICS.flush()
+        print(SCRAPE_METRICS.summary())
 
 
 def insert_to_database(args):
     if args.list:
         print(DATA_CHOICES)
     if args.data_type:
-        inserter = DatabaseInserter(data_type=args.data_type)
+        inserter = DatabaseInserter(data_type=args.data_type, changed_only=args.changed_only, processes=args.processes,
+                                    chunk_size=args.chunk_size, snapshot=args.snapshot)
         inserter.insert_data()
 
 
@@ -70,8 +196,11 @@ if __name__ == '__main__':
     parser.add_argument('-a', '--scrape-artists', help=f'Scrapes artists defined in csv file', action='store_true')
     parser.add_argument('-u', '--scrape-albums', help=f'Scrapes albums defined in csv file', action='store_true')
     parser.add_argument('-b', '--scrape-audiobooks', help=f'Scrapes audiobooks defined in csv file', action='store_true')
-    parser.add_argument('-l', '--load-info-from-playlists', help=f'Loads information from playlists into other entities\'s csv', action='store_true')
+    parser.add_argument('-l', '--load-info-from-playlists', help=f'Loads information from playlists into the id registries of the other entities, -x also exports them to their csv', action='store_true')
+    parser.add_argument('-hv', '--harvest-tracks', help=f'With -l, stores the complete tracks of the playlists instead of queueing them to be scraped', action='store_true')
+    parser.add_argument('-pr', '--processes', help=f'With -l or -g, number of processes decoding the playlists, artists and albums in parallel, 1 decodes them in the main process', type=int, default=1)
     parser.add_argument('-g', '--load-genres', help=f'Loads all genres from albums and playlists into a csv file', action='store_true')
+    parser.add_argument('-fr', '--full-rebuild', help=f'With -g, -m, -o or -c, reads every item again instead of the items added or changed since the previous run', action='store_true')
     parser.add_argument('-k', '--load-artists-from-tracks', help=f'Loads artists from tracks', action='store_true')
     parser.add_argument('-al', '--generate-artist-ids', help=f'Populates `ids.csv` of artists/ with list of ids', action='store_true')
     parser.add_argument('-pl', '--generate-playlist-ids', help=f'Populates `ids.csv` of playlists/ with list of playlists based on the Spotify Featured Playlists', action='store_true')
@@ -79,11 +208,28 @@ if __name__ == '__main__':
     parser.add_argument('-ml', '--generate-musicbrainz-aliases-json', help=f'Fetch MusicBrainz API for every artist name', action='store_true')
     parser.add_argument('-o', '--load-authors-from-audiobooks', help=f'Loads authors from audiobooks', action='store_true')
     parser.add_argument('-c', '--load-chapters-from-audiobooks', help=f'Loads chapters from audiobooks', action='store_true')
+    parser.add_argument('-n', '--concurrency', help=f'Number of concurrent requests used when scraping, 1 scrapes sequentially', type=int, default=1)
+    parser.add_argument('-i', '--import-ids-csv', help=f'Merges the ids added to each `ids.csv` into the id registries', action='store_true')
+    parser.add_argument('-x', '--export-ids-csv', help=f'Exports the id registries to `ids.csv` and `artist_names.csv`', action='store_true')
+    parser.add_argument('-dl', '--list-dead-letters', help=f'Prints the ids that failed too many times or with a permanent error', action='store_true')
+    parser.add_argument('-rl', '--requeue-dead-letters', help=f'Puts the dead-letter ids back in the scrape queue', action='store_true')
+    parser.add_argument('-mp', '--migrate-to-packed', help=f'Copies the `items/` folder of an endpoint into a packed item store', choices=SPOTIFY_STORE_ENDPOINTS + ['aliases', 'all'])
+    parser.add_argument('-ep', '--expand-pages', help=f'Fetches the missing pages of the tracks or chapters of the stored items', choices=list(SPOTIFY_PAGINATED_FIELDS) + ['all'])
+    parser.add_argument('-cr', '--crawl', help=f'Adds the ids referenced by the scraped playlists, albums and artists to the registries, up to a crawl depth (default {SPOTIFY_CRAWL_MAX_DEPTH})', type=int, nargs='?', const=SPOTIFY_CRAWL_MAX_DEPTH)
+    parser.add_argument('-se', '--search-enumerate', help=f'Seeds the registries with the ids found by sharded search queries', choices=list(SPOTIFY_SEARCH_TYPES.values()) + ['all'])
+    parser.add_argument('-sp', '--search-prefix-length', help=f'Length of the prefix queries of the search shards', type=int, default=1)
+    parser.add_argument('-sc', '--schedule', help=f'Scrapes every endpoint and the MusicBrainz aliases at once, in dependency order, crawling new ids up to the depth of -cr', action='store_true')
+    parser.add_argument('-ls', '--lease', help=f'Leases the pending ids for {SCRAPE_LEASE_DURATION} seconds at a time, so several scrape processes or machines share the registries', action='store_true')
+    parser.add_argument('-rf', '--refresh', help=f'Requeues the cached ids of an endpoint scraped one id at a time so the next scrape refreshes the items that changed, the batch endpoints cannot be revalidated', choices=SPOTIFY_REVALIDATED_ENDPOINTS + ['all'])
     parser.add_argument('-s', '--db-to-csv', help=f'Converts the database to csv files', action='store_true')
     subparsers = parser.add_subparsers(dest='command', help='Sub-command help')
     insert_parser = subparsers.add_parser('insert-to-database', help='Insert data to the database')
     insert_parser.add_argument('-l', '--list', help='Show the list of possible data choices', action='store_true')
     insert_parser.add_argument('-d', '--data-type', choices=DATA_CHOICES, help='Specify the type of data to insert')
+    insert_parser.add_argument('-ch', '--changed-only', help='Only inserts the items added or changed since the previous insert of the data type', action='store_true')
+    insert_parser.add_argument('-w', '--processes', help='Number of processes parsing the items, 1 parses them in the main process', type=int, default=1)
+    insert_parser.add_argument('-cs', '--chunk-size', help='Number of items sent to a parsing process at a time', type=int, default=PARSE_CHUNK_SIZE)
+    insert_parser.add_argument('-sn', '--snapshot', help='Reads the parsed items from a snapshot of their endpoint, taken again when the items change', action='store_true')
     insert_parser.set_defaults(func=insert_to_database)
 
     # Run below if token expires at root dir through src/main_spotify_scraper.py
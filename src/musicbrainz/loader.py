@@ -6,9 +6,16 @@ import requests
 import os
 from os.path import join as joinpath, abspath
 
-from musicbrainz.util import setup_musicbrainz_folders
+from musicbrainz.util import open_musicbrainz_item_store, open_musicbrainz_registry, setup_musicbrainz_folders
+from spotify.util import open_item_manifest, open_item_store
+from utility.manifest import ItemManifest
+from utility.json_decoder import json_loads
+from utility.metrics import SCRAPE_METRICS
+from utility.rate_limiter import MUSICBRAINZ_RATE_LIMITER
+from utility.retry_queue import RetryQueue
 from utility.utility import is_success_code, send_request_with_wait
-from utility.variables import MUSICBRAINZ_ARTISTS_DATA_ITEMS, MUSICBRAINZ_DATA_PATH, MUSICBRAINZ_ITEMS_CSV_NAME
+from utility.variables import MUSICBRAINZ_ARTISTS_DATA_ITEMS, MUSICBRAINZ_DATA_PATH, MUSICBRAINZ_ITEMS_CSV_NAME, \
+    MUSICBRAINZ_WS_URL
 
 class AliasLoader:
 
@@ -17,44 +24,57 @@ class AliasLoader:
         self.__artists_items_path = MUSICBRAINZ_ARTISTS_DATA_ITEMS
         self.__csv_file_path_test = abspath(joinpath(MUSICBRAINZ_DATA_PATH, f"{endpoint}/artist_names_test.csv"))
         self.__data_path, self.__csv_file_path, self.__items_folder_path = setup_musicbrainz_folders(endpoint)
+        self.__registry = open_musicbrainz_registry(endpoint)
+        self.__retry_queue = RetryQueue(self.__registry)
+        self.__store = open_musicbrainz_item_store(endpoint)
 
 
     # --------------------- LOAD ARTIST NAMES + IDS TO artist_names.csv -------------
 
-    def get_artist_data_from_json(self):
-        # List to store the paths of JSON files
-        
-        artist_data = pd.DataFrame({"ID": [], "Name": []})
-        print(artist_data.to_string())
-
-        # Iterate through all files in the folder
-        for root, dirs, files in os.walk(self.__artists_items_path):
-            for file in files:
-                # Check if the file has a .json extension
-                if file.endswith('.json'):
-                    # Construct the full path to the JSON file
-                    json_file_path = os.path.join(root, file)
-                    with open(json_file_path, 'r') as f:
-                        # Load JSON content
-                        content = json.load(f)
-                        # Append JSON content to the list
-                        print((content["id"], content["name"]))
-                        artist_data.loc[len(artist_data)] = (content["id"], content["name"])
-
-        return artist_data
-    
-    def write_artist_data_to_csv(self):
+    def get_artist_data_from_json(self, manifest: ItemManifest | None = None):
+        """
+        Get the ids and names of the scraped Spotify artists.
+
+        Args:
+        - manifest (ItemManifest, optional): Only reads the artists changed since the last commit of the manifest.
+
+        Returns:
+        - pd.DataFrame: ID and Name of the artists.
+        """
+        rows = []
+        artists_store = open_item_store('artists')
+        # Iterate through all the scraped spotify artists
+        items = manifest.changed(artists_store) if manifest is not None else artists_store.items_bytes()
+        for _, data in items:
+            content = json_loads(data)
+            print((content["id"], content["name"]))
+            rows.append((content["id"], content["name"]))
+
+        return pd.DataFrame(rows, columns=["ID", "Name"])
+
+    def write_artist_data_to_csv(self, rebuild: bool = False):
+        """
+        Adds the names of the Spotify artists scraped or changed since the previous run to the registry,
+        and exports it to the csv file.
+
+        Args:
+        - rebuild (bool): Reads every artist again.
+        """
         print(f"Retrieving artist names from  '{self.__items_folder_path}' ...")
-        artist_data = self.get_artist_data_from_json()
+        manifest = open_item_manifest('artists', 'musicbrainz_names')
+        if rebuild:
+            manifest.reset()
+        artist_data = self.get_artist_data_from_json(manifest)
+
+        print("Adding artist names to the registry ...")
+        self.__registry.add_named_ids(zip(artist_data["ID"], artist_data["Name"]))
+        manifest.commit()
 
         # Write artist names to CSV file
         csv_file_path = os.path.join(self.__csv_file_path)
 
         print(f"Writing artist names to '{csv_file_path}' ...")
-        artist_data.to_csv(csv_file_path, index=False)
-
-        # df2 = pd.read_csv(csv_file_path)
-        # print(df2["Names"].to_list())
+        self.__registry.export_csv(csv_file_path, include_names=True)
 
     # ------------------ GENERATE JSON FILES USING artist_names.csv ----------------    
         
@@ -69,7 +89,7 @@ class AliasLoader:
         - dict: Artist information retrieved from the MusicBrainz API.
         """
         # MusicBrainz API endpoint
-        url = f"https://musicbrainz.org/ws/2/artist"
+        url = f"{MUSICBRAINZ_WS_URL}/artist"
         # Parameters for the request
         params = {
             "query": artist_name,
@@ -81,57 +101,68 @@ class AliasLoader:
         return requests.get(url, params=params)
 
     def load_aliases_items(self):
-
-        current_path = self.__csv_file_path
         print(f'SCRAPING {self.__endpoint.upper()}')
-        # read csv file
-        df = self.__update_df_with_fs(current_path)
-        # get all uncached items
-        uncached_items_df = df[df['CACHED'] == False]
-        error_request = set()
-        for _, row in uncached_items_df.iterrows():
-            id = row['ID']
-            name = row['Name']
-            item_file_path = joinpath(self.__items_folder_path, f"{id}.json")
-
-            # if we exceed time limit, re scrape after time sleep
-            res = self.get_artist_info(name)
+        SCRAPE_METRICS.track_backlog(self.__endpoint, self.__registry.count_backlog)
+        retried, dead = 0, 0
+        # get all uncached items, interleaved with the failed ones whose retry is due
+        for (id,) in self.__retry_queue.iter_work(1):
+            _, counts = self.scrape_work([id])
+            retried, dead = retried + counts[0], dead + counts[1]
+
+        print(f"\nScraping complete, {retried} ids scheduled for a retry, {dead} ids moved to the dead letters.")
+        print(MUSICBRAINZ_RATE_LIMITER.summary())
+
+    def add_artists(self, artists) -> int:
+        """Queues the aliases of scraped Spotify artists.
+
+        Args:
+        - artists (Iterable[dict]): Spotify artist items.
+
+        Returns:
+        - int: Number of artists added to the registry.
+        """
+        return self.__registry.add_named_ids((artist["id"], artist["name"]) for artist in artists)
+
+    def scrape_work(self, ids):
+        """
+        Scrape the aliases of the given artist ids, and record the state of every id in the registry.
+
+        Args:
+        - ids (list[str]): Spotify ids of the artists.
+
+        Returns:
+        - tuple[list[str], tuple[int, int]]: Cached ids, and the number of ids scheduled for a retry and moved
+          to the dead letters.
+        """
+        cached_ids, retried, dead = [], 0, 0
+        for id in ids:
+            name = self.__registry.get_name(id)
+
+            # wait for the shared rate limiter, if we exceed time limit, re scrape after time sleep
+            try:
+                res = send_request_with_wait(self.get_artist_info, name, rate_limiter=MUSICBRAINZ_RATE_LIMITER,
+                                             endpoint=self.__endpoint)
+            except requests.RequestException as e:
+                print(f"Request error while fetching {id}: {e}")
+                retried += self.__retry_queue.record_failure([id], str(e))[0]
+                continue
 
             # check if we still have a success code
             if not is_success_code(res.status_code):
-                error_request.add(id)
-                print(f"Status error code while fetching {id}: {res.status_code}\n{res.json()}")
+                print(f"Status error code while fetching {id}: {res.status_code}\n{res.text}")
+                counts = self.__retry_queue.record_status_failure([id], res.status_code, res.text)
+                retried, dead = retried + counts[0], dead + counts[1]
                 continue
 
-            
-            # dump playlist data in its own file
+            # dump the aliases in the item store
             if len(res.json()["artists"]) > 0 and "aliases" in res.json()["artists"][0]:
-                with open(item_file_path, "w") as f:
-                    input = {"name": res.json()["artists"][0]["name"], 'aliases': res.json()["artists"][0]["aliases"]}
-                    json.dump(input, f, indent=2)
+                input = {"name": res.json()["artists"][0]["name"], 'aliases': res.json()["artists"][0]["aliases"]}
+                self.__store.put(id, input)
+                self.__registry.mark_cached([id])
+                SCRAPE_METRICS.record_items(self.__endpoint, 1)
+                cached_ids.append(id)
                 print(f"Successfully scraped {id}: {res.status_code}")
             else:
-                error_request.add(id)
+                dead += self.__retry_queue.record_failure([id], "No Aliases Found", retryable=False)[1]
                 print(f"Skipping {id}: No Aliases Found!")
-
-        df = df[~df['ID'].isin(error_request)]
-        df['CACHED'] = True
-        df.to_csv(current_path, index=False)
-        print(f"\nScraping complete, total ids with error: {len(error_request)}")
-        print(f"Removed ids with error request: {'\n'.join(error_request)}")
-    
-    def __update_df_with_fs(self, csv_file_path):
-        # read from csv
-        df = pd.read_csv(csv_file_path)
-        # drop duplicates
-        df.drop_duplicates(subset=['ID'], inplace=True)
-        # find all uncached items
-        not_cached = set()
-        for _, row in df.iterrows():
-            if not os.path.exists(joinpath(self.__items_folder_path, f"{row['ID']}.json")):
-                not_cached.add(row['ID'])
-
-        df.loc[df['ID'].isin(not_cached), 'CACHED'] = False
-        df.loc[~df['ID'].isin(not_cached), 'CACHED'] = True
-        df.to_csv(csv_file_path, index=False)
-        return df
+        return cached_ids, (retried, dead)
@@ -2,7 +2,11 @@ import os
 from os.path import join as joinpath, abspath
 from pathlib import Path
 
-from utility.variables import MUSICBRAINZ_DATA_PATH, MUSICBRAINZ_ITEMS_CSV_NAME, MUSICBRAINZ_ITEMS_FOLDER_NAME
+from spotify.util import list_stored_ids, open_item_store
+from utility.id_registry import IdRegistry
+from utility.item_store import ItemStore
+from utility.variables import MUSICBRAINZ_DATA_PATH, MUSICBRAINZ_ITEMS_CSV_NAME, MUSICBRAINZ_ITEMS_FOLDER_NAME, \
+    MUSICBRAINZ_ITEMS_REGISTRY_NAME
 
 def setup_musicbrainz_folders(endpoint) -> tuple[str]:
     data_path = abspath(joinpath(MUSICBRAINZ_DATA_PATH, endpoint))
@@ -21,3 +25,19 @@ def setup_musicbrainz_folders(endpoint) -> tuple[str]:
     return (data_path, csv_file_path, items_folder_path)
 
 
+def open_musicbrainz_item_store(endpoint) -> ItemStore:
+    """Opens the item store of a musicbrainz endpoint, see `open_item_store`."""
+    return open_item_store(endpoint, source_data_path=MUSICBRAINZ_DATA_PATH)
+
+
+def open_musicbrainz_registry(endpoint) -> IdRegistry:
+    """Opens the id registry of a musicbrainz endpoint, the ids added to the csv file since the registry was
+    last synced with it are registered, see `open_id_registry`.
+    """
+    data_path, csv_file_path, items_folder_path = setup_musicbrainz_folders(endpoint)
+    registry = IdRegistry(joinpath(data_path, MUSICBRAINZ_ITEMS_REGISTRY_NAME))
+    imported = registry.sync_csv(csv_file_path,
+                                 cached_ids=lambda: list_stored_ids(endpoint, source_data_path=MUSICBRAINZ_DATA_PATH))
+    if imported:
+        print(f"Registered {imported} new {endpoint} ids from {csv_file_path}.")
+    return registry
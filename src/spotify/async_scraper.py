@@ -0,0 +1,94 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from spotify.scraper import SpotifyScraper
+from spotify.util import open_id_registry, open_item_store, setup_spotify_folders
+from utility.lease import ScrapeLease
+from utility.metrics import SCRAPE_METRICS
+from utility.retry_queue import RetryQueue
+from utility.session import create_pooled_session
+from utility.token_pool import SPOTIFY_AUTH_TOKEN
+from utility.variables import SCRAPE_CONCURRENCY
+
+
+class AsyncSpotifyScraper:
+    """
+    Concurrent version of the `SpotifyScraper`. Keeps up to `concurrency` requests in flight
+    over a shared keep-alive connection pool. Each unit of work is scraped by `SpotifyScraper.scrape_work` in a
+    worker thread, so the items, the registry bookkeeping and the handling of the errors are the ones of the
+    sequential scraper.
+    """
+
+    def __init__(self, endpoint: str, concurrency: int = SCRAPE_CONCURRENCY, leased: bool = False):
+        self.__endpoint = endpoint
+        self.__concurrency = max(1, concurrency)
+        self.__data_path, self.__csv_file_path, self.__items_folder_path, _ = setup_spotify_folders(endpoint)
+        self.__session = create_pooled_session(self.__concurrency)
+        # the sequential scraper builds the requests, this class only schedules them
+        self.__registry = open_id_registry(endpoint)
+        # leased scrapes share the registry with the other workers scraping the endpoint
+        self.__lease = ScrapeLease(self.__registry) if leased else None
+        self.__retry_queue = RetryQueue(self.__registry, lease=self.__lease)
+        self.__store = open_item_store(endpoint)
+        self.__scraper = SpotifyScraper(endpoint, session=self.__session, registry=self.__registry, store=self.__store)
+
+    def scrape_items(self, batchmode: int = 1):
+        """Scrapes the pending items of the id registry, with several requests in flight at once.
+
+        Args:
+            batchmode (int, optional): Number of ids sent per request, 1 disables batch requests. Defaults to 1.
+        """
+        SCRAPE_METRICS.track_backlog(self.__endpoint, self.__registry.count_backlog)
+        try:
+            asyncio.run(self.__scrape_items(max(1, batchmode)))
+        finally:
+            if self.__lease is not None:
+                self.__lease.stop()
+
+    async def __scrape_items(self, batchmode: int):
+        print(f'SCRAPING {self.__endpoint.upper()} WITH {self.__concurrency} CONCURRENT REQUESTS')
+        counts = {'retried': 0, 'dead': 0}
+        # an unexpected error stops the scrape, like it stops the sequential scraper
+        errors = []
+        # bounded queue, the pending ids and due retries are read from the registry as the workers progress
+        queue = asyncio.Queue(maxsize=self.__concurrency * 2)
+
+        with ThreadPoolExecutor(max_workers=self.__concurrency) as executor:
+            workers = [
+                asyncio.create_task(self.__worker(queue, executor, batchmode, counts, errors))
+                for _ in range(self.__concurrency)
+            ]
+            for batch_ids in self.__retry_queue.iter_work(batchmode):
+                if errors:
+                    break
+                await queue.put(batch_ids)
+            await queue.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        self.__session.close()
+        if errors:
+            raise errors[0]
+
+        print(f"\nScraping complete, {counts['retried']} ids scheduled for a retry, "
+              f"{counts['dead']} ids moved to the dead letters.")
+        print(SPOTIFY_AUTH_TOKEN.summary())
+
+    async def __worker(self, queue: asyncio.Queue, executor: ThreadPoolExecutor, batchmode: int,
+                       counts: dict[str, int], errors: list[Exception]):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch_ids = await queue.get()
+            try:
+                # once a unit failed the remaining ones are only drained, the producer stops
+                if errors:
+                    continue
+                # the sequential scraper fetches, stores and records the unit, and handles the request errors
+                _, (retried, dead) = await loop.run_in_executor(executor, self.__scraper.scrape_work, batch_ids,
+                                                                batchmode)
+                counts['retried'] += retried
+                counts['dead'] += dead
+            except Exception as e:
+                errors.append(e)
+            finally:
+                queue.task_done()
@@ -0,0 +1,121 @@
+import requests
+from requests import Response
+
+from spotify.loader import load_info_from_playlist
+from spotify.util import open_id_registry, open_item_store
+from utility.id_registry import IdRegistry
+from utility.item_store import ItemStore
+from utility.retry_queue import RetryPolicy
+from utility.token_pool import SPOTIFY_AUTH_TOKEN
+from utility.utility import is_success_code
+from utility.variables import SPOTIFY_API_URL, SPOTIFY_CRAWL_EDGES, SPOTIFY_CRAWL_MAX_DEPTH
+
+
+class GraphCrawler:
+    """
+    Discovers new ids by walking the references of the entities that are already scraped: playlists lead to
+    tracks, artists and albums, albums lead to tracks and artists, and artists lead to their albums.
+
+    The id registries are the frontier and the set of seen ids. Discovered ids are added as pending to the
+    registry of their endpoint, one level deeper than the entity that references them, so the scrapers pick
+    them up. Every expanded entity is marked in its registry, a crawl only expands the entities cached since
+    the previous one, and entities at `max_depth` are not expanded.
+    """
+
+    def __init__(self, max_depth: int = SPOTIFY_CRAWL_MAX_DEPTH, session: requests.Session | None = None):
+        """
+        Args:
+            max_depth (int, optional): Depth of the ids that are no longer expanded, seed ids have a depth of 0.
+                Defaults to SPOTIFY_CRAWL_MAX_DEPTH.
+            session (requests.Session, optional): Session sending the requests of the artist albums.
+                Defaults to None.
+        """
+        self.max_depth = max_depth
+        self.__session = session if session is not None else requests.Session()
+        endpoints = set(SPOTIFY_CRAWL_EDGES).union(*SPOTIFY_CRAWL_EDGES.values())
+        self.__registries: dict[str, IdRegistry] = {endpoint: open_id_registry(endpoint) for endpoint in endpoints}
+        # functions returning the ids referenced by an entity, grouped by endpoint
+        self.__expanders = {
+            'playlists': self.__expand_playlists,
+            'albums': self.__expand_albums,
+            'artists': self.__expand_artists,
+        }
+
+    def crawl(self, batch_size: int = 1000) -> dict[str, int]:
+        """Expands every cached entity that has not been expanded yet.
+
+        Args:
+            batch_size (int, optional): Number of entities expanded between two writes to the registries.
+                Defaults to 1000.
+
+        Returns:
+            dict[str, int]: Number of new ids discovered for each endpoint.
+        """
+        discovered_counts = dict.fromkeys(self.__registries, 0)
+        for source, targets in SPOTIFY_CRAWL_EDGES.items():
+            print(f'CRAWLING {source.upper()}')
+            registry = self.__registries[source]
+            store = open_item_store(source)
+            expand = self.__expanders[source]
+            for batch in registry.iter_unexpanded(self.max_depth, batch_size):
+                # discovered ids of each target endpoint, grouped by the depth they are found at
+                discovered = {target: {} for target in targets}
+                expanded_ids = []
+                for id, depth in batch:
+                    try:
+                        references = expand(id, store)
+                    except requests.RequestException as e:
+                        status_code = e.response.status_code if e.response is not None else None
+                        if RetryPolicy.is_retryable(status_code):
+                            # left unexpanded, the next crawl tries again
+                            print(f"Request error while expanding {source} {id}: {e}")
+                            continue
+                        # a client error such as a removed artist would fail on every crawl
+                        print(f"Unable to expand {source} {id}, marked as expanded: {e}")
+                        references = {}
+                    for target in targets:
+                        discovered[target].setdefault(depth + 1, set()).update(references.get(target, ()))
+                    expanded_ids.append(id)
+                for target, ids_by_depth in discovered.items():
+                    for depth, ids in ids_by_depth.items():
+                        discovered_counts[target] += self.__registries[target].add_ids(ids, depth=depth)
+                registry.mark_expanded(expanded_ids)
+                print(f"Expanded {len(expanded_ids)} {source}.")
+        return discovered_counts
+
+    @staticmethod
+    def __expand_playlists(id: str, store: ItemStore) -> dict[str, set[str]]:
+        tracks, artists, albums = set(), set(), set()
+        load_info_from_playlist(id, store, tracks, artists, albums)
+        return {'tracks': tracks, 'artists': artists, 'albums': albums}
+
+    @staticmethod
+    def __expand_albums(id: str, store: ItemStore) -> dict[str, set[str]]:
+        album = store.get(id)
+        if album is None:
+            return {}
+        tracks = {track['id'] for track in album['tracks']['items'] if track is not None}
+        artists = {artist['id'] for artist in album['artists']}
+        for track in album['tracks']['items']:
+            if track is not None:
+                artists.update(artist['id'] for artist in track['artists'])
+        return {'tracks': tracks, 'artists': artists}
+
+    def __expand_artists(self, id: str, store: ItemStore) -> dict[str, set[str]]:
+        # the albums of an artist are not part of the artist item, they are paginated by the api
+        albums = set()
+        url = f"{SPOTIFY_API_URL}/artists/{id}/albums?include_groups=album,single&limit=50"
+        while url:
+            res = SPOTIFY_AUTH_TOKEN.send_request(self.__send_request, url, endpoint="artists/albums")
+            if not is_success_code(res.status_code):
+                raise requests.HTTPError(f"Status error code {res.status_code} while fetching {url}", response=res)
+            page = res.json()
+            albums.update(album['id'] for album in page['items'] if album is not None)
+            url = page.get('next')
+        return {'albums': albums}
+
+    def __send_request(self, url: str) -> Response:
+        headers = {
+            'Authorization': f"{SPOTIFY_AUTH_TOKEN.get_authorization()}"
+        }
+        return self.__session.get(url=url, headers=headers)
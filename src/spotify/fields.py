@@ -0,0 +1,135 @@
+from typing import Any, Callable, Iterable
+
+from spotify.util import load_mapping
+from utility.variables import SPOTIFY_FIELDS_ENDPOINTS, SPOTIFY_FIELDS_EXTRA_PATHS, SPOTIFY_FIELDS_NESTED_MAPPINGS
+
+
+class FieldsFilter:
+    """
+    Value of the `fields` query parameter of the api, which only returns the listed fields of an object,
+    e.g. `id,tracks(next,items(track(id,name)))`.
+
+    The filter is a tree of field names, a field mapped to True is returned whole.
+    """
+
+    def __init__(self, tree: dict):
+        self.tree = tree
+
+    @staticmethod
+    def from_paths(paths: Iterable[str]) -> 'FieldsFilter':
+        """Builds the filter returning every path, in the dotted syntax of `mapping.json`, e.g. `album.id` or
+        `artists[].id`.
+        """
+        tree = {}
+        for path in paths:
+            node = tree
+            keys = [key.replace('[]', '') for key in path.split('.')]
+            for i, key in enumerate(keys):
+                if node.get(key) is True:
+                    # the field is already returned whole
+                    break
+                if i == len(keys) - 1:
+                    node[key] = True
+                else:
+                    node = node.setdefault(key, {})
+        return FieldsFilter(tree)
+
+    @staticmethod
+    def from_param(param: str) -> 'FieldsFilter':
+        """Parses the value of a `fields` query parameter, e.g. `id,tracks(next,items(track(id)))`."""
+        stack = [{}]
+        key = ""
+        for char in param + ",":
+            if char == "(":
+                stack[-1][key] = {}
+                stack.append(stack[-1][key])
+                key = ""
+            elif char in ",)":
+                if key:
+                    stack[-1][key] = True
+                key = ""
+                if char == ")":
+                    stack.pop()
+            else:
+                key += char.strip()
+        return FieldsFilter(stack[0])
+
+    def subfilter(self, field: str) -> 'FieldsFilter | None':
+        """
+        Returns:
+            FieldsFilter | None: Filter of the nested object `field`, e.g. to request the next pages of a
+                paginated field. None when the field is returned whole or not at all.
+        """
+        subtree = self.tree.get(field)
+        return FieldsFilter(subtree) if isinstance(subtree, dict) else None
+
+    def apply(self, data: Any) -> Any:
+        """Keeps the fields of the filter in a json value, like the api does. The filter of a list applies to
+        each of its items, e.g. to test a filter offline or to answer filtered requests in the replay server.
+
+        Returns:
+            Any: Filtered copy of the value.
+        """
+        return self.__apply(self.tree, data)
+
+    @staticmethod
+    def __apply(tree: dict, data: Any) -> Any:
+        if isinstance(data, list):
+            return [FieldsFilter.__apply(tree, item) for item in data]
+        if not isinstance(data, dict):
+            return data
+        return {key: value if tree[key] is True else FieldsFilter.__apply(tree[key], value)
+                for key, value in data.items() if key in tree}
+
+    def to_param(self) -> str:
+        return self.__serialize(self.tree)
+
+    @staticmethod
+    def __serialize(tree: dict) -> str:
+        return ",".join(key if value is True else f"{key}({FieldsFilter.__serialize(value)})"
+                        for key, value in tree.items())
+
+    def __repr__(self):
+        return f"FieldsFilter({self.to_param()!r})"
+
+
+def mapping_paths(mapping: dict[str, str], prefix: str = "") -> list[str]:
+    """Lists the paths read by a mapping. The sub-fields following `[]` are kept, so only these fields of the
+    items of a list are requested, e.g. `tracks.items[].track.id` gives `tracks(items(track(id)))`. The mapper
+    returns the items of a list whole, the other fields of the items read by the consumers of the mapped
+    objects are listed in `SPOTIFY_FIELDS_EXTRA_PATHS`.
+
+    Args:
+        mapping (dict[str, str]): Mapping of the model attributes to json paths.
+        prefix (str, optional): Path of the mapped object within the requested object. Defaults to "".
+
+    Returns:
+        list[str]: Paths to request.
+    """
+    return [prefix + path for path in mapping.values()]
+
+
+def build_fields_filter(endpoint: str, load: Callable[[str], dict | None] = load_mapping) -> FieldsFilter | None:
+    """Builds the `fields` filter of an endpoint from its `mapping.json`, the nested objects harvested by the
+    loaders and the extra paths the scrapers and loaders read.
+
+    Args:
+        endpoint (str): Endpoint of the requested items.
+        load (Callable[[str], dict | None], optional): Returns the mapping of an endpoint. Defaults to the
+            `mapping.json` of its data folder.
+
+    Returns:
+        FieldsFilter | None: Filter of the endpoint, None if the endpoint does not support filters or has no
+            mapping, the items are then requested whole.
+    """
+    if endpoint not in SPOTIFY_FIELDS_ENDPOINTS:
+        return None
+    mapping = load(endpoint)
+    if mapping is None:
+        return None
+    paths = mapping_paths(mapping) + SPOTIFY_FIELDS_EXTRA_PATHS.get(endpoint, [])
+    for nested_endpoint, prefix in SPOTIFY_FIELDS_NESTED_MAPPINGS.get(endpoint, {}).items():
+        nested_mapping = load(nested_endpoint)
+        if nested_mapping is not None:
+            paths += mapping_paths(nested_mapping, prefix=f"{prefix}.")
+    return FieldsFilter.from_paths(paths)
@@ -1,79 +1,176 @@
 
+import csv
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from spotify.util import setup_spotify_folders
-import pandas as pd
-import os
+from typing import Iterable, Iterator
+from spotify.util import load_mapping, open_id_registry, open_item_manifest, open_item_store
 from os.path import abspath, join as joinpath, exists
-import json
-from utility.variables import SPOTIFY_DATA_PATH, SPOTIFY_ITEMS_CSV_NAME
+from utility.id_registry import CACHED, IdRegistry
+from utility.item_store import ItemStore
+from utility.json_decoder import json_loads
+from utility.mapper import JsonToObjectMapper
+from utility.variables import LOAD_GENRES_SHARD_SIZE, LOAD_PLAYLISTS_SHARD_SIZE, SPOTIFY_DATA_PATH, \
+    SPOTIFY_HARVESTED_TRACK_PATHS
 from tqdm import tqdm
 
+# top-level fields of the tracks read by the loaders and the track inserters
+HARVESTED_TRACK_FIELDS = {path.split('.')[0].replace('[]', '') for path in SPOTIFY_HARVESTED_TRACK_PATHS}
 
-def load_info_from_playlists():
-    _, tracks_csv, _, _ = setup_spotify_folders('tracks')
-    _, playlists_csv, playlist_items_folder, _ = setup_spotify_folders('playlists')
-    _, albums_csv, _, _ = setup_spotify_folders('albums')
-    _, artists_csv, _, _ = setup_spotify_folders('artists')
-    print("Loading playlists...")
-    playlists_df = pd.read_csv(playlists_csv)
-    print("Drop duplicates of playlists...")
-    playlists_df.drop_duplicates(subset=['ID'], inplace=True)
-    print("Removing playlists that are not cached...")
-    playlists_df = playlists_df[playlists_df['CACHED'] == True]
-    playlist_ids = set(playlists_df['ID'].to_list())
-    del playlists_df
+
+def load_info_from_playlists(harvest: bool = False, processes: int = 1):
+    """Queues the tracks, artists and albums of the cached playlists in their registries.
+
+    Args:
+        harvest (bool, optional): Stores the track objects embedded in the playlists as cached tracks, only the
+            tracks that are not harvestable are queued to be scraped, see `is_harvestable`. Defaults to False.
+        processes (int, optional): Number of worker processes decoding the playlists, 1 decodes them in the main
+            process. Defaults to 1.
+    """
+    playlist_store = open_item_store('playlists')
+    print("Loading cached playlists from the registry...")
+    playlist_ids = set(open_id_registry('playlists').iter_ids(CACHED))
     total_playlist_ids = len(playlist_ids)
     print(f"Total playlists to read: {total_playlist_ids}")
     tracks = set()
     artists = set()
     albums = set()
+    tracks_mapper = load_tracks_mapper() if harvest else None
+    tracks_store = open_item_store('tracks') if tracks_mapper else None
+    tracks_registry = open_id_registry('tracks')
+    harvested_size = 0
     # print new line for the progress bar
     with tqdm(total=total_playlist_ids) as pbar:
-        for playlist_id in playlist_ids:
-            load_info_from_playlist(playlist_id, playlist_items_folder, tracks, artists, albums)
-            pbar.update(1)
+        if processes > 1:
+            # the workers decode the playlists, the main process merges their ids and is the only writer
+            playlist_ids = list(playlist_ids)
+            shards = [playlist_ids[i:i + LOAD_PLAYLISTS_SHARD_SIZE]
+                      for i in range(0, len(playlist_ids), LOAD_PLAYLISTS_SHARD_SIZE)]
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                futures = {executor.submit(load_info_from_playlist_shard, shard, tracks_mapper is not None): len(shard)
+                           for shard in shards}
+                for future in as_completed(futures):
+                    shard_tracks, shard_artists, shard_albums, playlist_tracks = future.result()
+                    tracks |= shard_tracks
+                    artists |= shard_artists
+                    albums |= shard_albums
+                    if tracks_mapper:
+                        harvested_size += harvest_tracks(playlist_tracks, tracks_mapper, tracks_store,
+                                                         tracks_registry)
+                    pbar.update(futures[future])
+        else:
+            for playlist_id in playlist_ids:
+                playlist_tracks = {} if tracks_mapper else None
+                load_info_from_playlist(playlist_id, playlist_store, tracks, artists, albums, playlist_tracks)
+                if tracks_mapper:
+                    harvested_size += harvest_tracks(playlist_tracks, tracks_mapper, tracks_store, tracks_registry)
+                pbar.update(1)
 
     del playlist_ids
-    tracks_size_diff = output_to_csv(tracks_csv, tracks, "tracks")
+    tracks_size_diff = output_to_registry(tracks_registry, tracks, "tracks")
     del tracks
-    artists_size_diff = output_to_csv(artists_csv, artists, "artists")
+    artists_size_diff = output_to_registry(open_id_registry('artists'), artists, "artists")
     del artists
-    albums_size_diff = output_to_csv(albums_csv, albums, "albums")
+    albums_size_diff = output_to_registry(open_id_registry('albums'), albums, "albums")
     del albums
 
+    if tracks_mapper:
+        print(f"Harvested {harvested_size} complete tracks from playlists.")
     print(f"Added {tracks_size_diff} new tracks from playlists.")
-    print(f"Added {artists_size_diff} new albums from playlists.")
-    print(f"Added {albums_size_diff} new artists from playlists.")
-
-
-def output_to_csv(csv_path: str, ids: set[str], type: str):
-    print(f"Load {type} csv to remove duplicates...")
-    csv_id = set(pd.read_csv(csv_path)['ID'].to_list())
-    ids.difference_update(csv_id)
-    # delete csv_id's reference for garbage collector
-    del csv_id
-    # map ids to csv format
-    ids = [f"{id},False\n" for id in ids if id is not None]
-    size = len(ids)
-    if size:
-        print(f"Writing to {type} csv...")
-        with open(csv_path, "a") as f:
-            f.writelines(ids)
-    else:
+    print(f"Added {artists_size_diff} new artists from playlists.")
+    print(f"Added {albums_size_diff} new albums from playlists.")
+
+
+def load_info_from_playlist_shard(playlist_ids: list[str], harvest: bool = False) \
+        -> tuple[set[str], set[str], set[str], dict[str, dict]]:
+    """Reads a shard of the cached playlists in a worker process of `load_info_from_playlists`.
+
+    Args:
+        playlist_ids (list[str]): Ids of the playlists to read.
+        harvest (bool, optional): Keeps the track objects that can be harvested. Defaults to False.
+
+    Returns:
+        tuple[set[str], set[str], set[str], dict[str, dict]]: Ids of the tracks, artists and albums of the
+            playlists, and the harvestable track objects that are not stored yet.
+    """
+    playlist_store = open_item_store('playlists')
+    tracks_mapper = load_tracks_mapper() if harvest else None
+    tracks_store = open_item_store('tracks') if tracks_mapper else None
+    tracks = set()
+    artists = set()
+    albums = set()
+    playlist_tracks = {}
+    for playlist_id in playlist_ids:
+        load_info_from_playlist(playlist_id, playlist_store, tracks, artists, albums,
+                                playlist_tracks if tracks_mapper else None)
+    if tracks_mapper:
+        # only the tracks the main process will store are sent back to it
+        playlist_tracks = {track_id: track for track_id, track in playlist_tracks.items()
+                           if track_id not in tracks_store and is_harvestable(track, tracks_mapper)}
+    playlist_store.close()
+    if tracks_store is not None:
+        tracks_store.close()
+    return tracks, artists, albums, playlist_tracks
+
+
+def output_to_registry(registry: IdRegistry, ids: set[str], type: str):
+    """Adds the ids to the registry as pending, ids that are already registered are skipped. The registry is
+    exported to the `ids.csv` file of the endpoint on demand, with `--export-ids-csv`.
+
+    Returns:
+        int: Number of new ids.
+    """
+    print(f"Writing to {type} registry...")
+    size = registry.add_ids(ids)
+    if not size:
         print(f"Nothing to write for {type}")
     return size
 
 
-def load_info_from_playlist(playlist_id, playlist_items_folder, tracks_set: set[str], artists_set: set[str], albums_set: set[str]):
+def load_tracks_mapper() -> JsonToObjectMapper | None:
+    mapping = load_mapping('tracks')
+    if mapping is None:
+        print("No mapping was found for tracks, tracks won't be harvested from playlists")
+        return None
+    return JsonToObjectMapper(mapping)
+
+
+def is_harvestable(track: dict, tracks_mapper: JsonToObjectMapper) -> bool:
+    """
+    Returns:
+        bool: True if the track object holds every field read by the tracks mapping, the loaders and the track
+            inserters, e.g. its available markets are left out by a playlist requested for a market.
+    """
+    return tracks_mapper.has_required_fields(track) and all(track.get(field) is not None
+                                                            for field in HARVESTED_TRACK_FIELDS)
+
+
+def harvest_tracks(playlist_tracks: dict[str, dict], tracks_mapper: JsonToObjectMapper, tracks_store: ItemStore,
+                   tracks_registry: IdRegistry) -> int:
+    """Stores the track objects of a playlist as cached tracks. Tracks that are already stored, and tracks
+    that are not harvestable, are left to the tracks scraper.
+
+    Returns:
+        int: Number of harvested tracks.
+    """
+    harvested_ids = []
+    for track_id, track in playlist_tracks.items():
+        if track_id in tracks_store or not is_harvestable(track, tracks_mapper):
+            continue
+        tracks_store.put(track_id, track)
+        harvested_ids.append(track_id)
+    tracks_registry.add_ids(harvested_ids)
+    tracks_registry.mark_cached(harvested_ids)
+    return len(harvested_ids)
+
+
+def load_info_from_playlist(playlist_id, playlist_store: ItemStore, tracks_set: set[str], artists_set: set[str], albums_set: set[str],
+                            tracks_objects: dict[str, dict] | None = None):
     # check if the playlist has been scraped
-    playlist_json_file = os.path.join(playlist_items_folder, f"{playlist_id}.json")
-    if not os.path.exists(playlist_json_file):
+    playlist_json = playlist_store.get(playlist_id)
+    if playlist_json is None:
         print(f"Playlist {playlist_id} needs to be scraped before loading tracks")
         return
 
-    with open(playlist_json_file, "r") as f:
-        playlist_json = json.load(f)
-
     # find all the tracks
     tracks = playlist_json['tracks']['items']
     for track in tracks:
@@ -83,6 +180,9 @@ def load_info_from_playlist(playlist_id, playlist_items_folder, tracks_set: set[
             continue
         # add new track in set
         tracks_set.add(track['id'])
+        if tracks_objects is not None and track['id'] is not None:
+            # keep the full track object to be harvested
+            tracks_objects[track['id']] = track
         albums_set.add(track['album']['id'])
         # add all artists from albums
         for artist in track['album']['artists']:
@@ -92,79 +192,61 @@ def load_info_from_playlist(playlist_id, playlist_items_folder, tracks_set: set[
             artists_set.add(artist['id'])
 
 
-def load_authors_from_audiobooks():
-    _, _, items_audiobooks_folder_path, _ = setup_spotify_folders('audiobooks')
-    _, _, items_authors_folder_path, _ = setup_spotify_folders('authors')
-
-    if not os.path.exists(items_audiobooks_folder_path):
-        print(f"No directory was found at {items_audiobooks_folder_path}")
-        return
+def load_authors_from_audiobooks(rebuild: bool = False):
+    """Stores the authors of the audiobooks added or changed since the previous run.
 
-    files = [f for f in os.listdir(items_audiobooks_folder_path) if
-             os.path.isfile(os.path.join(items_audiobooks_folder_path, f)) and f.endswith('.json')]
+    Args:
+        rebuild (bool, optional): Reads every audiobook again. Defaults to False.
+    """
+    audiobooks_store = open_item_store('audiobooks')
+    authors_store = open_item_store('authors')
+    manifest = open_item_manifest('audiobooks', 'authors')
 
-    author_files = [f for f in os.listdir(items_authors_folder_path) if
-                    os.path.isfile(os.path.join(items_authors_folder_path, f)) and f.endswith('.json')]
-    authors_size = len(author_files)
-
-    if not files:
-        print(f"No data was found at {items_audiobooks_folder_path}")
+    authors_size = len(authors_store)
+    if not len(audiobooks_store):
+        print("No audiobooks were found in the item store")
         return
-    for file in files:
-        file_path = os.path.join(items_audiobooks_folder_path, file)
-        with open(file_path, 'r') as f:
-            load_authors_from_single_audiobook(f, file_path, items_authors_folder_path)
+    for audiobook_id, data in manifest.changed(audiobooks_store, rebuild=rebuild):
+        load_authors_from_single_audiobook(json_loads(data), audiobook_id, authors_store)
+    manifest.commit()
 
-    author_files = [f for f in os.listdir(items_authors_folder_path) if
-                    os.path.isfile(os.path.join(items_authors_folder_path, f)) and f.endswith('.json')]
-    print(f"Added {len(author_files) - authors_size} new audiobooks with authors.")
+    print(f"Added {len(authors_store) - authors_size} new audiobooks with authors.")
 
 
-def load_authors_from_single_audiobook(file, file_path, items_authors_folder_path):
-    data = json.load(file)
+def load_authors_from_single_audiobook(data, audiobook_id, authors_store: ItemStore):
     if data:
-        audiobook_id = data['id']
         authors = data['authors']
 
-        author = {'authors': authors, 'audiobook_id': audiobook_id}
-        if os.path.isfile(f'{items_authors_folder_path}/{author['audiobook_id']}.json'):
+        author = {'authors': authors, 'audiobook_id': data['id']}
+        if author['audiobook_id'] in authors_store:
             return
-        with open(f'{items_authors_folder_path}/{author['audiobook_id']}.json', 'w') as f:
-            json.dump(author, f, ensure_ascii=False, indent=2)
+        authors_store.put(author['audiobook_id'], author)
     else:
-        print(f"Warning: Empty JSON file skipped - {file_path}")
-
-
-def load_chapters_from_audiobooks():
-    _, _, items_audiobooks_folder_path, _ = setup_spotify_folders('audiobooks')
-    _, _, items_chapters_folder_path, _ = setup_spotify_folders('chapters')
+        print(f"Warning: Empty JSON item skipped - {audiobook_id}")
 
-    if not os.path.exists(items_audiobooks_folder_path):
-        print(f"No directory was found at {items_audiobooks_folder_path}")
-        return
 
-    files = [f for f in os.listdir(items_audiobooks_folder_path) if
-             os.path.isfile(os.path.join(items_audiobooks_folder_path, f)) and f.endswith('.json')]
+def load_chapters_from_audiobooks(rebuild: bool = False):
+    """Stores the chapters of the audiobooks added or changed since the previous run.
 
-    chapter_files = [f for f in os.listdir(items_chapters_folder_path) if
-                     os.path.isfile(os.path.join(items_chapters_folder_path, f)) and f.endswith('.json')]
-    chapters_size = len(chapter_files)
+    Args:
+        rebuild (bool, optional): Reads every audiobook again. Defaults to False.
+    """
+    audiobooks_store = open_item_store('audiobooks')
+    chapters_store = open_item_store('chapters')
+    manifest = open_item_manifest('audiobooks', 'chapters')
 
-    if not files:
-        print(f"No data was found at {items_audiobooks_folder_path}")
+    chapters_size = len(chapters_store)
+    if not len(audiobooks_store):
+        print("No audiobooks were found in the item store")
         return
-    for file in files:
-        file_path = os.path.join(items_audiobooks_folder_path, file)
-        with open(file_path, 'r') as f:
-            load_chapters_from_single_audiobook(f, file_path, items_chapters_folder_path)
+    for audiobook_id, data in manifest.changed(audiobooks_store, rebuild=rebuild):
+        load_chapters_from_single_audiobook(json_loads(data), audiobook_id, chapters_store)
+    manifest.commit()
 
-    chapter_files = [f for f in os.listdir(items_chapters_folder_path) if
-                     os.path.isfile(os.path.join(items_chapters_folder_path, f)) and f.endswith('.json')]
-    print(f"Added {len(chapter_files) - chapters_size} new chapters.")
+    print(f"Added {len(chapters_store) - chapters_size} new chapters.")
 
 
-def load_chapters_from_single_audiobook(file, file_path, items_chapters_folder_path):
-    data = json.load(file)
+def load_chapters_from_single_audiobook(data, audiobook_id, chapters_store: ItemStore):
     if data:
         chapter_items = data['chapters']['items']
         audiobook = data.copy()
@@ -172,15 +254,23 @@ def load_chapters_from_single_audiobook(file, file_path, items_chapters_folder_p
 
         for chapter in chapter_items:
             chapter['audiobook'] = audiobook
-            if os.path.isfile(f'{items_chapters_folder_path}/{chapter['id']}.json'):
-                return
-            with open(f'{items_chapters_folder_path}/{chapter['id']}.json', 'w') as f:
-                json.dump(chapter, f, ensure_ascii=False, indent=2)
+            # the chapters fetched by the pagination expander can follow chapters that are already stored
+            if chapter['id'] in chapters_store:
+                continue
+            chapters_store.put(chapter['id'], chapter)
     else:
-        print(f"Warning: Empty JSON file skipped - {file_path}")
+        print(f"Warning: Empty JSON item skipped - {audiobook_id}")
+
 
+def load_genres(processes: int = 1, rebuild: bool = False):
+    """Adds the genres of the stored artists and albums to `genres/genres.csv`. Only the items added or changed
+    since the previous run are read, see `ItemManifest`.
 
-def load_genres():
+    Args:
+        processes (int, optional): Number of worker processes decoding the items, 1 decodes them in the main
+            process. Defaults to 1.
+        rebuild (bool, optional): Reads every artist and album again. Defaults to False.
+    """
     endpoint = 'genres'
     data_path = abspath(joinpath(SPOTIFY_DATA_PATH, endpoint))
     csv_genres_path = abspath(joinpath(data_path, 'genres.csv'))
@@ -189,40 +279,81 @@ def load_genres():
     Path(data_path).mkdir(parents=True, exist_ok=True)
     if not exists(csv_genres_path):
         with open(csv_genres_path, "w") as f:
-            f.write('GENRES')
+            f.write('GENRES\n')
         # log info
         print(f"No data currently stored for {endpoint}, successfully created folders and csv file.")
 
-    # get paths for artists and albums
-    _, artists_csv, artists_items_folder, _ = setup_spotify_folders('artists')
-    _, albums_csv, albums_items_folder, _ = setup_spotify_folders('albums')
-    artists_df = pd.read_csv(artists_csv)
-    albums_df = pd.read_csv(albums_csv)
-    genres_df = pd.read_csv(csv_genres_path)
-    genres_count = len(genres_df)
-
-    # keep only the ones that are cached
-    artists_df = artists_df[artists_df['CACHED']]
-    albums_df = albums_df[albums_df['CACHED']]
-
-    for _, row in artists_df.iterrows():
-        artist_id = row['ID']
-        artist_json_file = os.path.join(artists_items_folder, f"{artist_id}.json")
-        with open(artist_json_file, "r") as f:
-            artist_json = json.load(f)
-        # combine the genres from artists
-        for g in artist_json['genres']:
-            genres_df.loc[len(genres_df)] = [g]
-
-    for _, row in albums_df.iterrows():
-        album_id = row['ID']
-        album_json_file = os.path.join(albums_items_folder, f"{album_id}.json")
-        with open(album_json_file, "r") as f:
-            album_json = json.load(f)
-        # combine the genres from album
-        for g in album_json['genres']:
-            genres_df.loc[len(genres_df)] = [g]
-
-    genres_df.drop_duplicates(subset=['GENRES'], inplace=True)
-    genres_df.to_csv(csv_genres_path, index=False)
-    print(f"Total number of genres added: {len(genres_df)-genres_count}")
+    with open(csv_genres_path, "r", newline='') as f:
+        content = f.read()
+    rows = csv.reader(content.splitlines())
+    next(rows, None)
+    genres = {row[0] for row in rows if row}
+    new_genres = set()
+    executor = ProcessPoolExecutor(max_workers=processes) if processes > 1 else None
+    # the manifests are committed once the genres are appended, a failed run reads the same items again
+    manifests = []
+    try:
+        for items_endpoint in ('artists', 'albums'):
+            manifest = open_item_manifest(items_endpoint, 'genres')
+            manifests.append(manifest)
+            print(f"Reading the genres of the new {items_endpoint}...")
+            futures = []
+            with tqdm() as pbar:
+                # the manifest reads the changed items, their decoding is spread over the worker processes
+                for shard in iter_shards(manifest.changed(open_item_store(items_endpoint), rebuild=rebuild),
+                                         LOAD_GENRES_SHARD_SIZE):
+                    if executor is not None:
+                        futures.append(executor.submit(load_genres_shard, items_endpoint, shard))
+                        # bounds the shards held in memory while the workers are busy
+                        if len(futures) >= 2 * processes:
+                            new_genres |= futures.pop(0).result()
+                    else:
+                        new_genres |= load_genres_shard(items_endpoint, shard)
+                    pbar.update(len(shard))
+                for future in futures:
+                    new_genres |= future.result()
+
+        new_genres -= genres
+        # the known genres are kept, only the new ones are appended
+        with open(csv_genres_path, "a", newline='') as f:
+            if new_genres and not content.endswith('\n'):
+                f.write('\n')
+            csv.writer(f, lineterminator='\n').writerows([g] for g in sorted(new_genres))
+        for manifest in manifests:
+            manifest.commit()
+    finally:
+        for manifest in manifests:
+            manifest.close()
+        if executor is not None:
+            executor.shutdown()
+    print(f"Total number of genres added: {len(new_genres)}")
+
+
+def iter_shards(items: Iterable, size: int) -> Iterator[list]:
+    shard = []
+    for item in items:
+        shard.append(item)
+        if len(shard) >= size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+def load_genres_shard(endpoint: str, items: list[tuple[str, bytes]]) -> set[str]:
+    """
+    Args:
+        endpoint (str): Endpoint of the items, used in the warnings.
+        items (list[tuple[str, bytes]]): Ids and raw json of artists or albums.
+
+    Returns:
+        set[str]: Genres of the items.
+    """
+    genres = set()
+    for id, data in items:
+        item = json_loads(data)
+        if not item:
+            print(f"Warning: Empty {endpoint} item skipped - {id}")
+            continue
+        genres.update(item['genres'])
+    return genres
@@ -0,0 +1,141 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
+
+import requests
+from requests import Response
+
+from spotify.util import open_item_store
+from utility.token_pool import SPOTIFY_AUTH_TOKEN
+from utility.utility import is_success_code
+from utility.variables import SCRAPE_CONCURRENCY, SPOTIFY_PAGINATED_FIELDS
+
+
+class PaginationExpander:
+    """
+    Completes the paginated collections of the scraped items, e.g. the tracks of a playlist or the chapters
+    of an audiobook. Spotify only returns the first page of these collections with the item, this class
+    fetches the remaining pages concurrently, within the shared rate budget, and merges them into the item
+    so the loaders see the complete collection.
+    """
+
+    def __init__(self, endpoint: str, session: requests.Session | None = None,
+                 concurrency: int = SCRAPE_CONCURRENCY, fields: str | None = None):
+        """
+        Args:
+            endpoint (str): Endpoint of the items, e.g. `playlists`.
+            session (requests.Session, optional): Session sending the page requests. Defaults to None.
+            concurrency (int, optional): Maximum number of pages of an item fetched at once.
+                Defaults to SCRAPE_CONCURRENCY.
+            fields (str, optional): `fields` filter of the pages, see `FieldsFilter`. Defaults to None.
+        """
+        self.__field = SPOTIFY_PAGINATED_FIELDS.get(endpoint)
+        self.__endpoint = endpoint
+        self.__session = session if session is not None else requests.Session()
+        self.__concurrency = max(1, concurrency)
+        self.__fields = fields
+        self.total_pages = 0
+
+    @staticmethod
+    def is_paginated(endpoint: str) -> bool:
+        return endpoint in SPOTIFY_PAGINATED_FIELDS
+
+    def needs_expansion(self, item: dict) -> bool:
+        """
+        Returns:
+            bool: True if the paginated collection of the item has more pages.
+        """
+        if self.__field is None:
+            return False
+        paging = item.get(self.__field)
+        return isinstance(paging, dict) and bool(paging.get('next'))
+
+    def expand(self, item: dict) -> int:
+        """Fetches the missing pages of the paginated collection of an item and appends their items to it.
+        The item is modified in place, its collection no longer has a `next` page once expanded.
+
+        Args:
+            item (dict): Item returned by the API.
+
+        Raises:
+            requests.HTTPError: A page could not be fetched, the item is left unchanged.
+
+        Returns:
+            int: Number of fetched pages.
+        """
+        if not self.needs_expansion(item):
+            return 0
+        paging = item[self.__field]
+        urls = self.__page_urls(paging)
+        if len(urls) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.__concurrency, len(urls))) as executor:
+                pages = list(executor.map(self.__fetch_page, urls))
+        else:
+            pages = [self.__fetch_page(url) for url in urls]
+        # the collection may have grown since the first page, follow the next links of the last page
+        while pages[-1].get('next'):
+            pages.append(self.__fetch_page(self.__page_urls(pages[-1], single=True)[0]))
+
+        for page in pages:
+            paging['items'].extend(page['items'])
+        paging['next'] = None
+        paging['limit'] = len(paging['items'])
+        self.total_pages += len(pages)
+        return len(pages)
+
+    def __page_urls(self, paging: dict, single: bool = False) -> list[str]:
+        """Computes the urls of every remaining page from the `next` link, the page size and the total.
+        With `single`, only the url of the next page is returned."""
+        next_url = urlparse(paging['next'])
+        query = {key: values[0] for key, values in parse_qs(next_url.query).items()}
+        if self.__fields:
+            query['fields'] = self.__fields
+        start = int(query.get('offset', len(paging['items'])))
+        limit = int(query.get('limit', paging.get('limit') or len(paging['items'])))
+        total = paging.get('total') or 0
+        if single or limit <= 0 or start >= total:
+            return [urlunparse(next_url._replace(query=urlencode(query)))]
+        urls = []
+        for offset in range(start, total, limit):
+            query['offset'] = str(offset)
+            urls.append(urlunparse(next_url._replace(query=urlencode(query))))
+        return urls
+
+    def __fetch_page(self, url: str) -> dict:
+        res: Response = SPOTIFY_AUTH_TOKEN.send_request(self.__send_page_request, url,
+                                                        endpoint=f"{self.__endpoint}/{self.__field}")
+        if not is_success_code(res.status_code):
+            raise requests.HTTPError(f"Status error code {res.status_code} while fetching page {url}", response=res)
+        return res.json()
+
+    def __send_page_request(self, url: str) -> Response:
+        headers = {
+            'Authorization': f"{SPOTIFY_AUTH_TOKEN.get_authorization()}"
+        }
+        return self.__session.get(url=url, headers=headers)
+
+
+def expand_stored_items(endpoint: str) -> int:
+    """Expands the paginated collections of the items already stored for an endpoint, the items scraped
+    before the pagination stage existed only hold the first page.
+
+    Args:
+        endpoint (str): Endpoint of the items, e.g. `playlists`.
+
+    Returns:
+        int: Number of expanded items.
+    """
+    store = open_item_store(endpoint)
+    paginator = PaginationExpander(endpoint)
+    expanded = 0
+    for id, item in store.items():
+        if not paginator.needs_expansion(item):
+            continue
+        try:
+            pages = paginator.expand(item)
+        except requests.RequestException as e:
+            print(f"Request error while fetching the pages of {id}: {e}")
+            continue
+        store.put(id, item)
+        expanded += 1
+        print(f"Expanded {id} with {pages} pages.")
+    return expanded
@@ -1,22 +1,31 @@
 import json
-import os
-from typing import Dict, TypeVar, Type
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from os.path import join as joinpath
+from typing import Dict, Iterator, List, TypeVar, Type
 
-from spotify.util import setup_spotify_folders
+from spotify.util import open_item_store, setup_spotify_folders
+from utility.json_decoder import json_loads
+from utility.manifest import ItemManifest
 from utility.mapper import JsonToObjectMapper
+from utility.snapshot import ParsedSnapshot, store_signature
+from utility.variables import PARSE_CHUNK_SIZE, SPOTIFY_SNAPSHOTS_FOLDER_NAME
 
 T = TypeVar('T')
+# mappers of the worker processes of a parallel parser, by mapping
+CHUNK_MAPPERS: Dict[str, JsonToObjectMapper] = {}
 
 
 class SpotifyParser:
     """
     A parser class for Spotify data, specifically for parsing spotify information.
 
-    This class is responsible for parsing JSON files that contain spotify data, converting
-    them into instances of a specified model class.
+    This class is responsible for parsing the JSON items of an item store that contain spotify data,
+    converting them into instances of a specified model class.
 
     Attributes:
-        __items_folder_path (str): The path to the directory containing JSON data files.
+        __store (ItemStore): The item store containing the JSON items.
         __mapper_file_path (str): The path to the JSON file that contains mapping information
                                   used to map JSON data to the model class attributes.
         __cls (Type[T]): The class type (model) into which the JSON data will be parsed.
@@ -28,13 +37,19 @@ class SpotifyParser:
     Methods:
         __init__(self, folder_name, cls: Type[T]): Initializes a new SpotifyParser instance.
         __load_mapping(self): Loads the mapping information from a JSON file.
-        parse_all(self): Parses all JSON files in the specified directory and converts them
+        parse_all(self): Parses all JSON items of the item store and converts them
                          to instances of the model class.
+        iter(self) -> Iterator[T]: Lazily parses the JSON items of the item store, one at a time.
+        iter_batches(self, n) -> Iterator[List[T]]: Lazily parses the JSON items in lists of `n` objects.
+        parse_item(self, id, data) -> T: Parses the raw JSON of a single item.
+        decode_item(self, id, data) -> Dict: Decodes the raw JSON of a single item.
+        map_item(self, id, json_data) -> T: Maps the decoded JSON of a single item.
         parse_single(self, file_path) -> T: Parses a single JSON file and converts it to an
                                             instance of the model class.
     """
 
-    def __init__(self, folder_name, cls: Type[T]):
+    def __init__(self, folder_name, cls: Type[T], processes: int = 1, chunk_size: int = PARSE_CHUNK_SIZE,
+                 snapshot: bool = False):
         """
         Initializes a new instance of the SpotifyParser class.
 
@@ -43,8 +58,19 @@ class SpotifyParser:
             cls (Type[T]): The class type into which the JSON data will be parsed. This class
                            should have an initializer that accepts keyword arguments corresponding
                            to the attributes mapped from the JSON data.
+            processes (int): The number of worker processes decoding and mapping the items,
+                             1 parses them in the current process.
+            chunk_size (int): The number of items sent to a worker process at a time.
+            snapshot (bool): Reads the parsed items from the snapshot of the folder, see `ParsedSnapshot`.
+                             The snapshot is taken again whenever the items change.
         """
-        _, _, self.__items_folder_path, self.__mapper_file_path = setup_spotify_folders(folder_name)
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.snapshot = snapshot
+        data_path, _, _, self.__mapper_file_path = setup_spotify_folders(folder_name)
+        self.__snapshot_path = joinpath(data_path, SPOTIFY_SNAPSHOTS_FOLDER_NAME)
+        self.__folder_name = folder_name
+        self.__store = open_item_store(folder_name)
         self.__cls = cls
         self.__mapper: JsonToObjectMapper | None = None
         self.__mapping: Dict[str: str] = None
@@ -61,9 +87,10 @@ class SpotifyParser:
             self.__mapping = json.load(f)
             self.__mapper = JsonToObjectMapper(self.__mapping)
 
-    def parse_all(self, middleware=None, exlude_files=[]):
+    def parse_all(self, middleware=None, exlude_files=[], manifest: ItemManifest | None = None,
+                  fields: List[str] | None = None):
         """
-        Parses all JSON files in the `self.__items_folder_path` directory, converting each into
+        Parses all JSON items of `self.__store`, converting each into
         an instance of `self.__cls`. An optional middleware function can be provided to modify
         each object after it is mapped from the JSON data.
 
@@ -74,9 +101,14 @@ class SpotifyParser:
         Parameters:
             middleware (Callable[[T, Dict], T]): A function that takes the mapped object and the original
                                                  JSON data, modifies the mapped object, and returns it.
+            manifest (ItemManifest | None): Only parses the items changed since the last commit of the
+                                            manifest. The caller commits it once the objects are processed.
+            fields (List[str] | None): Top-level JSON fields set as is on the mapped objects, in addition
+                                       to the mapped attributes. Unlike a middleware, the fields can be
+                                       parsed by worker processes and stored in the snapshot.
 
         Returns:
-            A list of instances of `self.__cls`, each corresponding to a JSON file in the directory.
+            A list of instances of `self.__cls`, each corresponding to a JSON item of the store.
             If no files are found or an error occurs, it may return None or an incomplete list.
 
         Example:
@@ -93,28 +125,195 @@ class SpotifyParser:
             This middleware function sets the 'attribute_name' of each mapped_object to 'value'
             and ensures the modified object is returned.
         """
-        if not os.path.exists(self.__items_folder_path):
-            print(f"No directory was found at {self.__items_folder_path}")
+        if not len(self.__store):
+            print(f"No data was found in the {self.__folder_name} item store")
             return
 
-        files = [f for f in os.listdir(self.__items_folder_path) if
-                 os.path.isfile(os.path.join(self.__items_folder_path, f)) and f.endswith('.json')]
-        if not files:
-            print(f"No data was found at {self.__items_folder_path}")
-            return
+        return list(self.iter(middleware, manifest, fields))
+
+    def iter(self, middleware=None, manifest: ItemManifest | None = None,
+             fields: List[str] | None = None) -> Iterator[T]:
+        """
+        Parses the JSON items of `self.__store` as they are read, so only one item is held in memory at a time.
+        See `parse_all` for the middleware, the manifest and the fields.
 
-        object_list = []
-        for file in files:
-            file_path = os.path.join(self.__items_folder_path, file)
-            mapped_object = self.parse_single(file_path)
+        Yields:
+            An instance of `self.__cls` for each JSON item of the store that could be parsed.
+        """
+        fields = fields or []
+        # the middleware needs the decoded JSON, which is neither sent back by the worker processes nor stored
+        if middleware is None:
+            if self.snapshot and manifest is None:
+                yield from self.__iter_snapshot(fields)
+                return
+            if self.processes > 1:
+                items = manifest.changed(self.__store) if manifest is not None else self.__store.items_bytes()
+                for id, values in self.__iter_parallel(items, fields):
+                    mapped_object = self.__build(id, values, fields)
+                    if mapped_object:
+                        yield mapped_object
+                return
+        items = manifest.changed(self.__store) if manifest is not None else self.__store.items_bytes()
+        for id, data in items:
+            # each item is decoded once, the mapper and the middleware share the decoded JSON
+            json_data = self.decode_item(id, data)
+            if json_data is None:
+                continue
+            mapped_object = self.map_item(id, json_data)
             if mapped_object:
+                for field in fields:
+                    setattr(mapped_object, field, json_data.get(field))
                 if middleware:
-                    # Pass the mapped object and the original JSON data to the middleware function
-                    with open(file_path, 'r') as f:
-                        json_data = json.load(f)
                     mapped_object = middleware(mapped_object, json_data)
-                object_list.append(mapped_object)
-        return object_list
+                yield mapped_object
+
+    def __build(self, id, values: tuple, fields: List[str]) -> T:
+        """Builds an object from the values of the mapped attributes followed by the values of the fields."""
+        attributes = len(self.__mapping)
+        try:
+            mapped_object = self.__cls(**dict(zip(self.__mapping, values[:attributes])))
+        except Exception as e:
+            print(f"Unexpected error while processing {id}: {e}")
+            return None
+        for field, value in zip(fields, values[attributes:]):
+            setattr(mapped_object, field, value)
+        return mapped_object
+
+    def __iter_snapshot(self, fields: List[str]) -> Iterator[T]:
+        """
+        Yields the objects from the snapshot of the folder, after taking the snapshot when the items changed
+        since, or when it misses one of the fields.
+        """
+        columns = [*(f"attribute_{attr}" for attr in self.__mapping), *(f"field_{field}" for field in fields)]
+        snapshot = ParsedSnapshot(self.__snapshot_path)
+        signature = store_signature(self.__store, self.__mapping)
+        batches = snapshot.load(signature, columns)
+        if batches is None:
+            print(f"Taking a snapshot of the parsed {self.__folder_name} items...")
+            if self.processes > 1:
+                rows = self.__iter_parallel(self.__store.items_bytes(), fields)
+            else:
+                rows = self.__iter_serial(fields)
+            snapshot.save(signature, ['id', *columns], self.__iter_column_batches(rows, columns))
+            batches = snapshot.load(signature, columns)
+        for batch in batches:
+            for id, *values in zip(batch['id'], *(batch[column] for column in columns)):
+                mapped_object = self.__build(id, values, fields)
+                if mapped_object:
+                    yield mapped_object
+
+    def __iter_column_batches(self, rows: Iterator[tuple[str, tuple]], columns: List[str]) \
+            -> Iterator[dict[str, list]]:
+        """Groups the rows of values in batches of `self.chunk_size` rows, each batch holding a list per column."""
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return
+            batch = {'id': [id for id, _ in chunk]}
+            for i, column in enumerate(columns):
+                batch[column] = [values[i] for _, values in chunk]
+            yield batch
+
+    def __iter_serial(self, fields: List[str]) -> Iterator[tuple[str, tuple]]:
+        for id, data in self.__store.items_bytes():
+            json_data = self.decode_item(id, data)
+            if json_data is None:
+                continue
+            try:
+                yield id, (*self.__mapper.map_values(json_data), *(json_data.get(field) for field in fields))
+            except Exception as e:
+                print(f"Unexpected error while processing {id}: {e}")
+
+    def __iter_parallel(self, items: Iterator[tuple[str, bytes]], fields: List[str]) -> Iterator[tuple[str, tuple]]:
+        """
+        Shards the items across `self.processes` worker processes, in chunks of `self.chunk_size` items. The
+        items are read sequentially in this process, the workers decode and map them and send back the values
+        of the mapped attributes and of the fields rather than pickled objects, in storage order.
+        """
+        with ProcessPoolExecutor(max_workers=self.processes) as executor:
+            futures = deque()
+            while True:
+                chunk = list(islice(items, self.chunk_size))
+                if chunk:
+                    futures.append(executor.submit(parse_chunk, self.__mapping, chunk, fields))
+                # a few chunks are kept in flight, in order, so memory is bounded by the chunks and not the store
+                while futures and (not chunk or len(futures) >= 2 * self.processes):
+                    yield from futures.popleft().result()
+                if not chunk:
+                    return
+
+    def iter_batches(self, n: int, middleware=None, manifest: ItemManifest | None = None,
+                     fields: List[str] | None = None) -> Iterator[List[T]]:
+        """
+        Parses the JSON items of `self.__store` as they are read, in batches.
+
+        Parameters:
+            n (int): The number of objects of each batch, the last batch may be smaller.
+
+        Yields:
+            A list of at most `n` instances of `self.__cls`.
+        """
+        batch = []
+        for mapped_object in self.iter(middleware, manifest, fields):
+            batch.append(mapped_object)
+            if len(batch) >= n:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def parse_item(self, id, data: bytes) -> T:
+        """
+          Parses the raw JSON of a single item into an instance of `self.__cls`.
+
+          Parameters:
+              id (str): The id of the item, used in the warnings.
+              data (bytes): The raw JSON of the item, as returned by the item store.
+
+          Returns:
+              An instance of `self.__cls` initialized with the JSON data. Returns None if the item
+              is empty, cannot be decoded, or an error occurs during parsing.
+          """
+        json_data = self.decode_item(id, data)
+        return self.map_item(id, json_data) if json_data is not None else None
+
+    def decode_item(self, id, data: bytes) -> Dict | None:
+        """
+          Decodes the raw JSON of a single item with the decoder selected by `JSON_DECODER`.
+
+          Parameters:
+              id (str): The id of the item, used in the warnings.
+              data (bytes): The raw JSON of the item.
+
+          Returns:
+              The decoded JSON. Returns None if the item is empty or cannot be decoded.
+          """
+        try:
+            json_data = json_loads(data)
+        except ValueError as e:
+            print(f"Error decoding JSON from {id}: {e}")
+            return None
+        if not json_data:  # Check if data is not empty
+            print(f"Warning: Empty JSON item skipped - {id}")
+            return None
+        return json_data
+
+    def map_item(self, id, json_data: Dict) -> T:
+        """
+          Maps the decoded JSON of a single item to an instance of `self.__cls`.
+
+          Parameters:
+              id (str): The id of the item, used in the warnings.
+              json_data (Dict): The decoded JSON of the item.
+
+          Returns:
+              An instance of `self.__cls`. Returns None if an error occurs during mapping.
+          """
+        try:
+            return self.__mapper.map(json_data, self.__cls)
+        except Exception as e:
+            print(f"Unexpected error while processing {id}: {e}")
+        return None
 
     def parse_single(self, file_path) -> T:
         """
@@ -128,14 +327,45 @@ class SpotifyParser:
               if the file is empty, cannot be decoded, or an error occurs during parsing.
           """
         try:
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-                if data:  # Check if data is not empty
-                    return self.__mapper.map(data, self.__cls)
-                else:
-                    print(f"Warning: Empty JSON file skipped - {file_path}")
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON from {file_path}: {e}")
+            with open(file_path, 'rb') as f:
+                data = f.read()
         except Exception as e:
             print(f"Unexpected error while processing {file_path}: {e}")
-        return None
+            return None
+        return self.parse_item(file_path, data)
+
+
+def parse_chunk(mapping: Dict[str, str], chunk: list[tuple[str, bytes]], fields: List[str] = ()) \
+        -> list[tuple[str, tuple]]:
+    """
+    Decodes and maps a chunk of items in a worker process of `SpotifyParser`.
+
+    Parameters:
+        mapping (Dict[str, str]): The mapping of the parser.
+        chunk (list[tuple[str, bytes]]): The ids and raw JSON of the items.
+        fields (List[str]): Top-level JSON fields whose values follow the values of the mapped attributes.
+
+    Returns:
+        The id and the values of the mapped attributes and of the fields of each item that could be parsed,
+        in the order of the chunk.
+    """
+    # the mapper is compiled once per worker process
+    key = json.dumps(mapping, sort_keys=True)
+    mapper = CHUNK_MAPPERS.get(key)
+    if mapper is None:
+        mapper = CHUNK_MAPPERS[key] = JsonToObjectMapper(mapping)
+    values = []
+    for id, data in chunk:
+        try:
+            json_data = json_loads(data)
+        except ValueError as e:
+            print(f"Error decoding JSON from {id}: {e}")
+            continue
+        if not json_data:
+            print(f"Warning: Empty JSON item skipped - {id}")
+            continue
+        try:
+            values.append((id, (*mapper.map_values(json_data), *(json_data.get(field) for field in fields))))
+        except Exception as e:
+            print(f"Unexpected error while processing {id}: {e}")
+    return values
@@ -0,0 +1,236 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterator
+
+from musicbrainz.loader import AliasLoader
+from musicbrainz.util import open_musicbrainz_registry
+from spotify.crawler import GraphCrawler
+from spotify.scraper import SpotifyScraper
+from spotify.util import open_id_registry, open_item_store
+from utility.id_registry import IdRegistry
+from utility.lease import ScrapeLease
+from utility.metrics import SCRAPE_METRICS
+from utility.rate_limiter import MUSICBRAINZ_RATE_LIMITER
+from utility.retry_queue import RetryQueue
+from utility.session import create_pooled_session
+from utility.token_pool import SPOTIFY_AUTH_TOKEN
+from utility.variables import SCRAPE_CONCURRENCY, SPOTIFY_CRAWL_EDGES, SPOTIFY_CRAWL_MAX_DEPTH, \
+    SPOTIFY_SCRAPE_BATCH_SIZES
+
+
+class ScrapeQueue:
+    """
+    Work queue of one endpoint of the scheduler: the pending ids and due retries of its registry, read in
+    batches as the scheduler needs them.
+
+    Once exhausted, the queue stays idle until `wake` is called because new ids were added to its registry.
+    """
+
+    def __init__(self, endpoint: str, api: str, retry_queue: RetryQueue, batch_size: int,
+                 scrape: Callable[[list[str]], tuple[list[str], tuple[int, int]]]):
+        """
+        Args:
+            endpoint (str): Endpoint of the queue, e.g. `tracks` or `aliases`.
+            api (str): Api whose rate budget and workers are used by the queue, `spotify` or `musicbrainz`.
+            retry_queue (RetryQueue): Retry queue of the registry of the endpoint.
+            batch_size (int): Number of ids per unit of work.
+            scrape (Callable): Scrapes a unit of work, returns the cached ids and the number of retried and
+                dead ids, see `SpotifyScraper.scrape_work`.
+        """
+        self.endpoint = endpoint
+        self.api = api
+        self.batch_size = batch_size
+        self.scrape = scrape
+        self.in_flight: set[str] = set()
+        self.counts = {'cached': 0, 'retried': 0, 'dead': 0}
+        self.__retry_queue = retry_queue
+        self.__work: Iterator[list[str]] | None = None
+        self.__idle = False
+
+    def wake(self):
+        self.__idle = False
+
+    def record_failure(self, unit: list[str], error: str) -> tuple[int, int]:
+        """Schedules the retry of a unit of work whose scrape raised, see `RetryQueue.record_failure`.
+
+        Returns:
+            tuple[int, int]: Number of ids scheduled for a retry and number of ids moved to the dead letters.
+        """
+        return self.__retry_queue.record_failure(unit, error)
+
+    def next_unit(self) -> list[str] | None:
+        """
+        Returns:
+            list[str] | None: Next batch of ids that are not being scraped already, None when the queue is idle.
+        """
+        while not self.__idle:
+            if self.__work is None:
+                self.__work = self.__retry_queue.iter_work(self.batch_size)
+            batch = next(self.__work, None)
+            if batch is None:
+                self.__work = None
+                self.__idle = True
+                break
+            # a new iteration starts over the pending ids, including the ones still in flight
+            unit = [id for id in batch if id not in self.in_flight]
+            if unit:
+                return unit
+        return None
+
+
+class ScrapeScheduler:
+    """
+    Runs the scrapes of every Spotify endpoint and of the MusicBrainz aliases in one process, instead of
+    one stage after the other.
+
+    Every api has its own pool of workers drawing from its rate limiters, so the total time is bounded
+    by the slowest api rather than the sum of the stages. Free workers always take the next unit of work of
+    the first endpoint of `SPOTIFY_SCRAPE_BATCH_SIZES` that has some, so playlists are scraped before the
+    tracks, artists and albums they reference. The ids discovered by the crawler and the names of the scraped
+    artists are fed to the queues of their endpoint while the scrape runs.
+    """
+
+    def __init__(self, concurrency: int = SCRAPE_CONCURRENCY, crawl_depth: int | None = SPOTIFY_CRAWL_MAX_DEPTH,
+                 aliases: bool = True, leased: bool = False):
+        """
+        Args:
+            concurrency (int, optional): Number of Spotify units of work in flight at once.
+                Defaults to SCRAPE_CONCURRENCY.
+            crawl_depth (int | None, optional): Depth up to which the scraped entities are crawled for new ids,
+                None disables the crawl. Defaults to SPOTIFY_CRAWL_MAX_DEPTH.
+            aliases (bool, optional): Also scrapes the MusicBrainz aliases of the scraped artists.
+                Defaults to True.
+            leased (bool, optional): Leases the pending ids, so several schedulers share the registries, see
+                `ScrapeLease`. Defaults to False.
+        """
+        self.__concurrency = max(1, concurrency)
+        self.__session = create_pooled_session(self.__concurrency)
+        # musicbrainz allows a single request per second, one worker keeps its budget busy
+        self.__workers = {'spotify': self.__concurrency, 'musicbrainz': 1}
+        self.__queues: dict[str, ScrapeQueue] = {}
+        self.__leases: list[ScrapeLease] = []
+        self.__stores = {endpoint: open_item_store(endpoint) for endpoint in SPOTIFY_SCRAPE_BATCH_SIZES}
+        for endpoint, batch_size in SPOTIFY_SCRAPE_BATCH_SIZES.items():
+            registry = open_id_registry(endpoint)
+            SCRAPE_METRICS.track_backlog(endpoint, registry.count_backlog)
+            scraper = SpotifyScraper(endpoint, session=self.__session, registry=registry,
+                                     store=self.__stores[endpoint])
+            self.__queues[endpoint] = ScrapeQueue(endpoint, 'spotify', self.__retry_queue(registry, leased),
+                                                  batch_size,
+                                                  lambda ids, scraper=scraper, batch_size=batch_size:
+                                                  scraper.scrape_work(ids, batch_size))
+        self.__alias_loader = None
+        if aliases:
+            self.__alias_loader = AliasLoader("aliases")
+            registry = open_musicbrainz_registry("aliases")
+            SCRAPE_METRICS.track_backlog('aliases', registry.count_backlog)
+            self.__queues['aliases'] = ScrapeQueue('aliases', 'musicbrainz', self.__retry_queue(registry, leased), 1,
+                                                   self.__alias_loader.scrape_work)
+        self.__crawler = GraphCrawler(crawl_depth, session=self.__session) if crawl_depth is not None else None
+        self.__crawl_due = self.__crawler is not None
+
+    def run(self) -> dict[str, dict[str, int]]:
+        """Scrapes until every queue is exhausted and no unit of work can discover new ids.
+
+        Returns:
+            dict[str, dict[str, int]]: Number of cached, retried and dead ids of each endpoint.
+        """
+        print(f"SCHEDULING {', '.join(endpoint.upper() for endpoint in self.__queues)} "
+              f"WITH {self.__concurrency} CONCURRENT REQUESTS")
+        executors = {api: ThreadPoolExecutor(max_workers=workers) for api, workers in self.__workers.items()}
+        # api of each running future, and the endpoint and ids of its unit of work, None for a crawl
+        running: dict[Future, tuple[str, tuple[str, list[str]] | None]] = {}
+        try:
+            while True:
+                self.__dispatch(executors, running)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    _, work = running.pop(future)
+                    self.__complete(future, work)
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True)
+            for lease in self.__leases:
+                lease.stop()
+            self.__session.close()
+
+        for endpoint, queue in self.__queues.items():
+            counts = queue.counts
+            print(f"{endpoint}: {counts['cached']} cached, {counts['retried']} ids scheduled for a retry, "
+                  f"{counts['dead']} ids moved to the dead letters.")
+        print(SPOTIFY_AUTH_TOKEN.summary())
+        print(MUSICBRAINZ_RATE_LIMITER.summary())
+        return {endpoint: queue.counts for endpoint, queue in self.__queues.items()}
+
+    def __retry_queue(self, registry: IdRegistry, leased: bool) -> RetryQueue:
+        if not leased:
+            return RetryQueue(registry)
+        lease = ScrapeLease(registry)
+        self.__leases.append(lease)
+        return RetryQueue(registry, lease=lease)
+
+    def __dispatch(self, executors: dict[str, ThreadPoolExecutor], running: dict[Future, tuple]):
+        for api, workers in self.__workers.items():
+            busy = sum(1 for running_api, _ in running.values() if running_api == api)
+            while busy < workers:
+                queue, unit = self.__next_unit(api)
+                if unit is None:
+                    break
+                queue.in_flight.update(unit)
+                running[executors[api].submit(queue.scrape, unit)] = (api, (queue.endpoint, unit))
+                busy += 1
+        # the crawl takes a spotify worker, a single crawl runs at a time and expands the entities cached
+        # since the previous one
+        crawl_running = any(work is None for _, work in running.values())
+        if self.__crawl_due and not crawl_running:
+            busy = sum(1 for running_api, _ in running.values() if running_api == 'spotify')
+            if busy < self.__workers['spotify']:
+                self.__crawl_due = False
+                running[executors['spotify'].submit(self.__crawler.crawl)] = ('spotify', None)
+
+    def __next_unit(self, api: str) -> tuple[ScrapeQueue | None, list[str] | None]:
+        for queue in self.__queues.values():
+            if queue.api != api:
+                continue
+            unit = queue.next_unit()
+            if unit is not None:
+                return queue, unit
+        return None, None
+
+    def __complete(self, future: Future, work: tuple[str, list[str]] | None):
+        if work is None:
+            try:
+                discovered = future.result()
+            except Exception as e:
+                # the other queues keep draining, the next cached unit of work schedules a new crawl
+                print(f"Error while crawling the cached entities: {e!r}")
+                return
+            for endpoint, count in discovered.items():
+                if count > 0:
+                    print(f"Discovered {count} new {endpoint} ids")
+                    self.__queues[endpoint].wake()
+            return
+
+        endpoint, unit = work
+        queue = self.__queues[endpoint]
+        queue.in_flight.difference_update(unit)
+        try:
+            cached_ids, (retried, dead) = future.result()
+        except Exception as e:
+            # the ids are retried like the ids of a failed request, the other units keep draining
+            print(f"Error while scraping {len(unit)} {endpoint} ids: {e!r}")
+            cached_ids = []
+            retried, dead = queue.record_failure(unit, repr(e))
+        queue.counts['cached'] += len(cached_ids)
+        queue.counts['retried'] += retried
+        queue.counts['dead'] += dead
+        if not cached_ids:
+            return
+        if self.__crawler is not None and endpoint in SPOTIFY_CRAWL_EDGES:
+            self.__crawl_due = True
+        if endpoint == 'artists' and self.__alias_loader is not None:
+            store = self.__stores['artists']
+            added = self.__alias_loader.add_artists(store.get(id) for id in cached_ids)
+            if added > 0:
+                self.__queues['aliases'].wake()
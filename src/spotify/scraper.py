@@ -1,20 +1,20 @@
 import string
 from typing import Iterable
-from spotify.util import setup_spotify_folders
-from utility.auth_token import SPOTIFY_AUTH_TOKEN
-from utility.utility import is_success_code, send_request_with_wait
-import pandas as pd
+from spotify.fields import build_fields_filter
+from spotify.paginator import PaginationExpander
+from spotify.util import open_id_registry, open_item_store, setup_spotify_folders
+from utility.token_pool import SPOTIFY_AUTH_TOKEN
+from utility.id_registry import IdRegistry
+from utility.item_store import ItemStore
+from utility.lease import ScrapeLease
+from utility.metrics import SCRAPE_METRICS
+from utility.retry_queue import RetryQueue
+from utility.utility import is_success_code
 import requests
 from requests import Response
-import os
-from os.path import join as joinpath
-import json
-from pathlib import Path
-import random
-import time
 import random
 
-from utility.variables import DATA_PATH, SLEEP_TIMER_AVG, SPOTIFY_API_URL
+from utility.variables import SPOTIFY_API_URL, SPOTIFY_PAGINATED_FIELDS, SPOTIFY_UNCHANGED_RESPONSE_CODE
 
 # sample curl request of a playlist
 """
@@ -26,88 +26,120 @@ curl --request GET \
 
 class SpotifyScraper:
 
-    def __init__(self, endpoint: str):
+    def __init__(self, endpoint: str, session: requests.Session | None = None, registry: IdRegistry | None = None,
+                 store: ItemStore | None = None, leased: bool = False):
         self.__endpoint = endpoint
+        # reuse the same connections across requests, a pooled session can be shared between threads
+        self.__session = session if session is not None else requests.Session()
         self.__data_path, self.__csv_file_path, self.__items_folder_path, _ = setup_spotify_folders(endpoint)
+        self.__registry = registry if registry is not None else open_id_registry(endpoint)
+        # leased scrapes share the registry with the other workers scraping the endpoint
+        self.__lease = ScrapeLease(self.__registry) if leased else None
+        self.__retry_queue = RetryQueue(self.__registry, lease=self.__lease)
+        self.__store = store if store is not None else open_item_store(endpoint)
+        # only request the fields read by the mapping and the loaders, None requests the items whole
+        fields_filter = build_fields_filter(endpoint)
+        self.__fields = fields_filter.to_param() if fields_filter is not None else None
+        # playlists, albums and audiobooks only hold the first page of their tracks or chapters
+        self.__paginator = None
+        if PaginationExpander.is_paginated(endpoint):
+            page_filter = fields_filter.subfilter(SPOTIFY_PAGINATED_FIELDS[endpoint]) \
+                if fields_filter is not None else None
+            self.__paginator = PaginationExpander(endpoint, session=self.__session,
+                                                  fields=page_filter.to_param() if page_filter is not None else None)
 
     def scrape_items(self, batchmode: int = 1):
-        """Scrapes items using ids defined in csv file
+        """Scrapes the pending items of the id registry
 
         Args:
             batchmode (bool, optional): Performs batchmode scraping request. Defaults to False.
         """
-        if batchmode > 1:
-            self.scrape_batch_items(batchmode)
-        else:
-            self.scrape_nonbatch_items()
-
-    def __update_df_with_fs(self):
-        # read from csv
-        df = pd.read_csv(self.__csv_file_path)
-        # drop duplicates
-        df.drop_duplicates(subset=['ID'], inplace=True)
-        # find all uncached items
-        # not_cached = set()
-        # for _, row in df.iterrows():
-        #     if not os.path.exists(joinpath(self.__items_folder_path, f"{row['ID']}.json")):
-        #         not_cached.add(row['ID'])
-        filtered_files = filter(lambda f: f.endswith(".json"), os.listdir(self.__items_folder_path))
-        mapper = map(lambda id: id.replace(".json", ""), filtered_files)
-        ids = set(mapper)
-        df.loc[~df['ID'].isin(ids), 'CACHED'] = False
-        df.loc[df['ID'].isin(ids), 'CACHED'] = True
-        df.to_csv(self.__csv_file_path, index=False)
-        return df
+        SCRAPE_METRICS.track_backlog(self.__endpoint, self.__registry.count_backlog)
+        try:
+            if batchmode > 1:
+                self.scrape_batch_items(batchmode)
+            else:
+                self.scrape_nonbatch_items()
+        finally:
+            if self.__lease is not None:
+                self.__lease.stop()
 
     def scrape_nonbatch_items(self):
-        """Scrapes items without using batchmode requests. Performs a request for each ids in the csv file.
-        The function stores the output of the request in a json file.
+        """Scrapes items without using batchmode requests. Performs a request for each pending id of the registry,
+        interleaved with the failed ids whose retry is due.
+        The function stores the output of the request in the item store and records the state of each id as it goes.
         The function skips all ids that are cached.
-
-        Raises:
-            Exception: An exception is the code is neither 429 or a success code.
         """
-        timer = 0
-
         print(f'SCRAPING {self.__endpoint.upper()}')
-        # read csv file
-        df = self.__update_df_with_fs()
-        # get all uncached items
-        uncached_items_df = df[df['CACHED'] == False]
-        error_request = set()
-        for _, row in uncached_items_df.iterrows():
-            id = row['ID']
-            item_file_path = joinpath(self.__items_folder_path, f"{id}.json")
-
-            print(f"Running timer of {timer} seconds ...")
-            time.sleep(timer)
-
-            # if we exceed time limit, re scrape after time sleep
-            res = send_request_with_wait(SpotifyScraper.scrape_single_id, self, id)
-
-            # gives a random time to sleep between 0 and SLEEP_TIMER_AVG
-            # timer = random.random()*SLEEP_TIMER_AVG*2
-            timer = SLEEP_TIMER_AVG
-
-            # check if we still have a success code
-            if not is_success_code(res.status_code):
-                error_request.add(id)
-                print(f"Status error code while fetching {id}: {res.status_code}\n{res.json()}")
-                continue
+        retried, dead = 0, 0
+        for (id,) in self.__retry_queue.iter_work(1):
+            _, counts = self.scrape_work([id])
+            retried, dead = retried + counts[0], dead + counts[1]
 
-            print(f"Successfully scraped {id}: {res.status_code}")
-            # dump playlist data in its own file
-            with open(item_file_path, "w") as f:
-                json.dump(res.json(), f, indent=2)
+        print(f"\nScraping complete, {retried} ids scheduled for a retry, {dead} ids moved to the dead letters.")
+        print(SPOTIFY_AUTH_TOKEN.summary())
 
-        df = df[~df['ID'].isin(error_request)]
-        df['CACHED'] = True
-        df.to_csv(self.__csv_file_path, index=False)
-        print(f"\nScraping complete, total ids with error: {len(error_request)}")
-        print(f"Removed ids with error request: {'\n'.join(error_request)}")
+    def scrape_work(self, ids: list[str], batchmode: int = 1) -> tuple[list[str], tuple[int, int]]:
+        """Scrapes one unit of work, a single id or a batch of ids, stores the scraped items and records the
+        state of every id in the registry. The scrape loops and the `ScrapeScheduler` are built on it.
+
+        Args:
+            ids (list[str]): Ids to scrape, a single id when `batchmode` is 1.
+            batchmode (int, optional): Number of ids sent per request. Defaults to 1.
+
+        Returns:
+            tuple[list[str], tuple[int, int]]: Ids cached by the scrape, and the number of ids scheduled for a
+                retry and moved to the dead letters.
+        """
+        if batchmode > 1:
+            cached_ids, counts = self.__scrape_batch(ids)
+        else:
+            cached_ids, retried, dead = [], 0, 0
+            for id in ids:
+                cached, counts = self.__scrape_single(id)
+                cached_ids.extend(cached)
+                retried, dead = retried + counts[0], dead + counts[1]
+            counts = (retried, dead)
+        SCRAPE_METRICS.record_items(self.__endpoint, len(cached_ids))
+        return cached_ids, counts
+
+    def __scrape_single(self, id: str) -> tuple[list[str], tuple[int, int]]:
+        try:
+            # wait for the shared rate limiter, if we exceed time limit, re scrape after time sleep
+            res = SPOTIFY_AUTH_TOKEN.send_request(SpotifyScraper.scrape_single_id, self, id, endpoint=self.__endpoint)
+        except requests.RequestException as e:
+            print(f"Request error while fetching {id}: {e}")
+            return [], self.__retry_queue.record_failure([id], str(e))
+
+        # the stored item is still up to date
+        if res.status_code == SPOTIFY_UNCHANGED_RESPONSE_CODE:
+            print(f"Unchanged {id}: {res.status_code}")
+            self.__registry.mark_cached([id])
+            return [id], (0, 0)
+
+        # check if we still have a success code
+        if not is_success_code(res.status_code):
+            print(f"Status error code while fetching {id}: {res.status_code}\n{res.text}")
+            return [], self.__retry_queue.record_status_failure([id], res.status_code, res.text)
+
+        # store the raw response, the item store decides how it is serialized
+        item = res.content
+        if self.__paginator is not None:
+            try:
+                item = self.expand_pages(res.json())
+            except requests.RequestException as e:
+                print(f"Request error while fetching the pages of {id}: {e}")
+                return [], self.__retry_queue.record_failure([id], str(e))
+
+        print(f"Successfully scraped {id}: {res.status_code}")
+        self.__store.put(id, item)
+        self.__registry.mark_cached([id])
+        self.record_validators(id, res, item)
+        return [id], (0, 0)
 
     def scrape_single_id(self, id: str) -> Response:
-        """Scrapes the response of a single id for an item
+        """Scrapes the response of a single id for an item. When the item is already stored with an ETag, the
+        request is conditional and the api answers 304 if the item has not changed.
 
         Args:
             id (str): Id of the item to be scraped.
@@ -119,87 +151,150 @@ class SpotifyScraper:
         headers = {
             'Authorization': f"{SPOTIFY_AUTH_TOKEN.get_authorization()}"
         }
-        res = requests.get(url=URL, headers=headers)
+        etag, _ = self.__registry.get_validators(id)
+        if etag and id in self.__store:
+            headers['If-None-Match'] = etag
+        params = {'fields': self.__fields} if self.__fields is not None else None
+        res = self.__session.get(url=URL, headers=headers, params=params)
         return res
 
     def scrape_batch_items(self, batchmode):
-        """_summary_
+        """Scrapes the pending ids of the registry with batch requests of `batchmode` ids, interleaved with
+        batches of the failed ids whose retry is due.
+        The function stores each item in the item store and records the state of each id as it goes.
 
-        Raises:
-            Exception: _description_
+        Args:
+            batchmode (int): Maximum number of ids sent per request.
         """
         print(f'SCRAPING {self.__endpoint.upper()}')
-        # read csv file
-        df = self.__update_df_with_fs()
-        # get the uncached items
-        uncached_items_df = df[df['CACHED'] == False].copy()
-        error_request = set()
-        timer = 0
-
-        while (len(uncached_items_df) != 0):
-            # get the batch of ids to send in request
-            batch_items_df = uncached_items_df[:batchmode]
-            batch_ids = set(batch_items_df['ID'].to_list())
-            uncached_items_df.drop(batch_items_df.index, inplace=True)
-
-            # send the batch request and check status codes
-            print(f"Running timer of {timer} seconds ...")
-            time.sleep(timer)
-
-            res = send_request_with_wait(SpotifyScraper.scrape_batch_ids, self, batch_ids)
-
-            # timer = random.random()*SLEEP_TIMER_AVG*2
-            timer = SLEEP_TIMER_AVG
-            # send request without batch, by sending a request 1 by 1
-            if not is_success_code(res.status_code):
-                print(f"Status error code {res.status_code} while fetching:\n{str(res.content)}")
-                print("Fetching in non batchmode for this batch")
-                items = {
-                    self.__endpoint: []
-                }
-                for batch_id in batch_ids:
-
-                    print(f"Running timer of {timer} seconds ...")
-                    time.sleep(timer)
-
-                    res = send_request_with_wait(SpotifyScraper.scrape_single_id, self, batch_id)
-
-                    # Set the timer for the next round
-                    # timer = random.random()*SLEEP_TIMER_AVG*2
-                    timer = SLEEP_TIMER_AVG
-
-                    if not is_success_code(res.status_code):
-                        print(f"Status error code while fetching {batch_id}: {res.status_code}\n{res.json()}")
-                        continue
-                    items[self.__endpoint].append(res.json())
-            else:
-                # get the json response
-                items = res.json()
-
-            # store each scraped item in its folder.
-            for item in items[self.__endpoint]:
-                # skip the null ones
-                if (item is None):
-                    continue
-                id = item['id']
-                item_file_path = joinpath(self.__items_folder_path, f"{id}.json")
-                print(f"Successfully scraped {id}: {res.status_code}.")
-                # dump playlist data in its own file
-                with open(item_file_path, "w") as f:
-                    json.dump(item, f, indent=2)
-                if id in batch_ids:
-                    batch_ids.remove(id)
-            # log all missing ids from that batch request
-            for missing_id in batch_ids:
-                f"Response is missing {missing_id} in batch request."
-
-            error_request.union(batch_ids)
-
-        df = df[~df['ID'].isin(error_request)]
-        df['CACHED'] = True
-        df.to_csv(self.__csv_file_path, index=False)
-        print(f"\nScraping complete, total ids with error: {len(error_request)}")
-        print(f"Removed ids with error request: {'\n'.join(error_request)}")
+        retried, dead = 0, 0
+
+        for batch in self.__retry_queue.iter_work(batchmode):
+            _, counts = self.scrape_work(batch, batchmode)
+            retried, dead = retried + counts[0], dead + counts[1]
+
+        print(f"\nScraping complete, {retried} ids scheduled for a retry, {dead} ids moved to the dead letters.")
+        print(SPOTIFY_AUTH_TOKEN.summary())
+
+    def __scrape_batch(self, batch: list[str]) -> tuple[list[str], tuple[int, int]]:
+        retried, dead = 0, 0
+        batch_ids = set(batch)
+        try:
+            # send the batch request, failing batches are split until the bad ids are isolated
+            items, bad_ids = self.scrape_batch_with_split(batch)
+        except requests.RequestException as e:
+            print(f"Request error while fetching {len(batch)} ids: {e}")
+            return [], self.__retry_queue.record_failure(batch, str(e))
+        except (ValueError, KeyError) as e:
+            # a successful response whose body is not the expected json fails the batch, not the run
+            print(f"Unexpected response while fetching {len(batch)} ids: {e!r}")
+            return [], self.__retry_queue.record_failure(batch, f"unexpected response: {e!r}")
+
+        # store each scraped item in its folder.
+        cached_ids = []
+        for item in items:
+            id = item['id']
+            batch_ids.discard(id)
+            try:
+                self.expand_pages(item)
+            except requests.RequestException as e:
+                print(f"Request error while fetching the pages of {id}: {e}")
+                retried += self.__retry_queue.record_failure([id], str(e))[0]
+                continue
+            print(f"Successfully scraped {id}.")
+            # dump playlist data in the item store
+            self.__store.put(id, item)
+            self.record_validators(id, None, item)
+            cached_ids.append(id)
+        self.__registry.mark_cached(cached_ids)
+
+        # the status code of the isolated ids decides whether they are retried
+        for id, status_code in bad_ids.items():
+            counts = self.__retry_queue.record_status_failure([id], status_code, "isolated by failing batch")
+            retried, dead = retried + counts[0], dead + counts[1]
+        # log all missing ids from that batch request
+        missing_ids = batch_ids.difference(bad_ids)
+        for missing_id in missing_ids:
+            print(f"Response is missing {missing_id} in batch request.")
+        retried += self.__retry_queue.record_failure(missing_ids, "missing from batch response")[0]
+        return cached_ids, (retried, dead)
+
+    def scrape_batch_with_split(self, ids: list[str]) -> tuple[list[dict], dict[str, int]]:
+        """Scrapes a batch of ids. When the batch request fails, the batch is split in halves recursively
+        until the failing ids are isolated, so healthy ids keep being fetched in batches and each bad id
+        costs O(log batch) requests instead of one request per id of the batch.
+
+        Args:
+            ids (list[str]): Ids of the batch.
+
+        Returns:
+            tuple[list[dict], dict[str, int]]: Scraped items, and the ids isolated as failing with the status code
+                of their request.
+        """
+        res = SPOTIFY_AUTH_TOKEN.send_request(SpotifyScraper.scrape_batch_ids, self, ids, endpoint=self.__endpoint)
+        if is_success_code(res.status_code):
+            # skip the null ones
+            return [item for item in res.json()[self.__endpoint] if item is not None], {}
+
+        if len(ids) == 1:
+            print(f"Status error code while fetching {ids[0]}: {res.status_code}\n{res.text}")
+            return [], {ids[0]: res.status_code}
+
+        print(f"Status error code {res.status_code} while fetching {len(ids)} ids, splitting the batch")
+        middle = len(ids) // 2
+        left_items, left_bad_ids = self.scrape_batch_with_split(ids[:middle])
+        right_items, right_bad_ids = self.scrape_batch_with_split(ids[middle:])
+        return left_items + right_items, left_bad_ids | right_bad_ids
+
+    def expand_pages(self, item: dict) -> dict:
+        """Fetches the remaining pages of the tracks or chapters of an item and merges them into the item.
+
+        Args:
+            item (dict): Item returned by the API, modified in place.
+
+        Raises:
+            requests.RequestException: A page could not be fetched.
+
+        Returns:
+            dict: The expanded item.
+        """
+        if self.__paginator is not None and self.__paginator.needs_expansion(item):
+            if self.__reuse_stored_pages(item):
+                print(f"Snapshot of {item['id']} is unchanged, reusing its stored pages.")
+                return item
+            pages = self.__paginator.expand(item)
+            print(f"Fetched {pages} more pages of {item['id']}.")
+        return item
+
+    def __reuse_stored_pages(self, item: dict) -> bool:
+        # the snapshot id of a playlist changes whenever its tracks change
+        snapshot_id = item.get('snapshot_id')
+        if snapshot_id is None or self.__registry.get_validators(item['id'])[1] != snapshot_id:
+            return False
+        stored = self.__store.get(item['id'])
+        field = SPOTIFY_PAGINATED_FIELDS[self.__endpoint]
+        if stored is None or field not in stored:
+            return False
+        item[field] = stored[field]
+        return True
+
+    def record_validators(self, id: str, res: Response | None, item: dict | bytes):
+        """Keeps the ETag of the response and the snapshot id of a stored item, the next refresh of the item
+        sends a conditional request and reuses its pages if the snapshot is unchanged.
+
+        A batch response has a single ETag for all of its items and the batch requests are not conditional,
+        so only the snapshot id of the items of a batch is kept: the endpoints scraped in batches cannot be
+        revalidated, see `SPOTIFY_REVALIDATED_ENDPOINTS`.
+
+        Args:
+            id (str): Id of the stored item.
+            res (Response | None): Response of the item, None for the items of a batch response.
+            item (dict | bytes): Stored item.
+        """
+        etag = res.headers.get('ETag') if res is not None else None
+        snapshot_id = item.get('snapshot_id') if isinstance(item, dict) else None
+        if etag or snapshot_id:
+            self.__registry.set_validators([(id, etag, snapshot_id)])
 
     def scrape_batch_ids(self, ids: Iterable[str]):
         """_summary_
@@ -213,7 +308,7 @@ class SpotifyScraper:
         headers = {
             'Authorization': f"{SPOTIFY_AUTH_TOKEN.get_authorization()}"
         }
-        res = requests.get(url=URL, headers=headers, params=PARAMS)
+        res = self.__session.get(url=URL, headers=headers, params=PARAMS)
         return res
 
     def generate_random_string(self, length):
@@ -227,11 +322,10 @@ class SpotifyScraper:
         # URL = "https://api.spotify.com/v1/browse/featured-playlists?offset=99&limit=50"
         URL = "https://api.spotify.com/v1/browse/categories/blues/playlists?offset=50&limit=50"
         playlist_list = []
-        headers = {
+        # Make a GET request to Spotify API, with the credential selected by the token pool
+        response = SPOTIFY_AUTH_TOKEN.send_request(lambda: self.__session.get(URL, headers={
             'Authorization': f"{SPOTIFY_AUTH_TOKEN.get_authorization()}"
-        }
-        # Make a GET request to Spotify API
-        response = requests.get(URL, headers=headers)
+        }))
 
         if response.status_code == 200:
             # Extract playlist IDs from the response
@@ -269,11 +363,10 @@ class SpotifyScraper:
             "sort": "popularity"  # Sort by popularity
         }
 
-        headers = {
+        # Make a GET request to Spotify API, with the credential selected by the token pool
+        response = SPOTIFY_AUTH_TOKEN.send_request(lambda: self.__session.get(URL, params=params, headers={
             'Authorization': f"{SPOTIFY_AUTH_TOKEN.get_authorization()}"
-        }
-        # Make a GET request to Spotify API
-        response = requests.get(URL, params=params, headers=headers)
+        }))
 
         if response.status_code == 200:
             # Extract artist IDs from the response
@@ -0,0 +1,221 @@
+import csv
+import json
+import os
+import string
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from os.path import abspath, exists, join as joinpath
+from pathlib import Path
+
+import requests
+from requests import Response
+
+from spotify.util import open_id_registry
+from utility.session import create_pooled_session
+from utility.token_pool import SPOTIFY_AUTH_TOKEN
+from utility.utility import is_success_code
+from utility.variables import SCRAPE_CONCURRENCY, SPOTIFY_API_URL, SPOTIFY_DATA_PATH, SPOTIFY_SEARCH_OFFSET_CAP, \
+    SPOTIFY_SEARCH_PAGE_LIMIT, SPOTIFY_SEARCH_TYPES
+
+
+class SearchShard:
+    """
+    Slice of the search space: a query sent to `/search` for a single item type. The api never returns more
+    than `SPOTIFY_SEARCH_OFFSET_CAP` results per query, so a large catalogue is only reachable through many
+    narrow shards.
+    """
+
+    def __init__(self, query: str, type: str):
+        """
+        Args:
+            query (str): Search query, e.g. `ab`, `genre:"rock"` or `year:1990-1994`.
+            type (str): Item type searched, one of the keys of `SPOTIFY_SEARCH_TYPES`.
+        """
+        self.query = query
+        self.type = type
+
+    @property
+    def key(self) -> str:
+        return f"{self.type}|{self.query}"
+
+    def __repr__(self):
+        return f"SearchShard({self.query!r}, {self.type!r})"
+
+
+def generate_shards(types: list[str], prefix_length: int = 1, genres: list[str] | None = None,
+                    year_step: int = 5, first_year: int = 1950) -> list[SearchShard]:
+    """Splits the search space of each item type into prefix, genre and year-range shards.
+
+    Args:
+        types (list[str]): Item types to search, e.g. `['artist', 'album']`.
+        prefix_length (int, optional): Length of the prefix queries, 2 gives 36 times more shards than 1.
+            Defaults to 1.
+        genres (list[str], optional): Genres used as filters of the artist shards. Defaults to None, for the
+            genres collected in `genres.csv` by `load_genres`.
+        year_step (int, optional): Number of years per year-range shard. Defaults to 5.
+        first_year (int, optional): First year of the year-range shards. Defaults to 1950.
+
+    Returns:
+        list[SearchShard]: Shards of every item type.
+    """
+    alphabet = string.ascii_lowercase + string.digits
+    prefixes = list(alphabet)
+    for _ in range(prefix_length - 1):
+        prefixes = [prefix + character for prefix in prefixes for character in alphabet]
+    if genres is None:
+        genres = load_genre_names()
+    current_year = datetime.now().year
+    year_ranges = [f"{year}-{min(year + year_step - 1, current_year)}"
+                   for year in range(first_year, current_year + 1, year_step)]
+
+    shards = []
+    for type in types:
+        shards.extend(SearchShard(prefix, type) for prefix in prefixes)
+        # playlists have no genre or year filters
+        if type == 'artist':
+            shards.extend(SearchShard(f'genre:"{genre}"', type) for genre in genres)
+        if type in ('artist', 'album'):
+            shards.extend(SearchShard(f"year:{year_range}", type) for year_range in year_ranges)
+    return shards
+
+
+def load_genre_names() -> list[str]:
+    csv_genres_path = abspath(joinpath(SPOTIFY_DATA_PATH, 'genres', 'genres.csv'))
+    if not exists(csv_genres_path):
+        return []
+    with open(csv_genres_path, newline='') as f:
+        return [row['GENRES'] for row in csv.DictReader(f) if row.get('GENRES')]
+
+
+class SearchEnumerator:
+    """
+    Seeds the id registries from the search api. Every shard is paged up to the offset cap of the api, the
+    shards are enumerated concurrently within the rate budget of the token pool, and the ids are deduplicated
+    by the registries of their endpoint. The first page of a shard gives the total of its results, its
+    remaining pages are then fetched concurrently.
+
+    The statistics of each shard are kept in `shards.json`. Shards without results, or that yielded fewer new
+    ids than `min_new_ids` on their first complete run, i.e. that only overlap other shards, are pruned from
+    the next runs. The yield of the later runs is not used, the registries already hold the ids of the
+    previous runs so it is 0 for every shard whose results did not change.
+    """
+
+    def __init__(self, concurrency: int = SCRAPE_CONCURRENCY, min_new_ids: int = 1):
+        """
+        Args:
+            concurrency (int, optional): Number of shards enumerated at once. Defaults to SCRAPE_CONCURRENCY.
+            min_new_ids (int, optional): Shards that yielded fewer new ids on their first complete run are
+                skipped. Defaults to 1.
+        """
+        self.__concurrency = max(1, concurrency)
+        self.__min_new_ids = min_new_ids
+        # the first pages of the shards and the remaining pages of a shard are in flight at the same time
+        self.__session = create_pooled_session(2 * self.__concurrency)
+        self.__page_executor: ThreadPoolExecutor | None = None
+        self.__registries = {type: open_id_registry(endpoint) for type, endpoint in SPOTIFY_SEARCH_TYPES.items()}
+        data_path = abspath(joinpath(SPOTIFY_DATA_PATH, 'search'))
+        Path(data_path).mkdir(parents=True, exist_ok=True)
+        self.__stats_path = joinpath(data_path, 'shards.json')
+        self.__stats = self.__load_stats()
+
+    def enumerate(self, shards: list[SearchShard], include_pruned: bool = False) -> dict[str, int]:
+        """Pages every shard and adds the ids found to the registries.
+
+        Args:
+            shards (list[SearchShard]): Shards to enumerate.
+            include_pruned (bool, optional): Also enumerates the shards pruned by a previous run. Defaults to False.
+
+        Returns:
+            dict[str, int]: Number of new ids of each endpoint.
+        """
+        if not include_pruned:
+            pruned = [shard for shard in shards if self.is_pruned(shard)]
+            if pruned:
+                print(f"Skipping {len(pruned)} pruned shards.")
+            shards = [shard for shard in shards if not self.is_pruned(shard)]
+        print(f'ENUMERATING {len(shards)} SEARCH SHARDS WITH {self.__concurrency} CONCURRENT REQUESTS')
+        new_ids = dict.fromkeys(SPOTIFY_SEARCH_TYPES.values(), 0)
+        # the shard workers only wait for pages of the page executor, which never waits, so no worker deadlocks
+        with ThreadPoolExecutor(max_workers=self.__concurrency) as page_executor, \
+                ThreadPoolExecutor(max_workers=self.__concurrency) as executor:
+            self.__page_executor = page_executor
+            for shard, stats in zip(shards, executor.map(self.__enumerate_shard, shards)):
+                previous = self.__stats.get(shard.key)
+                if previous is not None and 'first_new_ids' in previous:
+                    stats['first_new_ids'] = previous['first_new_ids']
+                elif stats['complete']:
+                    stats['first_new_ids'] = stats['new_ids']
+                self.__stats[shard.key] = stats
+                new_ids[SPOTIFY_SEARCH_TYPES[shard.type]] += stats['new_ids']
+                print(f"Shard {shard.type} {shard.query}: {stats['new_ids']} new ids out of {stats['ids']} "
+                      f"in {stats['pages']} pages.")
+        self.__page_executor = None
+        self.__store_stats()
+        print(SPOTIFY_AUTH_TOKEN.summary())
+        return new_ids
+
+    def is_pruned(self, shard: SearchShard) -> bool:
+        stats = self.__stats.get(shard.key)
+        # a shard interrupted by an error on its first run is never pruned, its yield is unknown
+        if stats is None or 'first_new_ids' not in stats:
+            return False
+        return stats['total'] == 0 or stats['first_new_ids'] < self.__min_new_ids
+
+    def __enumerate_shard(self, shard: SearchShard) -> dict:
+        registry = self.__registries[shard.type]
+        ids, pages, new_ids = 0, 0, 0
+        complete = True
+        # the first page gives the total of the shard, the remaining pages are then fetched concurrently
+        try:
+            first_page = self.__search(shard, 0)
+        except requests.RequestException as e:
+            print(f"Request error while searching {shard.type} {shard.query} at offset 0: {e}")
+            return {'pages': 0, 'ids': 0, 'new_ids': 0, 'total': None, 'complete': False, 'last_run': time.time()}
+        total = first_page['total']
+        offsets = range(SPOTIFY_SEARCH_PAGE_LIMIT, min(total, SPOTIFY_SEARCH_OFFSET_CAP), SPOTIFY_SEARCH_PAGE_LIMIT)
+        futures = {offset: self.__page_executor.submit(self.__search, shard, offset) for offset in offsets}
+        shard_pages = [first_page]
+        for offset, future in futures.items():
+            try:
+                shard_pages.append(future.result())
+            except requests.RequestException as e:
+                print(f"Request error while searching {shard.type} {shard.query} at offset {offset}: {e}")
+                complete = False
+        for page in shard_pages:
+            pages += 1
+            page_ids = [item['id'] for item in page['items'] if item is not None]
+            ids += len(page_ids)
+            new_ids += registry.add_ids(page_ids)
+        return {'pages': pages, 'ids': ids, 'new_ids': new_ids, 'total': total, 'complete': complete,
+                'last_run': time.time()}
+
+    def __search(self, shard: SearchShard, offset: int) -> dict:
+        params = {
+            "q": shard.query,
+            "type": shard.type,
+            "limit": SPOTIFY_SEARCH_PAGE_LIMIT,
+            "offset": offset,
+        }
+        res = SPOTIFY_AUTH_TOKEN.send_request(self.__send_request, params, endpoint="search")
+        if not is_success_code(res.status_code):
+            raise requests.HTTPError(f"Status error code {res.status_code}\n{res.text}", response=res)
+        return res.json()[f"{shard.type}s"]
+
+    def __send_request(self, params: dict) -> Response:
+        headers = {
+            'Authorization': f"{SPOTIFY_AUTH_TOKEN.get_authorization()}"
+        }
+        return self.__session.get(url=f"{SPOTIFY_API_URL}/search", params=params, headers=headers)
+
+    def __load_stats(self) -> dict:
+        if not os.path.exists(self.__stats_path):
+            return {}
+        with open(self.__stats_path, "r") as f:
+            return json.load(f)
+
+    def __store_stats(self):
+        tmp_path = f"{self.__stats_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.__stats, f, indent=2)
+        os.replace(tmp_path, self.__stats_path)
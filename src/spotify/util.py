@@ -1,9 +1,15 @@
+import json
 import os
 from os.path import join as joinpath, abspath
 from pathlib import Path
 
-from utility.variables import SPOTIFY_DATA_PATH, SPOTIFY_ITEMS_CSV_NAME, SPOTIFY_ITEMS_FOLDER_NAME, \
-    SPOTIFY_MAPPING_FILE_NAME
+from utility.id_registry import IdRegistry
+from utility.manifest import ItemManifest
+from utility.item_store import FolderItemStore, ItemStore, PackedItemStore, is_packed_store, \
+    migrate_folder_to_packed
+from utility.variables import ITEM_STORE_BACKEND, ITEM_STORE_COMPRESSION, SPOTIFY_DATA_PATH, SPOTIFY_ITEMS_CSV_NAME, \
+    SPOTIFY_ITEMS_FOLDER_NAME, SPOTIFY_ITEMS_REGISTRY_NAME, SPOTIFY_MANIFESTS_FOLDER_NAME, SPOTIFY_MAPPING_FILE_NAME, \
+    SPOTIFY_PACKED_FOLDER_NAME
 
 
 def setup_spotify_folders(endpoint, source_data_path=None, create_ids_csv=True) -> tuple[str | bytes, str, str | bytes, str]:
@@ -24,3 +30,95 @@ def setup_spotify_folders(endpoint, source_data_path=None, create_ids_csv=True)
         # log info
         print(f"No data currently stored for {endpoint}, successfully created folders and file.")
     return data_path, csv_file_path, items_folder_path, mapper_file_path
+
+
+def open_item_store(endpoint: str, source_data_path=None) -> ItemStore:
+    """Opens the item store of an endpoint. A packed store is used once the endpoint has been migrated to one,
+    or for new data when `ITEM_STORE_BACKEND` is "packed", otherwise the items are stored in the items folder.
+
+    Args:
+        endpoint (str): Name of the endpoint, e.g. `tracks`.
+        source_data_path (str, optional): Data folder of the endpoint. Defaults to SPOTIFY_DATA_PATH.
+
+    Returns:
+        ItemStore: Store of the endpoint items.
+    """
+    data_path, _, items_folder_path, _ = setup_spotify_folders(endpoint, source_data_path, create_ids_csv=False)
+    packed_folder_path = joinpath(data_path, SPOTIFY_PACKED_FOLDER_NAME)
+    if is_packed_store(packed_folder_path) or ITEM_STORE_BACKEND == "packed":
+        return PackedItemStore(packed_folder_path, compression=ITEM_STORE_COMPRESSION)
+    return FolderItemStore(items_folder_path)
+
+
+def migrate_items_to_packed(endpoint: str, source_data_path=None) -> int:
+    """Copies the items folder of an endpoint into its packed store. Once migrated, the endpoint reads and
+    writes its items through the packed store.
+
+    Returns:
+        int: Number of migrated items.
+    """
+    data_path, _, items_folder_path, _ = setup_spotify_folders(endpoint, source_data_path, create_ids_csv=False)
+    target = PackedItemStore(joinpath(data_path, SPOTIFY_PACKED_FOLDER_NAME), compression=ITEM_STORE_COMPRESSION)
+    try:
+        return migrate_folder_to_packed(FolderItemStore(items_folder_path), target)
+    finally:
+        target.close()
+
+
+def open_id_registry(endpoint: str, source_data_path=None) -> IdRegistry:
+    """Opens the id registry of an endpoint. The ids added to the `ids.csv` file since the registry was last
+    synced with it are registered, with the items already stored in the item store marked as cached.
+
+    Args:
+        endpoint (str): Name of the endpoint, e.g. `tracks`.
+        source_data_path (str, optional): Data folder of the endpoint. Defaults to SPOTIFY_DATA_PATH.
+
+    Returns:
+        IdRegistry: Registry of the endpoint ids.
+    """
+    data_path, csv_file_path, _, _ = setup_spotify_folders(endpoint, source_data_path)
+    registry_path = joinpath(data_path, SPOTIFY_ITEMS_REGISTRY_NAME)
+    registry = IdRegistry(registry_path)
+    imported = registry.sync_csv(csv_file_path, cached_ids=lambda: list_stored_ids(endpoint, source_data_path))
+    if imported:
+        print(f"Registered {imported} new {endpoint} ids from {csv_file_path}.")
+    return registry
+
+
+def list_stored_ids(endpoint: str, source_data_path=None) -> set[str]:
+    """
+    Returns:
+        set[str]: Ids of the items stored in the item store of the endpoint.
+    """
+    store = open_item_store(endpoint, source_data_path)
+    try:
+        return set(store.ids())
+    finally:
+        store.close()
+
+
+def open_item_manifest(endpoint: str, consumer: str, source_data_path=None) -> ItemManifest:
+    """Opens the manifest of the items of an endpoint processed by a consumer, see `ItemManifest`.
+
+    Args:
+        endpoint (str): Name of the endpoint, e.g. `artists`.
+        consumer (str): Name of the consumer, each consumer processes the changes of the endpoint on its own.
+        source_data_path (str, optional): Data folder of the endpoint. Defaults to SPOTIFY_DATA_PATH.
+
+    Returns:
+        ItemManifest: Manifest of the consumer.
+    """
+    data_path, _, _, _ = setup_spotify_folders(endpoint, source_data_path, create_ids_csv=False)
+    return ItemManifest(joinpath(data_path, SPOTIFY_MANIFESTS_FOLDER_NAME, f"{consumer}.sqlite"))
+
+
+def load_mapping(endpoint: str) -> dict[str, str] | None:
+    """
+    Returns:
+        dict[str, str] | None: Content of the `mapping.json` of the endpoint, None if the endpoint has no mapping.
+    """
+    _, _, _, mapper_file_path = setup_spotify_folders(endpoint, create_ids_csv=False)
+    if not os.path.exists(mapper_file_path):
+        return None
+    with open(mapper_file_path, 'r') as f:
+        return json.load(f)
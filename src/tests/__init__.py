@@ -0,0 +1,38 @@
+"""
+Unit tests of the scrape, load and parse infrastructure, run from `src` with `python -m unittest`.
+
+The scrapers under test request a `ReplayServer` and write to a temporary data folder. Both are set in the
+environment here, before the tests import `utility.variables`.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+import unittest
+from os.path import join as joinpath
+
+from benchmark.replay_server import ReplayConfig, ReplayServer
+
+REPLAY_SERVER = ReplayServer(ReplayConfig(latency=0, jitter=0)).start()
+TESTS_DATA_PATH = tempfile.mkdtemp(prefix="scraper-tests-")
+atexit.register(shutil.rmtree, TESTS_DATA_PATH, ignore_errors=True)
+os.environ.update(REPLAY_SERVER.environment, DATA_PATH=TESTS_DATA_PATH, TEMP_PATH=joinpath(TESTS_DATA_PATH, "tmp"))
+
+
+class TempFolderTestCase(unittest.TestCase):
+    """Test case working in a temporary folder, removed once the test and its `tearDown` ran."""
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+
+    def path(self, *names: str) -> str:
+        return joinpath(self.folder, *names)
+
+
+def unthrottle_spotify(rate: float = 1000.0):
+    """Raises the rate of the credentials of the token pool, the replay server answers without rate limits."""
+    from utility.token_pool import SPOTIFY_AUTH_TOKEN
+    for rate_limiter in SPOTIFY_AUTH_TOKEN.rate_limiters:
+        rate_limiter.rate = rate_limiter.max_rate = rate
@@ -0,0 +1,67 @@
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+from spotify.async_scraper import AsyncSpotifyScraper
+from spotify.scraper import SpotifyScraper
+from spotify.util import open_id_registry, open_item_store
+from tests import REPLAY_SERVER, unthrottle_spotify
+from utility.id_registry import CACHED, DEAD
+
+
+class AsyncSpotifyScraperTest(unittest.TestCase):
+    """Scrapes of the replay server, every test registers its own ids."""
+
+    @classmethod
+    def setUpClass(cls):
+        unthrottle_spotify()
+
+    def setUp(self):
+        self.registry = open_id_registry('tracks')
+        self.addCleanup(self.registry.close)
+        self.ids = [f"{self._testMethodName}{i:03d}" for i in range(12)]
+        self.registry.add_ids(self.ids)
+
+    def tearDown(self):
+        REPLAY_SERVER.config.invalid_rate = 0.0
+        # the ids left pending would be scraped by the next test
+        self.registry.mark_dead((id, "test over") for id in self.ids)
+
+    def scrape(self, batchmode: int):
+        with contextlib.redirect_stdout(io.StringIO()):
+            AsyncSpotifyScraper('tracks', concurrency=4).scrape_items(batchmode=batchmode)
+
+    def states(self) -> dict[str, list[str]]:
+        states = {}
+        for state in (CACHED, DEAD):
+            states[state] = sorted(set(self.registry.iter_ids(state)) & set(self.ids))
+        return states
+
+    def test_single_requests(self):
+        self.scrape(batchmode=1)
+        self.assertEqual(self.states(), {CACHED: self.ids, DEAD: []})
+        store = open_item_store('tracks')
+        self.assertEqual([store.get(id)['id'] for id in self.ids], self.ids)
+        store.close()
+
+    def test_batch_requests(self):
+        self.scrape(batchmode=5)
+        self.assertEqual(self.states(), {CACHED: self.ids, DEAD: []})
+
+    def test_invalid_ids_are_dead_lettered(self):
+        # every id is rejected with a 400, which is not retried
+        REPLAY_SERVER.config.invalid_rate = 1.0
+        self.scrape(batchmode=4)
+        self.assertEqual(self.states(), {CACHED: [], DEAD: self.ids})
+
+    def test_unexpected_errors_stop_the_scrape(self):
+        # the async scraper handles the errors like the sequential one, an unexpected error is raised
+        with mock.patch.object(SpotifyScraper, 'scrape_work', side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.scrape(batchmode=1)
+        self.assertEqual(self.states(), {CACHED: [], DEAD: []})
+
+
+if __name__ == "__main__":
+    unittest.main()
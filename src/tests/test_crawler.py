@@ -0,0 +1,63 @@
+import contextlib
+import io
+import json
+import unittest
+from unittest import mock
+
+from requests import Response
+
+from spotify.crawler import GraphCrawler
+from spotify.util import open_id_registry
+from utility.id_registry import CACHED
+
+
+def response(status_code: int, page: dict | None = None) -> Response:
+    res = Response()
+    res.status_code = status_code
+    res._content = b"" if page is None else json.dumps(page).encode()
+    return res
+
+
+class ExpandArtistsTest(unittest.TestCase):
+    """Crawls of the albums of cached artists, whose requests answer with the status of `STATUS_CODES`."""
+
+    STATUS_CODES = {'crawlgone': 404, 'crawlinvalid': 400, 'crawllimited': 429, 'crawldown': 503}
+
+    def setUp(self):
+        patcher = mock.patch('spotify.crawler.SPOTIFY_CRAWL_EDGES', {'artists': ['albums']})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('spotify.crawler.SPOTIFY_AUTH_TOKEN.send_request', side_effect=self.answer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.artists = open_id_registry('artists')
+        self.addCleanup(self.artists.close)
+        self.albums = open_id_registry('albums')
+        self.addCleanup(self.albums.close)
+        self.artists.add_ids([*self.STATUS_CODES, 'crawlfound'], state=CACHED)
+
+    def tearDown(self):
+        # the artists left unexpanded would be crawled by the next test
+        self.artists.mark_expanded(self.STATUS_CODES)
+
+    def answer(self, request_func, url: str, endpoint: str | None = None) -> Response:
+        id = url.split('/artists/')[1].split('/')[0]
+        if id in self.STATUS_CODES:
+            return response(self.STATUS_CODES[id])
+        return response(200, {'items': [{'id': f"{id}album"}], 'next': None})
+
+    def crawl(self) -> dict[str, int]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return GraphCrawler().crawl()
+
+    def unexpanded_ids(self) -> set[str]:
+        return {id for batch in self.artists.iter_unexpanded(max_depth=1) for id, _ in batch}
+
+    def test_only_transient_errors_are_expanded_again(self):
+        self.assertGreaterEqual(self.crawl()['albums'], 1)
+        self.assertIn('crawlfoundalbum', set(self.albums.iter_ids()))
+        self.assertEqual(self.unexpanded_ids() & {*self.STATUS_CODES, 'crawlfound'}, {'crawllimited', 'crawldown'})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import json
+import unittest
+
+from spotify.fields import FieldsFilter, mapping_paths
+from spotify.loader import is_harvestable
+from utility.mapper import JsonToObjectMapper
+from utility.variables import SPOTIFY_FIELDS_EXTRA_PATHS
+
+TRACK = {'id': 't', 'name': 'Track', 'artists': [{'id': 'a', 'name': 'Artist'}],
+         'album': {'id': 'b', 'name': 'Album', 'artists': [{'id': 'a'}], 'images': [{'url': 'https://i.scdn.co/b'}]},
+         'available_markets': ['CA', 'US']}
+PLAYLIST = {'id': 'p', 'name': 'Playlist', 'description': 'A long description',
+            'tracks': {'next': None, 'items': [{'added_at': '2024-01-01', 'track': TRACK}]}}
+
+
+class FieldsFilterTest(unittest.TestCase):
+    def test_nested_selectors(self):
+        paths = mapping_paths({'spotify_id': 'id', 'tracks': 'tracks.items[].track.id'}) + \
+            ['tracks.next', 'tracks.items[].track.artists[].id']
+        self.assertEqual(FieldsFilter.from_paths(paths).to_param(), "id,tracks(items(track(id,artists(id))),next)")
+
+    def test_whole_fields_absorb_their_sub_fields(self):
+        fields_filter = FieldsFilter.from_paths(['album', 'album.id', 'artists[].id', 'artists[]'])
+        self.assertEqual(fields_filter.to_param(), "album,artists")
+
+    def test_param_round_trip(self):
+        param = "id,tracks(next,items(track(id,album(id),artists(id,name))))"
+        self.assertEqual(FieldsFilter.from_param(param).to_param(), param)
+        self.assertEqual(FieldsFilter.from_param(param).subfilter('tracks').to_param(),
+                         "next,items(track(id,album(id),artists(id,name)))")
+
+    def test_filtered_response_is_smaller(self):
+        fields_filter = FieldsFilter.from_param("id,tracks(next,items(track(id,artists(id))))")
+        filtered = fields_filter.apply(PLAYLIST)
+        self.assertEqual(filtered, {'id': 'p', 'tracks': {'next': None, 'items': [
+            {'track': {'id': 't', 'artists': [{'id': 'a'}]}}]}})
+        self.assertLess(len(json.dumps(filtered)), len(json.dumps(PLAYLIST)))
+
+    def test_filtered_tracks_can_be_harvested(self):
+        # the extra paths keep every field of the tracks read by the loaders and the track inserters
+        mapper = JsonToObjectMapper({'spotify_id': 'id', 'audio_name': 'name'})
+        paths = mapping_paths(mapper.mapping, prefix="tracks.items[].track.") + SPOTIFY_FIELDS_EXTRA_PATHS['playlists']
+        track = FieldsFilter.from_paths(paths).apply(PLAYLIST)['tracks']['items'][0]['track']
+        self.assertEqual(track, {key: value for key, value in TRACK.items() if key != 'album'} |
+                         {'album': {'id': 'b', 'name': 'Album', 'artists': [{'id': 'a'}]}})
+        self.assertTrue(is_harvestable(track, mapper))
+        self.assertFalse(is_harvestable({**track, 'available_markets': None}, mapper))
+        self.assertFalse(is_harvestable({key: value for key, value in track.items() if key != 'name'}, mapper))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import contextlib
+import io
+import os
+import sqlite3
+import unittest
+
+from spotify.loader import output_to_registry
+from spotify.util import setup_spotify_folders
+from tests import TempFolderTestCase
+from utility.id_registry import CACHED, DEAD, FAILED, MIGRATED_COLUMNS, PENDING, IdRegistry
+
+
+class IdRegistryTest(TempFolderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db_path = self.path("ids.db")
+        self.registry = IdRegistry(self.db_path)
+
+    def tearDown(self):
+        self.registry.close()
+
+    def test_add_ids_skips_registered_ids(self):
+        self.assertEqual(self.registry.add_ids(['a', 'b', None]), 2)
+        self.registry.mark_cached(['a'])
+        self.assertEqual(self.registry.add_ids(['a', 'c']), 1)
+        self.assertEqual(list(self.registry.iter_ids(CACHED)), ['a'])
+        self.assertEqual(list(self.registry.iter_ids(PENDING)), ['b', 'c'])
+
+    def test_state_transitions(self):
+        self.registry.add_ids(['a', 'b', 'c'])
+        self.registry.mark_cached(['a'])
+        self.registry.schedule_retries([('b', 0.0, 'timeout')])
+        self.registry.mark_dead([('c', '404: not found')])
+        self.assertEqual([self.registry.count(state) for state in (PENDING, CACHED, FAILED, DEAD)], [0, 1, 1, 1])
+        self.assertEqual(self.registry.count_backlog(), 1)
+        self.assertEqual(self.registry.get_retry_counts(['b', 'c']), {'b': 1, 'c': 1})
+        self.assertEqual([(id, error) for id, _, _, error in self.registry.iter_dead()], [('c', '404: not found')])
+
+        self.registry.mark_pending(['c'], reset_retries=True)
+        self.assertEqual(self.registry.get_retry_counts(['c']), {'c': 0})
+        self.assertEqual(self.registry.requeue_cached(), 1)
+        self.assertEqual(list(self.registry.iter_pending(10)), [['a', 'c']])
+
+    def test_iter_pending_batches(self):
+        self.registry.add_ids(str(i) for i in range(5))
+        self.assertEqual(list(self.registry.iter_pending(2)), [['0', '1'], ['2', '3'], ['4']])
+
+    def test_validators(self):
+        self.registry.add_ids(['a'])
+        self.assertEqual(self.registry.get_validators('a'), (None, None))
+        self.registry.set_validators([('a', '"etag"', 'snapshot')])
+        self.assertEqual(self.registry.get_validators('a'), ('"etag"', 'snapshot'))
+
+    def test_migrates_older_registries(self):
+        self.registry.close()
+        os.remove(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE ids (id TEXT PRIMARY KEY, state TEXT NOT NULL DEFAULT 'pending', "
+                     "retry_count INTEGER NOT NULL DEFAULT 0, last_fetched REAL, name TEXT)")
+        conn.execute("INSERT INTO ids (id, state) VALUES ('a', 'cached')")
+        conn.commit()
+        conn.close()
+
+        self.registry = IdRegistry(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(ids)")}
+        conn.close()
+        self.assertLessEqual(set(MIGRATED_COLUMNS), columns)
+        self.assertEqual(list(self.registry.iter_ids(CACHED)), ['a'])
+        # the migrated columns take their defaults
+        self.assertEqual(list(self.registry.iter_unexpanded(max_depth=1)), [[('a', 0)]])
+        self.assertEqual(self.registry.get_validators('a'), (None, None))
+
+    def test_csv_round_trip_and_sync(self):
+        self.registry.add_ids(['a', 'b'])
+        self.registry.mark_cached(['a'])
+        csv_path = self.path("ids.csv")
+        self.registry.export_csv(csv_path)
+        other = IdRegistry(self.path("other.db"))
+        try:
+            self.assertEqual(other.import_csv(csv_path), 2)
+            self.assertEqual(list(other.iter_ids(CACHED)), ['a'])
+            self.assertEqual(other.sync_csv(csv_path), 0)
+            with open(csv_path, "a") as f:
+                f.write("c,False\n")
+            self.assertEqual(other.sync_csv(csv_path), 1)
+            self.assertEqual(list(other.iter_ids(PENDING)), ['b', 'c'])
+        finally:
+            other.close()
+
+    def test_loaded_ids_are_only_registered(self):
+        # the loaders add the ids to the registry, ids.csv is only exported on demand
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, csv_path, _, _ = setup_spotify_folders("tracks")
+            with open(csv_path) as f:
+                csv_rows = f.read()
+            self.assertEqual(output_to_registry(self.registry, {'a', 'b'}, "tracks"), 2)
+            self.assertEqual(output_to_registry(self.registry, {'a'}, "tracks"), 0)
+        self.assertEqual(sorted(self.registry.iter_ids(PENDING)), ['a', 'b'])
+        with open(csv_path) as f:
+            self.assertEqual(f.read(), csv_rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import json
+import unittest
+
+from tests import TempFolderTestCase
+from utility.item_store import FolderItemStore, ItemStore, PackedItemStore, is_packed_store, \
+    migrate_folder_to_packed
+
+ITEMS = {'a': {'id': 'a', 'name': 'Track A'}, 'b': {'id': 'b', 'name': 'Track B', 'artists': [{'id': 'x'}]}}
+
+
+class ItemStoreTest(TempFolderTestCase):
+    """Round trip of the items through both store backends."""
+
+    def stores(self) -> list[ItemStore]:
+        return [FolderItemStore(self.path("items")), PackedItemStore(self.path("packed"))]
+
+    def test_round_trip(self):
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                for id, item in ITEMS.items():
+                    store.put(id, item)
+                self.assertEqual(len(store), 2)
+                self.assertIn('a', store)
+                self.assertNotIn('c', store)
+                self.assertEqual(store.get('b'), ITEMS['b'])
+                self.assertIsNone(store.get('c'))
+                self.assertEqual(sorted(store.ids()), ['a', 'b'])
+                self.assertEqual(dict(store.items()), ITEMS)
+                self.assertEqual(sorted(id for id, _, _ in store.stats()), ['a', 'b'])
+                store.close()
+
+    def test_raw_responses(self):
+        for store in self.stores():
+            with self.subTest(store=type(store).__name__):
+                store.put('a', b'{"id": "a"}')
+                self.assertEqual(json.loads(store.get_bytes('a')), {'id': 'a'})
+                self.assertEqual(store.get('a'), {'id': 'a'})
+                store.close()
+
+    def test_packed_store_keeps_the_last_version(self):
+        path = self.path("packed")
+        store = PackedItemStore(path)
+        store.put('a', ITEMS['a'])
+        store.put('a', ITEMS['b'])
+        store.close()
+        self.assertTrue(is_packed_store(path))
+        store = PackedItemStore(path)
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.get('a'), ITEMS['b'])
+        store.close()
+
+    def test_migrate_folder_to_packed(self):
+        source, target = self.stores()
+        for id, item in ITEMS.items():
+            source.put(id, item)
+        self.assertEqual(migrate_folder_to_packed(source, target), 2)
+        self.assertEqual(migrate_folder_to_packed(source, target), 0)
+        self.assertEqual(dict(target.items()), ITEMS)
+        target.close()
+
+    def test_item_store_is_abstract(self):
+        with self.assertRaises(TypeError):
+            ItemStore()
+
+
+if __name__ == "__main__":
+    unittest.main()
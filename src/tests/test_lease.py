@@ -0,0 +1,60 @@
+import unittest
+
+from tests import TempFolderTestCase
+from utility.id_registry import IdRegistry
+from utility.lease import ScrapeLease
+
+
+class ScrapeLeaseTest(TempFolderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.registry = IdRegistry(self.path("ids.db"))
+        self.registry.add_ids(['a', 'b', 'c', 'd'])
+        self.leases = []
+
+    def tearDown(self):
+        for lease in self.leases:
+            lease.stop()
+        self.registry.close()
+
+    def lease(self, owner: str, duration: float = 60) -> ScrapeLease:
+        lease = ScrapeLease(self.registry, owner=owner, duration=duration)
+        self.leases.append(lease)
+        return lease
+
+    def test_workers_claim_disjoint_ids(self):
+        first, second = self.lease("first"), self.lease("second")
+        self.assertEqual(first.acquire(2), ['a', 'b'])
+        self.assertEqual(second.acquire(3), ['c', 'd'])
+        self.assertEqual(first.acquire(2), [])
+
+    def test_completed_ids_are_not_leased_again(self):
+        first, second = self.lease("first"), self.lease("second")
+        ids = first.acquire(2)
+        self.registry.mark_cached(ids)
+        first.stop()
+        self.assertEqual(second.acquire(4), ['c', 'd'])
+
+    def test_expired_leases_are_reclaimed(self):
+        # a negative duration stands for a crashed worker whose leases already expired
+        crashed, second = self.lease("crashed", duration=-1), self.lease("second")
+        self.assertEqual(crashed.acquire(2), ['a', 'b'])
+        self.assertEqual(second.acquire(2), ['a', 'b'])
+
+    def test_renew_extends_pending_leases(self):
+        first = self.lease("first")
+        ids = first.acquire(3)
+        self.registry.mark_cached(ids[:1])
+        self.assertEqual(first.renew(), 2)
+
+    def test_release(self):
+        first, second = self.lease("first"), self.lease("second")
+        first.acquire(4)
+        self.assertEqual(first.release(['b']), 1)
+        self.assertEqual(second.acquire(4), ['b'])
+        first.stop()
+        self.assertEqual(second.acquire(4), ['a', 'c', 'd'])
+
+
+if __name__ == "__main__":
+    unittest.main()
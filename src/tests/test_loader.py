@@ -0,0 +1,51 @@
+import contextlib
+import csv
+import io
+import unittest
+from os.path import join as joinpath
+from unittest import mock
+
+from spotify.loader import load_chapters_from_single_audiobook, load_genres
+from spotify.util import open_item_store
+from tests import TempFolderTestCase
+from utility.item_store import PackedItemStore
+from utility.variables import SPOTIFY_DATA_PATH
+
+
+class LoadChaptersTest(TempFolderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = PackedItemStore(self.path("chapters"))
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_new_chapters_after_stored_ones_are_stored(self):
+        audiobook = {'id': 'b', 'name': 'Audiobook', 'chapters': {'items': [{'id': 'c1'}, {'id': 'c2'}]}}
+        load_chapters_from_single_audiobook(audiobook, 'b', self.store)
+        # the next pages of the chapters were fetched since
+        audiobook['chapters']['items'] += [{'id': 'c3'}, {'id': 'c4'}]
+        load_chapters_from_single_audiobook(audiobook, 'b', self.store)
+        self.assertEqual(sorted(self.store.ids()), ['c1', 'c2', 'c3', 'c4'])
+        self.assertEqual(self.store.get('c4'), {'id': 'c4', 'audiobook': {'id': 'b', 'name': 'Audiobook'}})
+
+
+
+class LoadGenresTest(unittest.TestCase):
+    def load_genres(self) -> set[str]:
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            load_genres()
+        with open(joinpath(SPOTIFY_DATA_PATH, 'genres', 'genres.csv'), newline='') as f:
+            return {row[0] for row in csv.reader(f) if row}
+
+    def test_failed_append_reads_the_items_again(self):
+        open_item_store('artists').put('genreartist', {'id': 'genreartist', 'genres': ['replay genre']})
+        open_item_store('albums').put('genrealbum', {'id': 'genrealbum', 'genres': ['replay album genre']})
+        with mock.patch('spotify.loader.csv.writer', side_effect=OSError("disk full")), \
+                self.assertRaises(OSError):
+            self.load_genres()
+        self.assertLessEqual({'replay genre', 'replay album genre'}, self.load_genres())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from tests import TempFolderTestCase
+from utility.item_store import PackedItemStore
+from utility.manifest import ItemManifest
+
+
+class ItemManifestTest(TempFolderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = PackedItemStore(self.path("packed"))
+        self.store.put('a', {'id': 'a'})
+        self.store.put('b', {'id': 'b'})
+        self.manifest = ItemManifest(self.path("manifests", "parser.db"))
+
+    def tearDown(self):
+        self.manifest.close()
+        self.store.close()
+
+    def changed_ids(self, rebuild: bool = False) -> list[str]:
+        return sorted(id for id, _ in self.manifest.changed(self.store, rebuild=rebuild))
+
+    def test_only_new_and_changed_items_are_yielded(self):
+        self.assertEqual(self.changed_ids(), ['a', 'b'])
+        self.assertEqual(self.manifest.commit(), 2)
+        self.assertEqual(self.changed_ids(), [])
+
+        self.store.put('a', {'id': 'a', 'name': 'renamed'})
+        self.store.put('c', {'id': 'c'})
+        self.assertEqual(self.changed_ids(), ['a', 'c'])
+
+    def test_rewritten_items_with_the_same_content_are_skipped(self):
+        self.changed_ids()
+        self.manifest.commit()
+        self.store.put('a', {'id': 'a'})
+        self.assertEqual(self.changed_ids(), [])
+
+    def test_uncommitted_items_are_yielded_again(self):
+        self.assertEqual(self.changed_ids(), ['a', 'b'])
+        self.assertEqual(self.changed_ids(), ['a', 'b'])
+
+    def test_rebuild_and_reset(self):
+        self.changed_ids()
+        self.manifest.commit()
+        self.assertEqual(self.changed_ids(rebuild=True), ['a', 'b'])
+        self.manifest.reset()
+        self.assertEqual(len(self.manifest), 0)
+        self.assertEqual(self.changed_ids(), ['a', 'b'])
+
+
+if __name__ == "__main__":
+    unittest.main()
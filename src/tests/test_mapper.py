@@ -0,0 +1,51 @@
+import unittest
+
+from utility.mapper import JsonToObjectMapper
+
+MAPPING = {
+    'spotify_id': 'id', 'external_url': 'external_urls.spotify', 'nb_followers': 'followers.total',
+    'artists': 'artists[].id', 'available_markets': 'available_markets[]', 'album': 'album.id',
+    'tracks': 'tracks.items[].track.id', 'missing': 'not.a.path',
+}
+ITEMS = [
+    {'id': 'a', 'external_urls': {'spotify': 'https://open.spotify.com/track/a'}, 'followers': {'total': 3},
+     'artists': [{'id': 'x'}, None, {}, {'id': 'y'}], 'available_markets': ['CA', 'US'], 'album': {'id': 'b'},
+     'tracks': {'items': [{'track': {'id': 't'}}, {'track': None}]}},
+    {'id': 'b', 'external_urls': None, 'followers': 'hidden', 'album': None, 'tracks': {}},
+    {},
+]
+
+
+class Item:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class JsonToObjectMapperTest(unittest.TestCase):
+    def test_compiled_mapping_equals_extract_value(self):
+        mapper = JsonToObjectMapper(MAPPING)
+        for item in ITEMS:
+            with self.subTest(item=item.get('id')):
+                expected = {attr: mapper.extract_value(item, path) for attr, path in MAPPING.items()}
+                self.assertEqual(vars(mapper.map(item, Item)), expected)
+                self.assertEqual(mapper.map_values(item), tuple(expected.values()))
+
+    def test_list_items_are_returned_whole(self):
+        values = dict(zip(MAPPING, JsonToObjectMapper(MAPPING).map_values(ITEMS[0])))
+        self.assertEqual(values['artists'], [{'id': 'x'}, {'id': 'y'}])
+        self.assertEqual(values['tracks'], [{'track': {'id': 't'}}, {'track': None}])
+
+    def test_attributes_that_are_not_identifiers(self):
+        mapper = JsonToObjectMapper({'class': 'id', 'first name': 'name'})
+        self.assertEqual(vars(mapper.map({'id': 'a', 'name': 'b'}, Item)), {'class': 'a', 'first name': 'b'})
+
+    def test_required_fields(self):
+        mapper = JsonToObjectMapper(MAPPING)
+        self.assertEqual(mapper.required_fields(), {'id', 'external_urls', 'followers', 'artists',
+                                                    'available_markets', 'album', 'tracks', 'not'})
+        self.assertFalse(mapper.has_required_fields(ITEMS[0]))
+        self.assertTrue(mapper.has_required_fields({**ITEMS[0], 'not': None}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from tests import TempFolderTestCase
+from utility.metrics import ScrapeMetrics
+
+
+class ScrapeMetricsTest(TempFolderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.metrics = ScrapeMetrics(self.path("metrics.json"), buckets=(0.1, 1.0))
+
+    def tearDown(self):
+        self.metrics.stop()
+
+    def test_requests_are_keyed_by_api_then_endpoint(self):
+        self.metrics.record_request('spotify', None, 0.05, 200)
+        self.metrics.record_request('musicbrainz', None, 0.5, 503)
+        self.metrics.record_request('spotify', 'tracks', 2.0, None)
+        requests = self.metrics.snapshot()['requests']
+        self.assertEqual(requests['spotify']['other']['latency']['buckets'], {'0.1': 1, '1.0': 0, '+Inf': 0})
+        self.assertEqual(requests['spotify']['other']['statuses'], {'200': 1})
+        self.assertEqual(requests['musicbrainz']['other']['statuses'], {'503': 1})
+        self.assertEqual(requests['spotify']['tracks']['statuses'], {'error': 1})
+
+    def test_prometheus_labels_of_each_api(self):
+        self.metrics.record_request('spotify', None, 0.05, 200)
+        self.metrics.record_request('musicbrainz', None, 0.5, 200)
+        self.metrics.record_items('tracks', 3)
+        text = self.metrics.to_prometheus()
+        self.assertIn('scrape_responses_total{api="spotify",endpoint="other",status="200"} 1', text)
+        self.assertIn('scrape_responses_total{api="musicbrainz",endpoint="other",status="200"} 1', text)
+        self.assertIn('scrape_request_duration_seconds_count{api="musicbrainz",endpoint="other"} 1', text)
+        self.assertIn('scrape_items_total{endpoint="tracks"} 3', text)
+        self.assertIn("musicbrainz other: 1 requests", self.metrics.summary())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from urllib.parse import parse_qs, urlparse
+
+from spotify.paginator import PaginationExpander
+from tests import REPLAY_SERVER, unthrottle_spotify
+
+NEXT_URL = "https://api.spotify.com/v1/playlists/p/tracks?offset=100&limit=100"
+
+
+def page_offsets(urls: list[str]) -> list[int]:
+    return [int(parse_qs(urlparse(url).query)['offset'][0]) for url in urls]
+
+
+class PaginationExpanderTest(unittest.TestCase):
+    def page_urls(self, paging: dict, single: bool = False, fields: str | None = None) -> list[str]:
+        paginator = PaginationExpander('playlists', fields=fields)
+        return paginator._PaginationExpander__page_urls(paging, single=single)
+
+    def test_offsets_of_the_remaining_pages(self):
+        paging = {'next': NEXT_URL, 'items': [{}] * 100, 'limit': 100, 'total': 250}
+        self.assertEqual(page_offsets(self.page_urls(paging)), [100, 200])
+
+    def test_offsets_follow_the_limit_of_the_next_link(self):
+        paging = {'next': "https://api.spotify.com/v1/playlists/p/tracks?offset=50&limit=50",
+                  'items': [{}] * 50, 'limit': 50, 'total': 120}
+        self.assertEqual(page_offsets(self.page_urls(paging)), [50, 100])
+
+    def test_next_link_only(self):
+        paging = {'next': NEXT_URL, 'items': [{}] * 100, 'limit': 100, 'total': 250}
+        self.assertEqual(self.page_urls(paging, single=True), [NEXT_URL])
+        # without a total the pages can only be followed one by one
+        self.assertEqual(page_offsets(self.page_urls({**paging, 'total': None})), [100])
+
+    def test_fields_filter_is_added(self):
+        paging = {'next': NEXT_URL, 'items': [{}] * 100, 'limit': 100, 'total': 150}
+        urls = self.page_urls(paging, fields="next,items(track(id))")
+        self.assertEqual([parse_qs(urlparse(url).query)['fields'] for url in urls], [["next,items(track(id))"]])
+
+    def test_needs_expansion(self):
+        paginator = PaginationExpander('playlists')
+        self.assertTrue(paginator.needs_expansion({'tracks': {'next': NEXT_URL}}))
+        self.assertFalse(paginator.needs_expansion({'tracks': {'next': None}}))
+        self.assertFalse(PaginationExpander('tracks').needs_expansion({'tracks': {'next': NEXT_URL}}))
+
+    def test_expand_fetches_every_page(self):
+        unthrottle_spotify()
+        item = REPLAY_SERVER.handle("GET", "/v1/playlists/expanded", b"")[1]
+        self.assertEqual(len(item['tracks']['items']), REPLAY_SERVER.config.page_size)
+        self.assertEqual(PaginationExpander('playlists').expand(item), 2)
+        tracks = item['tracks']
+        self.assertEqual([track['track']['id'] for track in tracks['items']],
+                         [f"expandedx{i}" for i in range(REPLAY_SERVER.config.collection_size)])
+        self.assertEqual((tracks['next'], tracks['limit']), (None, REPLAY_SERVER.config.collection_size))
+
+
+if __name__ == "__main__":
+    unittest.main()
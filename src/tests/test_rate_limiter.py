@@ -0,0 +1,99 @@
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+from requests import Response
+
+from utility.rate_limiter import RateLimiter
+from utility.utility import send_request_with_wait
+
+
+def response(status_code: int, headers: dict[str, str] | None = None) -> Response:
+    res = Response()
+    res.status_code = status_code
+    res.headers.update(headers or {})
+    return res
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        # the clock of the limiter only moves when a test advances it
+        self.now = 1000.0
+        patcher = mock.patch('utility.rate_limiter.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = RateLimiter(rate=2.0, min_rate=0.5, max_rate=3.0, burst=2, increase_step=0.5)
+
+    def test_burst_then_spaced_by_the_rate(self):
+        self.assertEqual([self.limiter.reserve() for _ in range(4)], [0.0, 0.0, 0.5, 1.0])
+
+    def test_refill_up_to_the_burst(self):
+        self.limiter.reserve()
+        self.limiter.reserve()
+        self.now += 10
+        self.assertEqual([self.limiter.reserve() for _ in range(3)], [0.0, 0.0, 0.5])
+
+    def test_delay_does_not_reserve(self):
+        self.limiter.reserve()
+        self.limiter.reserve()
+        self.assertEqual(self.limiter.delay(), 0.5)
+        self.assertEqual(self.limiter.delay(), 0.5)
+        self.assertEqual(self.limiter.total_acquired, 2)
+
+    def test_retry_after_pauses_and_spreads_the_callers(self):
+        self.limiter.on_rate_limited(retry_after=3)
+        self.assertEqual(self.limiter.rate, 1.0)
+        # the queued callers are spread at the new rate after the pause instead of firing together
+        self.assertEqual([self.limiter.reserve() for _ in range(3)], [4.0, 5.0, 6.0])
+
+    def test_no_refill_during_the_pause(self):
+        self.limiter.on_rate_limited(retry_after=3)
+        self.now += 3
+        self.assertEqual(self.limiter.reserve(), 1.0)
+        self.now += 10
+        self.assertEqual([self.limiter.reserve() for _ in range(3)], [0.0, 0.0, 1.0])
+
+    def test_rate_bounds(self):
+        for _ in range(5):
+            self.limiter.on_success()
+        self.assertEqual(self.limiter.rate, 3.0)
+        for _ in range(5):
+            self.limiter.on_rate_limited(retry_after=0)
+        self.assertEqual(self.limiter.rate, 0.5)
+        self.assertEqual(self.limiter.total_rate_limited, 5)
+
+
+class SendRequestWithWaitTest(unittest.TestCase):
+    def setUp(self):
+        self.limiter = RateLimiter(rate=1000.0, min_rate=1.0, max_rate=2000.0, burst=10, increase_step=1.0)
+
+    def send(self, *responses: Response) -> tuple[Response, int]:
+        responses = iter(responses)
+        calls = []
+
+        def request():
+            calls.append(1)
+            return next(responses)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            res = send_request_with_wait(request, rate_limiter=self.limiter)
+        return res, len(calls)
+
+    def test_rate_limited_requests_are_sent_again(self):
+        with mock.patch.object(self.limiter, 'on_rate_limited', wraps=self.limiter.on_rate_limited) as rate_limited:
+            res, calls = self.send(response(429, {'Retry-After': '0.01'}), response(200))
+        self.assertEqual((res.status_code, calls), (200, 2))
+        rate_limited.assert_called_once_with(0.01)
+        self.assertEqual(self.limiter.rate, 501.0)
+
+    def test_only_successes_raise_the_rate(self):
+        self.send(response(500))
+        self.send(response(404))
+        self.assertEqual(self.limiter.rate, 1000.0)
+        self.send(response(200))
+        self.assertEqual(self.limiter.rate, 1001.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
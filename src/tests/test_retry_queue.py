@@ -0,0 +1,76 @@
+import contextlib
+import io
+import time
+import unittest
+
+from tests import TempFolderTestCase
+from utility.id_registry import DEAD, FAILED, PENDING, IdRegistry
+from utility.retry_queue import RetryPolicy, RetryQueue
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_exponential_backoff(self):
+        policy = RetryPolicy(base_delay=10, factor=2, max_delay=100, jitter=0)
+        self.assertEqual([policy.delay(attempt) for attempt in range(1, 6)], [10, 20, 40, 80, 100])
+
+    def test_jitter_is_bounded(self):
+        policy = RetryPolicy(base_delay=10, factor=2, jitter=0.5)
+        for _ in range(100):
+            self.assertTrue(20 <= policy.delay(2) <= 30)
+
+    def test_retryable_status_codes(self):
+        self.assertTrue(all(RetryPolicy.is_retryable(code) for code in (None, 429, 500, 503)))
+        self.assertFalse(any(RetryPolicy.is_retryable(code) for code in (400, 401, 404)))
+
+
+class RetryQueueTest(TempFolderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.registry = IdRegistry(self.path("ids.db"))
+        self.registry.add_ids(['a', 'b', 'c'])
+
+    def tearDown(self):
+        self.registry.close()
+
+    def test_dead_letters_after_max_attempts(self):
+        queue = RetryQueue(self.registry, RetryPolicy(base_delay=0, max_attempts=3, jitter=0))
+        self.assertEqual(queue.record_failure(['a'], "timeout"), (1, 0))
+        self.assertEqual(queue.record_failure(['a'], "timeout"), (1, 0))
+        self.assertEqual(queue.record_failure(['a'], "timeout"), (0, 1))
+        self.assertEqual([(id, attempts, error) for id, attempts, _, error in queue.dead_letters()],
+                         [('a', 3, "timeout")])
+
+    def test_status_failures(self):
+        queue = RetryQueue(self.registry, RetryPolicy(base_delay=60, jitter=0))
+        self.assertEqual(queue.record_status_failure(['a'], 404, "not found"), (0, 1))
+        self.assertEqual(queue.record_status_failure(['b'], 503, "unavailable"), (1, 0))
+        self.assertEqual(self.registry.count(DEAD), 1)
+        self.assertEqual(self.registry.count(FAILED), 1)
+        self.assertEqual([error for _, _, _, error in queue.dead_letters()], ["404: not found"])
+        self.assertGreater(self.registry.next_retry_at(), time.time() + 59)
+
+    def test_due_retries_are_claimed_once(self):
+        queue = RetryQueue(self.registry, RetryPolicy(base_delay=0, jitter=0))
+        queue.record_failure(['a', 'b'], "timeout")
+        self.assertEqual(sorted(queue.claim_due_retries(10)), ['a', 'b'])
+        self.assertEqual(queue.claim_due_retries(10), [])
+
+    def test_iter_work_interleaves_retries(self):
+        queue = RetryQueue(self.registry, RetryPolicy(base_delay=0, jitter=0))
+        work = queue.iter_work(1)
+        self.assertEqual(next(work), ['a'])
+        queue.record_failure(['a'], "timeout")
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(list(work), [['a'], ['b'], ['c']])
+
+    def test_requeue_dead_letters(self):
+        queue = RetryQueue(self.registry)
+        queue.record_failure(['a', 'b'], "invalid", retryable=False)
+        self.assertEqual(queue.requeue_dead_letters(['a']), 1)
+        self.assertEqual(queue.requeue_dead_letters(), 1)
+        self.assertEqual(self.registry.count(PENDING), 3)
+        self.assertEqual(self.registry.get_retry_counts(['a', 'b']), {'a': 0, 'b': 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+from spotify.scheduler import ScrapeScheduler
+from spotify.scraper import SpotifyScraper
+from spotify.util import open_id_registry
+from tests import unthrottle_spotify
+from utility.id_registry import CACHED, FAILED
+
+
+class ScrapeSchedulerTest(unittest.TestCase):
+    """Scrapes of the replay server without crawl nor aliases, every test registers its own ids."""
+
+    @classmethod
+    def setUpClass(cls):
+        unthrottle_spotify()
+
+    def setUp(self):
+        self.tracks = open_id_registry('tracks')
+        self.addCleanup(self.tracks.close)
+        self.albums = open_id_registry('albums')
+        self.addCleanup(self.albums.close)
+        self.track_ids = [f"{self._testMethodName}track{i:03d}" for i in range(12)]
+        self.album_ids = [f"{self._testMethodName}album{i:03d}" for i in range(3)]
+        self.tracks.add_ids(self.track_ids)
+        self.albums.add_ids(self.album_ids)
+
+    def run_scheduler(self) -> dict[str, dict[str, int]]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return ScrapeScheduler(concurrency=4, crawl_depth=None, aliases=False).run()
+
+    def test_every_queue_is_drained(self):
+        counts = self.run_scheduler()
+        self.assertGreaterEqual(counts['tracks']['cached'], len(self.track_ids))
+        self.assertGreaterEqual(counts['albums']['cached'], len(self.album_ids))
+        self.assertLessEqual(set(self.track_ids), set(self.tracks.iter_ids(CACHED)))
+        self.assertLessEqual(set(self.album_ids), set(self.albums.iter_ids(CACHED)))
+
+    def test_unit_errors_are_retried_and_the_other_queues_drained(self):
+        scrape_work = SpotifyScraper.scrape_work
+
+        def fail_tracks(scraper: SpotifyScraper, ids: list[str], batchmode: int = 1):
+            if any(id in self.track_ids for id in ids):
+                raise OSError("disk full")
+            return scrape_work(scraper, ids, batchmode)
+
+        with mock.patch.object(SpotifyScraper, 'scrape_work', autospec=True, side_effect=fail_tracks):
+            counts = self.run_scheduler()
+        self.assertGreaterEqual(counts['tracks']['retried'], len(self.track_ids))
+        self.assertLessEqual(set(self.track_ids), set(self.tracks.iter_ids(FAILED)))
+        self.assertLessEqual(set(self.album_ids), set(self.albums.iter_ids(CACHED)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import contextlib
+import io
+import json
+import unittest
+from unittest import mock
+
+from requests import Response
+
+from spotify.scraper import SpotifyScraper
+from tests import TempFolderTestCase, unthrottle_spotify
+from utility.id_registry import CACHED, DEAD, FAILED, IdRegistry
+from utility.item_store import PackedItemStore
+
+
+def batch_response(status_code: int, items: list[dict | None] | None = None, body: bytes | None = None) -> Response:
+    res = Response()
+    res.status_code = status_code
+    res._content = body if body is not None else json.dumps({'tracks': items or []}).encode()
+    return res
+
+
+class BatchSplitTest(TempFolderTestCase):
+    """Batch requests answered by a patched `scrape_batch_ids`: a batch holding a bad id fails with a 400, the
+    missing ids are null in the response, and every response has `body` when it is set."""
+
+    BAD_IDS = {'id05', 'id06'}
+    MISSING_IDS = {'id02'}
+
+    @classmethod
+    def setUpClass(cls):
+        unthrottle_spotify()
+
+    def setUp(self):
+        super().setUp()
+        self.registry = IdRegistry(self.path("ids.db"))
+        self.store = PackedItemStore(self.path("packed"))
+        self.scraper = SpotifyScraper('tracks', registry=self.registry, store=self.store)
+        self.ids = [f"id{i:02d}" for i in range(8)]
+        self.registry.add_ids(self.ids)
+        self.requests = []
+        self.body = None
+        patcher = mock.patch.object(SpotifyScraper, 'scrape_batch_ids', autospec=True, side_effect=self.answer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.store.close()
+        self.registry.close()
+
+    def answer(self, scraper: SpotifyScraper, ids: list[str]) -> Response:
+        self.requests.append(list(ids))
+        if self.body is not None:
+            return batch_response(200, body=self.body)
+        if self.BAD_IDS & set(ids):
+            return batch_response(400)
+        return batch_response(200, [None if id in self.MISSING_IDS else {'id': id} for id in ids])
+
+    def scrape(self, ids: list[str]):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.scraper.scrape_work(ids, batchmode=len(ids))
+
+    def test_split_isolates_the_bad_ids(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            items, bad_ids = self.scraper.scrape_batch_with_split(self.ids)
+        self.assertEqual(bad_ids, {'id05': 400, 'id06': 400})
+        self.assertEqual([item['id'] for item in items], ['id00', 'id01', 'id03', 'id04', 'id07'])
+        # the healthy half is fetched whole, the failing half is split down to single ids
+        self.assertEqual(self.requests, [self.ids, self.ids[:4], self.ids[4:], ['id04', 'id05'], ['id04'], ['id05'],
+                                         ['id06', 'id07'], ['id06'], ['id07']])
+
+    def test_healthy_batch_is_a_single_request(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            items, bad_ids = self.scraper.scrape_batch_with_split(self.ids[:4])
+        self.assertEqual((len(items), bad_ids, len(self.requests)), (3, {}, 1))
+
+    def test_scrape_work_records_every_id(self):
+        cached_ids, (retried, dead) = self.scrape(self.ids)
+        self.assertEqual(sorted(cached_ids), ['id00', 'id01', 'id03', 'id04', 'id07'])
+        self.assertEqual((retried, dead), (1, 2))
+        self.assertEqual(sorted(self.registry.iter_ids(DEAD)), ['id05', 'id06'])
+        self.assertEqual(list(self.registry.iter_ids(FAILED)), ['id02'])
+        self.assertEqual(self.store.get('id07'), {'id': 'id07'})
+
+    def test_unexpected_body_fails_the_batch(self):
+        self.body = b'{"error": "no tracks"}'
+        cached_ids, counts = self.scrape(self.ids[:4])
+        self.assertEqual((cached_ids, counts), ([], (4, 0)))
+        self.assertEqual(self.registry.count(CACHED), 0)
+        self.assertEqual(self.registry.count(FAILED), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+from tests import TempFolderTestCase
+from utility.item_store import PackedItemStore
+from utility.snapshot import ParsedSnapshot, store_signature
+
+BATCHES = [{'id': ['a', 'b'], 'attribute_name': ['A', 'B']}, {'id': ['c'], 'attribute_name': ['C']}]
+
+
+class ParsedSnapshotTest(TempFolderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.snapshot = ParsedSnapshot(self.path("snapshots"))
+
+    def test_batches_round_trip(self):
+        self.assertIsNone(self.snapshot.load("signature", ['attribute_name']))
+        self.snapshot.save("signature", ['id', 'attribute_name'], iter(BATCHES))
+        self.assertEqual(list(self.snapshot.load("signature", ['attribute_name'])), BATCHES)
+        self.assertIsNone(self.snapshot.load("other", ['attribute_name']))
+        self.assertIsNone(self.snapshot.load("signature", ['field_genres']))
+
+    def test_columns_of_the_same_batches_are_kept(self):
+        self.snapshot.save("signature", ['id', 'attribute_name'], iter(BATCHES))
+        self.snapshot.save("signature", ['id', 'y'], iter([{'id': ['a', 'b'], 'y': [1, 2]}, {'id': ['c'], 'y': [3]}]))
+        self.assertEqual(list(self.snapshot.load("signature", ['attribute_name', 'y'])),
+                         [{'id': ['a', 'b'], 'attribute_name': ['A', 'B'], 'y': [1, 2]},
+                          {'id': ['c'], 'attribute_name': ['C'], 'y': [3]}])
+
+    def test_columns_of_other_batches_are_dropped(self):
+        # saved with another chunk size, the batches of y no longer match the rows of the new id column
+        rows = [chr(ord('a') + i) for i in range(8)]
+        self.snapshot.save("signature", ['id', 'x', 'y'],
+                           ({'id': rows[i:i + 2], 'x': rows[i:i + 2], 'y': rows[i:i + 2]} for i in range(0, 8, 2)))
+        self.snapshot.save("signature", ['id', 'x', 'z'],
+                           ({'id': rows[i:i + 4], 'x': rows[i:i + 4], 'z': rows[i:i + 4]} for i in range(0, 8, 4)))
+        self.assertIsNone(self.snapshot.load("signature", ['y']))
+        self.assertEqual([batch['z'] for batch in self.snapshot.load("signature", ['z'])], [rows[:4], rows[4:]])
+
+    def test_signature_changes_with_the_items(self):
+        store = PackedItemStore(self.path("packed"))
+        store.put('a', {'id': 'a'})
+        signature = store_signature(store, {'spotify_id': 'id'})
+        self.assertNotEqual(store_signature(store, {'spotify_id': 'id', 'name': 'name'}), signature)
+        store.put('b', {'id': 'b'})
+        self.assertNotEqual(store_signature(store, {'spotify_id': 'id'}), signature)
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import json
+import threading
+import unittest
+from collections import Counter
+
+from tests import REPLAY_SERVER, TempFolderTestCase
+from utility.token_pool import TokenPool, parse_client_credentials
+
+RATE_LIMIT = {'rate': 1000.0, 'min_rate': 1.0, 'max_rate': 1000.0, 'burst': 1000}
+
+
+class ParseClientCredentialsTest(unittest.TestCase):
+    def test_extra_credentials_follow_the_primary_one(self):
+        self.assertEqual(parse_client_credentials("id", "secret", "a:1, b:2,,id:secret"),
+                         [("id", "secret"), ("a", "1"), ("b", "2")])
+
+    def test_extra_credentials_without_a_primary_one(self):
+        self.assertEqual(parse_client_credentials(None, None, "a:1"), [("a", "1")])
+        self.assertEqual(parse_client_credentials("id", "secret", ""), [("id", "secret")])
+
+    def test_malformed_entry(self):
+        for extra in ("a:1,b", "a:1,:2", "a:"):
+            with self.subTest(extra=extra), self.assertRaisesRegex(ValueError, "SPOTIFY_CLIENT_CREDENTIALS"):
+                parse_client_credentials("id", "secret", extra)
+
+
+class TokenPoolTest(TempFolderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pool = self.token_pool()
+
+    def tearDown(self):
+        self.pool.stop()
+
+    def token_pool(self) -> TokenPool:
+        return TokenPool(f"{REPLAY_SERVER.url}/api/token", [("a", "1"), ("b", "2"), ("c", "3")],
+                         self.path("token_pool.json"), rate_limit=RATE_LIMIT)
+
+    def selected_indexes(self, count: int) -> list[int]:
+        indexes = []
+        for _ in range(count):
+            with self.pool.credential() as rate_limiter:
+                indexes.append(self.pool.rate_limiters.index(rate_limiter))
+        return indexes
+
+    def test_credentials_in_rotation(self):
+        self.assertEqual(self.selected_indexes(6), [0, 1, 2, 0, 1, 2])
+
+    def test_paused_credential_is_avoided(self):
+        self.pool.rate_limiters[1].on_rate_limited(60)
+        self.assertNotIn(1, self.selected_indexes(6))
+
+    def test_authorization_of_the_selected_credential(self):
+        with self.pool.credential():
+            first = self.pool.get_authorization()
+            self.assertEqual(self.pool.get_authorization(), first)
+        with self.pool.credential():
+            self.assertNotEqual(self.pool.get_authorization(), first)
+
+    def test_concurrent_selection_is_spread(self):
+        indexes, lock = [], threading.Lock()
+        self.selected_indexes(1)  # fetches the tokens once
+
+        def select():
+            for index in self.selected_indexes(100):
+                with lock:
+                    indexes.append(index)
+
+        threads = [threading.Thread(target=select) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # without the rotation lock, threads reading the same rotation index would pick the same credential
+        counts = Counter(indexes)
+        self.assertEqual(sum(counts.values()), 800)
+        self.assertLessEqual(max(counts.values()) - min(counts.values()), 1)
+
+    def test_tokens_are_cached_for_the_other_processes(self):
+        requests = REPLAY_SERVER.counts().get('token', 0)
+        with self.pool.credential():
+            authorization = self.pool.get_authorization()
+        self.assertEqual(REPLAY_SERVER.counts().get('token', 0) - requests, 3)
+        with open(self.path("token_pool.json")) as f:
+            self.assertEqual(set(json.load(f)), {"a", "b", "c"})
+
+        other = self.token_pool()
+        self.addCleanup(other.stop)
+        with other.credential():
+            self.assertEqual(other.get_authorization(), authorization)
+        self.assertEqual(REPLAY_SERVER.counts().get('token', 0) - requests, 3)
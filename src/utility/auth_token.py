@@ -4,25 +4,28 @@ import requests
 from utility.utility import is_success_code
 import json
 import os
-from os.path import abspath, join
 import base64
-
-from utility.variables import SPOTIFY_AUTH_URL, SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, TEMP_PATH
+import threading
 
 
 class AuthToken:
     seconds_bias = 4
 
-    def __init__(self, auth_url: str, client_id: str, client_secret: str, local_storage_path: str):
+    def __init__(self, auth_url: str, client_id: str, client_secret: str, local_storage_path: str | None = None):
         """
+        Args:
+            local_storage_path (str, optional): File the token is stored to. Defaults to None, for a token
+                whose storage is handled by its owner, e.g. a `TokenPool`.
         """
         self.auth_url: str = auth_url
         self.client_id: str = client_id
         self.client_secret: str = client_secret
         self.local_storage_path = local_storage_path
+        # concurrent scrapers share the token, only one of them should refresh it
+        self.__lock = threading.Lock()
 
         # load from localstorage, otherwise initialize with null values
-        if os.path.exists(local_storage_path):
+        if local_storage_path and os.path.exists(local_storage_path):
             self.loadToken()
         else:
             self.access_token: str = ""
@@ -59,10 +62,12 @@ class AuthToken:
         #     self.renew_token()
         #     # store the token to be reused if not expired
         #     self.storeTokenToFile()
-        if self.is_expired():
-            self.get_new_token()
-            # store the token to be reused if not expired
-            self.storeTokenToFile()
+        with self.__lock:
+            if self.is_expired():
+                self.get_new_token()
+                # store the token to be reused if not expired
+                if self.local_storage_path:
+                    self.storeTokenToFile()
 
     def get_new_token(self):
         # setup authentication headers, send as x-www-form-urlencoded type of data
@@ -130,10 +135,3 @@ class AuthToken:
             }
             json.dump(store, f)
 
-
-SPOTIFY_AUTH_TOKEN = AuthToken(
-    SPOTIFY_AUTH_URL,
-    SPOTIFY_CLIENT_ID,
-    SPOTIFY_CLIENT_SECRET,
-    abspath(join(TEMP_PATH, "spotify_auth_token.json")),
-)
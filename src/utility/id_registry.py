@@ -0,0 +1,470 @@
+import csv
+import os
+import sqlite3
+import threading
+import time
+from os.path import abspath
+from typing import Callable, Iterable, Iterator
+
+# states of an id in the registry
+PENDING = 'pending'
+CACHED = 'cached'
+FAILED = 'failed'
+DEAD = 'dead'
+
+# columns added after the creation of the table, added to older registries when they are opened
+MIGRATED_COLUMNS = {
+    'next_attempt_at': 'REAL',
+    'last_error': 'TEXT',
+    'depth': 'INTEGER NOT NULL DEFAULT 0',
+    'expanded_at': 'REAL',
+    'etag': 'TEXT',
+    'snapshot_id': 'TEXT',
+    'lease_owner': 'TEXT',
+    'lease_expires_at': 'REAL',
+}
+
+
+class IdRegistry:
+    """
+    Indexed on-disk registry of the ids of an endpoint, stored in SQLite.
+
+    Every id has a state (pending, cached, failed or dead), a retry count, the time of its last fetch and an
+    optional name (used by musicbrainz, which looks artists up by name). Failed ids also keep the time of
+    their next attempt and their last error, see `RetryQueue`. Ids found by the crawler keep their crawl
+    depth and the time their references were expanded, see `GraphCrawler`. Cached ids keep the ETag of their
+    response and their snapshot id, used to skip unchanged items when they are refreshed. Pending ids can be
+    leased by a worker for a limited time, so several processes share the registry, see `ScrapeLease`.
+    Status updates touch a single row, so the scrapers record their progress as they go instead of rewriting
+    a csv file, and a crash never loses more than the request in flight.
+
+    The registry can be imported from and exported to the `ID,CACHED` csv format of `ids.csv`, and picks up
+    the rows added to the csv file since its last sync, see `sync_csv`.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path (str): Path of the SQLite database, created if it does not exist.
+        """
+        self.db_path = db_path
+        # the scrapers update the registry from their worker threads
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=60)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.execute("""
+            CREATE TABLE IF NOT EXISTS ids (
+                id TEXT PRIMARY KEY,
+                state TEXT NOT NULL DEFAULT 'pending',
+                retry_count INTEGER NOT NULL DEFAULT 0,
+                last_fetched REAL,
+                name TEXT
+            )
+        """)
+        self.__conn.execute("CREATE INDEX IF NOT EXISTS ids_state ON ids (state)")
+        # size and modification time of the csv files the registry was last synced with
+        self.__conn.execute("CREATE TABLE IF NOT EXISTS csv_syncs (path TEXT PRIMARY KEY, size INTEGER, mtime REAL)")
+        self.__migrate()
+        self.__conn.execute("CREATE INDEX IF NOT EXISTS ids_retry ON ids (state, next_attempt_at)")
+        self.__conn.execute("CREATE INDEX IF NOT EXISTS ids_expanded ON ids (state, expanded_at)")
+
+    def __migrate(self):
+        columns = {row[1] for row in self.__conn.execute("PRAGMA table_info(ids)").fetchall()}
+        for column, definition in MIGRATED_COLUMNS.items():
+            if column not in columns:
+                self.__conn.execute(f"ALTER TABLE ids ADD COLUMN {column} {definition}")
+
+    def __execute(self, query: str, params: Iterable = ()) -> list[tuple]:
+        with self.__lock:
+            return self.__conn.execute(query, params).fetchall()
+
+    def __iter_rows(self, query: str, params: tuple = (), batch_size: int = 10000) -> Iterator[list[tuple]]:
+        # keyset pagination on the rowid, the query selects the rowid first and filters on `rowid > ?`
+        last_rowid = 0
+        while True:
+            rows = self.__execute(query, (*params, last_rowid, batch_size))
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            yield rows
+
+    def __executemany(self, query: str, params: Iterable) -> int:
+        with self.__lock:
+            self.__conn.execute("BEGIN")
+            try:
+                before = self.__conn.total_changes
+                self.__conn.executemany(query, params)
+                self.__conn.execute("COMMIT")
+                return self.__conn.total_changes - before
+            except BaseException:
+                self.__conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self.__lock:
+            self.__conn.close()
+
+    # ------------------------------------ ADD IDS ------------------------------------
+
+    def add_ids(self, ids: Iterable[str], state: str = PENDING, depth: int = 0) -> int:
+        """Adds new ids to the registry, ids already registered are left untouched.
+
+        Args:
+            ids (Iterable[str]): Ids to add, None values are skipped.
+            state (str, optional): State of the new ids. Defaults to PENDING.
+            depth (int, optional): Crawl depth of the new ids, 0 for seed ids. Defaults to 0.
+
+        Returns:
+            int: Number of ids that were not registered yet.
+        """
+        rows = ((id, state, depth) for id in ids if id is not None)
+        return self.__executemany("INSERT OR IGNORE INTO ids (id, state, depth) VALUES (?, ?, ?)", rows)
+
+    def add_named_ids(self, named_ids: Iterable[tuple[str, str]]) -> int:
+        """Adds new ids along with their name, the name of registered ids is updated.
+
+        Args:
+            named_ids (Iterable[tuple[str, str]]): Pairs of id and name.
+
+        Returns:
+            int: Number of inserted or updated rows.
+        """
+        return self.__executemany(
+            "INSERT INTO ids (id, name) VALUES (?, ?) ON CONFLICT (id) DO UPDATE SET name = excluded.name",
+            named_ids
+        )
+
+    # ---------------------------------- UPDATE STATES ----------------------------------
+
+    def mark_cached(self, ids: Iterable[str]):
+        now = time.time()
+        self.__executemany("UPDATE ids SET state = 'cached', last_fetched = ? WHERE id = ?",
+                           ((now, id) for id in ids))
+
+    def mark_pending(self, ids: Iterable[str], reset_retries: bool = False):
+        if reset_retries:
+            query = "UPDATE ids SET state = 'pending', retry_count = 0, next_attempt_at = NULL WHERE id = ?"
+        else:
+            query = "UPDATE ids SET state = 'pending' WHERE id = ?"
+        self.__executemany(query, ((id,) for id in ids))
+
+    def schedule_retries(self, retries: Iterable[tuple[str, float, str]]):
+        """Marks ids as failed and schedules their next attempt.
+
+        Args:
+            retries (Iterable[tuple[str, float, str]]): Tuples of id, timestamp of the next attempt and error.
+        """
+        now = time.time()
+        self.__executemany(
+            "UPDATE ids SET state = 'failed', retry_count = retry_count + 1, last_fetched = ?, "
+            "next_attempt_at = ?, last_error = ? WHERE id = ?",
+            ((now, next_attempt_at, error, id) for id, next_attempt_at, error in retries)
+        )
+
+    def mark_dead(self, dead_ids: Iterable[tuple[str, str]]):
+        """Moves ids to the dead-letter state, they are no longer retried until they are requeued.
+
+        Args:
+            dead_ids (Iterable[tuple[str, str]]): Pairs of id and error.
+        """
+        now = time.time()
+        self.__executemany(
+            "UPDATE ids SET state = 'dead', retry_count = retry_count + 1, last_fetched = ?, "
+            "next_attempt_at = NULL, last_error = ? WHERE id = ?",
+            ((now, error, id) for id, error in dead_ids)
+        )
+
+    def requeue_cached(self) -> int:
+        """Puts every cached id back in the pending state, so the next scrape refreshes them.
+
+        Returns:
+            int: Number of requeued ids.
+        """
+        with self.__lock:
+            return self.__conn.execute("UPDATE ids SET state = 'pending' WHERE state = 'cached'").rowcount
+
+    def set_validators(self, validators: Iterable[tuple[str, str | None, str | None]]):
+        """Stores the values identifying the version of the cached items.
+
+        Args:
+            validators (Iterable[tuple[str, str | None, str | None]]): Tuples of id, ETag of the response and
+                snapshot id of the item.
+        """
+        self.__executemany("UPDATE ids SET etag = ?, snapshot_id = ? WHERE id = ?",
+                           ((etag, snapshot_id, id) for id, etag, snapshot_id in validators))
+
+    def mark_expanded(self, ids: Iterable[str]):
+        now = time.time()
+        self.__executemany("UPDATE ids SET expanded_at = ? WHERE id = ?", ((now, id) for id in ids))
+
+    def claim_due_retries(self, n: int, now: float, claimed_until: float) -> list[str]:
+        """Returns up to `n` failed ids whose next attempt is due and postpones their next attempt to
+        `claimed_until`, so they are not handed out twice while their request is in flight.
+
+        Returns:
+            list[str]: Ids to retry.
+        """
+        with self.__lock:
+            self.__conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.__conn.execute(
+                    "SELECT id FROM ids WHERE state = 'failed' AND (next_attempt_at IS NULL OR next_attempt_at <= ?) "
+                    "ORDER BY next_attempt_at LIMIT ?", (now, n)
+                ).fetchall()
+                ids = [id for (id,) in rows]
+                self.__conn.executemany("UPDATE ids SET next_attempt_at = ? WHERE id = ?",
+                                        ((claimed_until, id) for id in ids))
+                self.__conn.execute("COMMIT")
+                return ids
+            except BaseException:
+                self.__conn.execute("ROLLBACK")
+                raise
+
+    def lease_pending(self, owner: str, n: int, now: float, expires_at: float) -> list[str]:
+        """Leases up to `n` pending ids to a worker until `expires_at`. Ids leased by another worker are skipped
+        until their lease expires, the ids of a crashed worker are thus reclaimed automatically.
+
+        Returns:
+            list[str]: Leased ids, in insertion order.
+        """
+        with self.__lock:
+            self.__conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.__conn.execute(
+                    "SELECT id FROM ids WHERE state = 'pending' AND (lease_expires_at IS NULL OR lease_expires_at < ?) "
+                    "ORDER BY rowid LIMIT ?", (now, n)
+                ).fetchall()
+                ids = [id for (id,) in rows]
+                self.__conn.executemany("UPDATE ids SET lease_owner = ?, lease_expires_at = ? WHERE id = ?",
+                                        ((owner, expires_at, id) for id in ids))
+                self.__conn.execute("COMMIT")
+                return ids
+            except BaseException:
+                self.__conn.execute("ROLLBACK")
+                raise
+
+    def renew_leases(self, owner: str, expires_at: float) -> int:
+        """Extends the leases of a worker on the ids that are still pending.
+
+        Returns:
+            int: Number of renewed leases.
+        """
+        with self.__lock:
+            return self.__conn.execute(
+                "UPDATE ids SET lease_expires_at = ? WHERE lease_owner = ? AND state = 'pending'",
+                (expires_at, owner)
+            ).rowcount
+
+    def release_leases(self, owner: str, ids: Iterable[str] | None = None) -> int:
+        """Releases the leases of a worker, the ids are immediately available to the other workers.
+
+        Args:
+            owner (str): Worker holding the leases.
+            ids (Iterable[str], optional): Ids to release. Defaults to None, for every lease of the worker.
+
+        Returns:
+            int: Number of released leases.
+        """
+        if ids is None:
+            with self.__lock:
+                return self.__conn.execute(
+                    "UPDATE ids SET lease_owner = NULL, lease_expires_at = NULL WHERE lease_owner = ?", (owner,)
+                ).rowcount
+        return self.__executemany(
+            "UPDATE ids SET lease_owner = NULL, lease_expires_at = NULL WHERE id = ? AND lease_owner = ?",
+            ((id, owner) for id in ids)
+        )
+
+    def get_retry_counts(self, ids: Iterable[str]) -> dict[str, int]:
+        counts = {}
+        for id in ids:
+            rows = self.__execute("SELECT retry_count FROM ids WHERE id = ?", (id,))
+            if rows:
+                counts[id] = rows[0][0]
+        return counts
+
+    def next_retry_at(self) -> float | None:
+        """
+        Returns:
+            float | None: Timestamp of the earliest scheduled retry, None if no id is failed.
+        """
+        return self.__execute("SELECT MIN(next_attempt_at) FROM ids WHERE state = 'failed'")[0][0]
+
+    def iter_dead(self) -> Iterator[tuple[str, int, float, str]]:
+        """
+        Yields:
+            tuple[str, int, float, str]: Id, number of attempts, time of the last attempt and last error of
+                every id in the dead-letter state.
+        """
+        query = ("SELECT rowid, id, retry_count, last_fetched, last_error FROM ids "
+                 "WHERE state = 'dead' AND rowid > ? ORDER BY rowid LIMIT ?")
+        for rows in self.__iter_rows(query):
+            for _, id, retry_count, last_fetched, last_error in rows:
+                yield id, retry_count, last_fetched, last_error
+
+    # ------------------------------------- QUERIES -------------------------------------
+
+    def get_validators(self, id: str) -> tuple[str | None, str | None]:
+        """
+        Returns:
+            tuple[str | None, str | None]: ETag and snapshot id of the stored version of the item.
+        """
+        rows = self.__execute("SELECT etag, snapshot_id FROM ids WHERE id = ?", (id,))
+        return rows[0] if rows else (None, None)
+
+    def get_name(self, id: str) -> str | None:
+        rows = self.__execute("SELECT name FROM ids WHERE id = ?", (id,))
+        return rows[0][0] if rows else None
+
+    def count(self, state: str | None = None) -> int:
+        if state is None:
+            return self.__execute("SELECT COUNT(*) FROM ids")[0][0]
+        return self.__execute("SELECT COUNT(*) FROM ids WHERE state = ?", (state,))[0][0]
+
+    def count_backlog(self) -> int:
+        """
+        Returns:
+            int: Number of ids left to scrape, pending or waiting for a retry.
+        """
+        return self.__execute("SELECT COUNT(*) FROM ids WHERE state IN ('pending', 'failed')")[0][0]
+
+    def iter_pending(self, batch_size: int) -> Iterator[list[str]]:
+        """Iterates once over the ids that are pending, in batches. Ids whose state changes while
+        iterating are not returned twice.
+
+        Args:
+            batch_size (int): Maximum number of ids per batch.
+
+        Yields:
+            list[str]: Batch of pending ids, in insertion order.
+        """
+        query = "SELECT rowid, id FROM ids WHERE state = 'pending' AND rowid > ? ORDER BY rowid LIMIT ?"
+        for rows in self.__iter_rows(query, batch_size=batch_size):
+            yield [id for _, id in rows]
+
+    def iter_unexpanded(self, max_depth: int, batch_size: int = 1000) -> Iterator[list[tuple[str, int]]]:
+        """Iterates over the cached ids whose references have not been expanded by the crawler yet.
+
+        Args:
+            max_depth (int): Only return the ids whose crawl depth is below this value.
+            batch_size (int, optional): Maximum number of ids per batch. Defaults to 1000.
+
+        Yields:
+            list[tuple[str, int]]: Batch of ids along with their crawl depth, in insertion order.
+        """
+        query = ("SELECT rowid, id, depth FROM ids WHERE state = 'cached' AND expanded_at IS NULL AND depth < ? "
+                 "AND rowid > ? ORDER BY rowid LIMIT ?")
+        for rows in self.__iter_rows(query, (max_depth,), batch_size):
+            yield [(id, depth) for _, id, depth in rows]
+
+    def iter_ids(self, state: str | None = None) -> Iterator[str]:
+        """
+        Args:
+            state (str, optional): Only return the ids in this state. Defaults to None, for every id.
+
+        Yields:
+            str: Registered ids, in insertion order.
+        """
+        if state is None:
+            query, params = "SELECT rowid, id FROM ids WHERE rowid > ? ORDER BY rowid LIMIT ?", ()
+        else:
+            query = "SELECT rowid, id FROM ids WHERE state = ? AND rowid > ? ORDER BY rowid LIMIT ?"
+            params = (state,)
+        for rows in self.__iter_rows(query, params):
+            for _, id in rows:
+                yield id
+
+    # ---------------------------------- CSV COMPATIBILITY ----------------------------------
+
+    def import_csv(self, csv_path: str, cached_ids: set[str] | None = None) -> int:
+        """Imports an `ids.csv` file, with an `ID` column and optional `CACHED` and `Name` columns.
+
+        Args:
+            csv_path (str): Path of the csv file.
+            cached_ids (set[str], optional): Ids stored on disk. When given, it decides which ids are
+                cached instead of the `CACHED` column. Defaults to None.
+
+        Returns:
+            int: Number of ids that were not registered yet.
+        """
+        if not os.path.exists(csv_path):
+            return 0
+        before = self.count()
+        self.__executemany(
+            "INSERT INTO ids (id, state, name) VALUES (?, ?, ?) ON CONFLICT (id) DO UPDATE SET "
+            "name = COALESCE(excluded.name, ids.name), "
+            "state = CASE WHEN excluded.state = 'cached' THEN 'cached' ELSE ids.state END",
+            self.__read_csv(csv_path, cached_ids)
+        )
+        self.__record_csv_sync(csv_path)
+        return self.count() - before
+
+    def sync_csv(self, csv_path: str, cached_ids: Callable[[], set[str]] | None = None) -> int:
+        """Adds the ids of the csv file that are not registered yet, the registered ids are left untouched.
+        The file is only read when its size or modification time changed since the last sync, import or
+        export, so ids appended to `ids.csv` by hand or by a generator are picked up when the registry is opened.
+
+        Args:
+            csv_path (str): Path of the csv file.
+            cached_ids (Callable[[], set[str]], optional): Returns the ids stored on disk, only called when the
+                file changed, see `import_csv`. Defaults to None.
+
+        Returns:
+            int: Number of ids that were not registered yet.
+        """
+        if not os.path.exists(csv_path) or not self.__csv_changed(csv_path):
+            return 0
+        added = self.__executemany(
+            "INSERT OR IGNORE INTO ids (id, state, name) VALUES (?, ?, ?)",
+            self.__read_csv(csv_path, cached_ids() if cached_ids is not None else None)
+        )
+        self.__record_csv_sync(csv_path)
+        return added
+
+    @staticmethod
+    def __read_csv(csv_path: str, cached_ids: set[str] | None) -> list[tuple[str, str, str | None]]:
+        rows = []
+        with open(csv_path, newline='') as f:
+            for row in csv.DictReader(f):
+                id = row.get('ID')
+                if not id:
+                    continue
+                if cached_ids is not None:
+                    cached = id in cached_ids
+                else:
+                    cached = str(row.get('CACHED', '')).strip().lower() == 'true'
+                rows.append((id, CACHED if cached else PENDING, row.get('Name')))
+        return rows
+
+    def __csv_changed(self, csv_path: str) -> bool:
+        stat = os.stat(csv_path)
+        rows = self.__execute("SELECT size, mtime FROM csv_syncs WHERE path = ?", (abspath(csv_path),))
+        return not rows or rows[0] != (stat.st_size, stat.st_mtime)
+
+    def __record_csv_sync(self, csv_path: str):
+        stat = os.stat(csv_path)
+        self.__execute("INSERT OR REPLACE INTO csv_syncs (path, size, mtime) VALUES (?, ?, ?)",
+                       (abspath(csv_path), stat.st_size, stat.st_mtime))
+
+    def export_csv(self, csv_path: str, include_names: bool = False):
+        """Exports the registry to the `ID,CACHED` csv format, dead-letter ids are left out like the scrapers
+        used to remove failing ids from `ids.csv`.
+
+        Args:
+            csv_path (str): Path of the csv file, overwritten if it exists.
+            include_names (bool, optional): Adds a `Name` column. Defaults to False.
+        """
+        query = "SELECT rowid, id, state, name FROM ids WHERE state != 'dead' AND rowid > ? ORDER BY rowid LIMIT ?"
+        tmp_path = f"{csv_path}.tmp"
+        with open(tmp_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['ID', 'Name', 'CACHED'] if include_names else ['ID', 'CACHED'])
+            for rows in self.__iter_rows(query):
+                for _, id, state, name in rows:
+                    cached = state == CACHED
+                    writer.writerow([id, name, cached] if include_names else [id, cached])
+        # replace the csv in one step so a crash never leaves a truncated file
+        os.replace(tmp_path, csv_path)
+        # the exported rows are already registered, the next sync skips them
+        self.__record_csv_sync(csv_path)
@@ -0,0 +1,321 @@
+import json
+import os
+from abc import ABC, abstractmethod
+import sqlite3
+import threading
+import time
+import uuid
+from os.path import join as joinpath
+from pathlib import Path
+from typing import Iterator
+
+from utility.json_decoder import json_loads
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# name of the index of a packed store, its presence marks a folder as a packed store
+PACKED_INDEX_NAME = "index.sqlite"
+# a writer starts a new segment once its segment reaches this size
+PACKED_SEGMENT_MAX_SIZE = 256 * 1024 * 1024
+
+
+class ItemStore(ABC):
+    """
+    Storage of the scraped items of an endpoint, keyed by id.
+
+    Items are stored as json. `put` accepts either a dictionary or the raw json bytes of the item, e.g.
+    the content of the response, which avoids decoding and encoding the item again. A backend implements
+    the abstract methods, an incomplete backend cannot be instantiated.
+    """
+
+    @abstractmethod
+    def put(self, id: str, item: dict | bytes):
+        ...
+
+    @abstractmethod
+    def get_bytes(self, id: str) -> bytes | None:
+        ...
+
+    @abstractmethod
+    def ids(self) -> Iterator[str]:
+        ...
+
+    @abstractmethod
+    def stats(self) -> Iterator[tuple[str, int, float]]:
+        """
+        Yields:
+            tuple[str, int, float]: Id, size and modification time of every item, read without the items.
+        """
+        ...
+
+    def items_bytes(self) -> Iterator[tuple[str, bytes]]:
+        """
+        Yields:
+            tuple[str, bytes]: Id and raw json of every item, in storage order.
+        """
+        for id in self.ids():
+            data = self.get_bytes(id)
+            if data is not None:
+                yield id, data
+
+    @abstractmethod
+    def __contains__(self, id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    def get(self, id: str) -> dict | None:
+        """
+        Returns:
+            dict | None: The decoded item, None if the id is not stored.
+        """
+        data = self.get_bytes(id)
+        return json_loads(data) if data is not None else None
+
+    def items(self) -> Iterator[tuple[str, dict]]:
+        """
+        Yields:
+            tuple[str, dict]: Id and decoded json of every item, in storage order.
+        """
+        for id, data in self.items_bytes():
+            yield id, json_loads(data)
+
+    def close(self):
+        pass
+
+
+class FolderItemStore(ItemStore):
+    """
+    Store of one indented json file per item, `items/<id>.json`. This is the original storage of the scrapers.
+    """
+
+    def __init__(self, items_folder_path: str):
+        self.items_folder_path = items_folder_path
+        Path(items_folder_path).mkdir(parents=True, exist_ok=True)
+
+    def __path(self, id: str) -> str:
+        return joinpath(self.items_folder_path, f"{id}.json")
+
+    def put(self, id: str, item: dict | bytes):
+        if isinstance(item, (bytes, bytearray)):
+            item = json.loads(item)
+        with open(self.__path(id), "w") as f:
+            json.dump(item, f, indent=2)
+
+    def get_bytes(self, id: str) -> bytes | None:
+        try:
+            with open(self.__path(id), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def ids(self) -> Iterator[str]:
+        with os.scandir(self.items_folder_path) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json") and entry.is_file():
+                    yield entry.name[:-len(".json")]
+
+    def stats(self) -> Iterator[tuple[str, int, float]]:
+        with os.scandir(self.items_folder_path) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json") and entry.is_file():
+                    stat = entry.stat()
+                    yield entry.name[:-len(".json")], stat.st_size, stat.st_mtime
+
+    def __contains__(self, id: str) -> bool:
+        return os.path.isfile(self.__path(id))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.ids())
+
+
+class PackedItemStore(ItemStore):
+    """
+    Append-only store packing the items of an endpoint in a few large segment files.
+
+    Each item is appended as compact json (or the raw response bytes), optionally compressed with zstd,
+    and an SQLite index maps each id to its segment, offset and length. Lookups by id are a single
+    index query and one read, scans read the segments sequentially. Every writer appends to its own
+    segment, so several threads or processes can write to the same store. Storing an id again appends
+    the new version and points the index to it.
+    """
+
+    def __init__(self, folder_path: str, compression: str | None = None):
+        """
+        Args:
+            folder_path (str): Folder of the segments and of the index, created if it does not exist.
+            compression (str, optional): 'zstd' compresses the items that are written. Defaults to None.
+                Items are decompressed according to the index, whatever the compression of the writer.
+        """
+        if compression not in (None, 'zstd'):
+            raise ValueError(f"Unsupported item store compression: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError("The zstandard package is required for zstd compression, run `pip install zstandard`.")
+        self.folder_path = folder_path
+        self.compression = compression
+        Path(folder_path).mkdir(parents=True, exist_ok=True)
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(joinpath(folder_path, PACKED_INDEX_NAME), check_same_thread=False,
+                                      isolation_level=None, timeout=60)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                id TEXT PRIMARY KEY,
+                segment TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                compression TEXT,
+                stored_at REAL NOT NULL
+            )
+        """)
+        self.__conn.execute("CREATE INDEX IF NOT EXISTS items_position ON items (segment, offset)")
+        self.__writer = None
+        self.__writer_segment = None
+        self.__readers = {}
+        self.__compressor = zstandard.ZstdCompressor() if compression == 'zstd' else None
+        self.__decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+    # ------------------------------------- WRITES -------------------------------------
+
+    def __open_writer(self):
+        # each writer has its own segment, named after its creation so segments sort by age
+        self.__writer_segment = f"segment-{time.time_ns()}-{uuid.uuid4().hex[:8]}.bin"
+        self.__writer = open(joinpath(self.folder_path, self.__writer_segment), "ab")
+
+    def put(self, id: str, item: dict | bytes):
+        if isinstance(item, (bytes, bytearray)):
+            data = bytes(item)
+        else:
+            data = json.dumps(item, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        if self.__compressor is not None:
+            data = self.__compressor.compress(data)
+        with self.__lock:
+            if self.__writer is None or self.__writer.tell() >= PACKED_SEGMENT_MAX_SIZE:
+                if self.__writer is not None:
+                    self.__writer.close()
+                self.__open_writer()
+            offset = self.__writer.tell()
+            self.__writer.write(data)
+            # the bytes must reach the segment before the index points to them
+            self.__writer.flush()
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO items (id, segment, offset, length, compression, stored_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (id, self.__writer_segment, offset, len(data), self.compression, time.time())
+            )
+
+    # ------------------------------------- READS -------------------------------------
+
+    def __read(self, segment: str, offset: int, length: int, compression: str | None) -> bytes:
+        reader = self.__readers.get(segment)
+        if reader is None:
+            reader = open(joinpath(self.folder_path, segment), "rb")
+            self.__readers[segment] = reader
+        reader.seek(offset)
+        data = reader.read(length)
+        if compression == 'zstd':
+            if self.__decompressor is None:
+                raise ImportError("The zstandard package is required to read zstd compressed items.")
+            data = self.__decompressor.decompress(data)
+        return data
+
+    def get_bytes(self, id: str) -> bytes | None:
+        with self.__lock:
+            row = self.__conn.execute("SELECT segment, offset, length, compression FROM items WHERE id = ?",
+                                      (id,)).fetchone()
+            if row is None:
+                return None
+            if self.__writer is not None:
+                self.__writer.flush()
+            return self.__read(*row)
+
+    def __iter_index(self, batch_size: int = 10000) -> Iterator[list[tuple]]:
+        # keyset pagination in storage order, so scans read each segment sequentially
+        last_segment, last_offset = "", -1
+        while True:
+            with self.__lock:
+                rows = self.__conn.execute(
+                    "SELECT id, segment, offset, length, compression FROM items "
+                    "WHERE (segment, offset) > (?, ?) ORDER BY segment, offset LIMIT ?",
+                    (last_segment, last_offset, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            _, last_segment, last_offset, _, _ = rows[-1]
+            yield rows
+
+    def ids(self) -> Iterator[str]:
+        for rows in self.__iter_index():
+            for row in rows:
+                yield row[0]
+
+    def stats(self) -> Iterator[tuple[str, int, float]]:
+        # a stored item is never rewritten in place, storing it again moves it and updates stored_at
+        last_id = ""
+        while True:
+            with self.__lock:
+                rows = self.__conn.execute("SELECT id, length, stored_at FROM items WHERE id > ? ORDER BY id LIMIT ?",
+                                           (last_id, 10000)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield from rows
+
+    def items_bytes(self) -> Iterator[tuple[str, bytes]]:
+        for rows in self.__iter_index():
+            for id, segment, offset, length, compression in rows:
+                with self.__lock:
+                    if self.__writer is not None:
+                        self.__writer.flush()
+                    data = self.__read(segment, offset, length, compression)
+                yield id, data
+
+    def __contains__(self, id: str) -> bool:
+        with self.__lock:
+            return self.__conn.execute("SELECT 1 FROM items WHERE id = ?", (id,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return self.__conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def close(self):
+        with self.__lock:
+            if self.__writer is not None:
+                self.__writer.close()
+                self.__writer = None
+            for reader in self.__readers.values():
+                reader.close()
+            self.__readers.clear()
+            self.__conn.close()
+
+
+def is_packed_store(folder_path: str) -> bool:
+    return os.path.exists(joinpath(folder_path, PACKED_INDEX_NAME))
+
+
+def migrate_folder_to_packed(source: FolderItemStore, target: PackedItemStore) -> int:
+    """Copies every item of a folder store into a packed store, items already packed are skipped.
+    The folder is left untouched, it can be deleted once the packed store has been checked.
+
+    Returns:
+        int: Number of migrated items.
+    """
+    migrated = 0
+    for id in source.ids():
+        if id in target:
+            continue
+        data = source.get_bytes(id)
+        try:
+            # repack the indented json in its compact form
+            target.put(id, json.loads(data))
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON of {id}, skipping: {e}")
+            continue
+        migrated += 1
+    return migrated
@@ -0,0 +1,42 @@
+import json
+from typing import Any, Callable
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+from utility.variables import JSON_DECODER
+
+
+def get_json_decoder(name: str = JSON_DECODER) -> Callable[[bytes | str], Any]:
+    """Returns the function decoding the stored items. "auto" picks orjson when it is installed, and falls back
+    to the standard library otherwise. Every decoder raises a ValueError on invalid json.
+
+    Args:
+        name (str, optional): "auto", "json", "orjson" or "ujson". Defaults to JSON_DECODER.
+
+    Returns:
+        Callable[[bytes | str], Any]: The `loads` function of the decoder.
+    """
+    if name == "auto":
+        return orjson.loads if orjson is not None else json.loads
+    if name == "json":
+        return json.loads
+    if name == "orjson":
+        if orjson is None:
+            raise ImportError("The orjson package is required for the orjson decoder, run `pip install orjson`.")
+        return orjson.loads
+    if name == "ujson":
+        if ujson is None:
+            raise ImportError("The ujson package is required for the ujson decoder, run `pip install ujson`.")
+        return ujson.loads
+    raise ValueError(f"Unsupported JSON decoder: {name}")
+
+
+json_loads = get_json_decoder()
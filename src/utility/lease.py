@@ -0,0 +1,90 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Iterable
+
+from utility.id_registry import IdRegistry
+from utility.variables import SCRAPE_LEASE_DURATION
+
+
+class ScrapeLease:
+    """
+    Leases of a scrape worker on the pending ids of a registry, so several processes, or several machines
+    sharing the registry file, scrape the same endpoint without scraping an id twice.
+
+    Ids are leased in batches for `duration` seconds. A background thread heartbeats the leases of the
+    worker while it runs, and the ids left when it stops are released. An id is completed when its state
+    leaves pending, and the ids of a crashed worker are leased again once its leases expire. The registry
+    relies on SQLite locking, a registry shared between machines must be on a filesystem with working locks.
+    """
+
+    def __init__(self, registry: IdRegistry, owner: str | None = None, duration: float = SCRAPE_LEASE_DURATION):
+        """
+        Args:
+            registry (IdRegistry): Registry of the leased ids.
+            owner (str, optional): Name of the worker. Defaults to None, for the host name, process id and a
+                random suffix.
+            duration (float, optional): Seconds the leases last without a heartbeat.
+                Defaults to SCRAPE_LEASE_DURATION.
+        """
+        self.owner = owner if owner is not None else f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.duration = duration
+        self.__registry = registry
+        self.__heartbeat: threading.Thread | None = None
+        self.__stopped = threading.Event()
+        self.__lock = threading.Lock()
+
+    def acquire(self, n: int) -> list[str]:
+        """
+        Returns:
+            list[str]: Up to `n` pending ids leased to this worker, empty when every pending id is leased.
+        """
+        self.__start_heartbeat()
+        now = time.time()
+        return self.__registry.lease_pending(self.owner, n, now, now + self.duration)
+
+    def release(self, ids: Iterable[str] | None = None) -> int:
+        """Gives leased ids back to the other workers.
+
+        Args:
+            ids (Iterable[str], optional): Ids to release. Defaults to None, for every id leased by this worker.
+
+        Returns:
+            int: Number of released ids.
+        """
+        return self.__registry.release_leases(self.owner, ids)
+
+    def renew(self) -> int:
+        """
+        Returns:
+            int: Number of leases extended by `duration` seconds.
+        """
+        return self.__registry.renew_leases(self.owner, time.time() + self.duration)
+
+    def stop(self):
+        """Stops the heartbeat and releases the ids this worker did not get to."""
+        self.__stopped.set()
+        with self.__lock:
+            heartbeat, self.__heartbeat = self.__heartbeat, None
+        if heartbeat is not None:
+            heartbeat.join()
+        self.release()
+        self.__stopped.clear()
+
+    def __start_heartbeat(self):
+        with self.__lock:
+            if self.__heartbeat is not None:
+                return
+            self.__heartbeat = threading.Thread(target=self.__heartbeat_loop, name=f"lease-{self.owner}", daemon=True)
+            self.__heartbeat.start()
+
+    def __heartbeat_loop(self):
+        # renew well before the expiry, a late heartbeat would hand the ids to another worker
+        interval = max(1.0, self.duration / 3)
+        while not self.__stopped.wait(interval):
+            try:
+                self.renew()
+            except Exception as e:
+                print(f"WARNING: Unable to renew the leases of {self.owner}: {e}")
@@ -0,0 +1,98 @@
+import hashlib
+import sqlite3
+import threading
+from os.path import dirname
+from pathlib import Path
+from typing import Iterator
+
+from utility.item_store import ItemStore
+
+
+class ItemManifest:
+    """
+    Record of the items of a store that a consumer, e.g. a loader or a parser, has already processed.
+
+    The manifest keeps the size, modification time and content hash of each processed item. `changed` yields
+    the items that are new or were modified since, so the consumer only processes the delta: the size and
+    modification time are compared first, the items whose metadata changed are read and compared by hash.
+    The yielded items are only recorded by `commit`, a consumer that fails before committing processes them
+    again on its next run.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path (str): Path of the SQLite file of the manifest, created if it does not exist.
+        """
+        Path(dirname(db_path)).mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=60)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                id TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                hash TEXT NOT NULL
+            )
+        """)
+        self.__pending: list[tuple[str, int, float, str]] = []
+        self.__rebuild = False
+
+    def changed(self, store: ItemStore, rebuild: bool = False) -> Iterator[tuple[str, bytes]]:
+        """
+        Args:
+            store (ItemStore): Store of the items.
+            rebuild (bool, optional): Yields every item, and replaces the manifest on commit. Defaults to False.
+
+        Yields:
+            tuple[str, bytes]: Id and raw json of the items that are new or changed since the last commit.
+        """
+        self.__rebuild = rebuild
+        with self.__lock:
+            recorded = {} if rebuild else {id: (size, mtime, hash) for id, size, mtime, hash in
+                                           self.__conn.execute("SELECT id, size, mtime, hash FROM items")}
+        for id, size, mtime in store.stats():
+            entry = recorded.get(id)
+            if entry is not None and entry[0] == size and entry[1] == mtime:
+                continue
+            data = store.get_bytes(id)
+            if data is None:
+                continue
+            hash = hashlib.blake2b(data, digest_size=16).hexdigest()
+            self.__pending.append((id, size, mtime, hash))
+            # a rewritten item with the same content only has its metadata updated
+            if entry is None or entry[2] != hash:
+                yield id, data
+
+    def commit(self) -> int:
+        """Records the items yielded by `changed` as processed.
+
+        Returns:
+            int: Number of recorded items.
+        """
+        pending, self.__pending = self.__pending, []
+        with self.__lock:
+            self.__conn.execute("BEGIN")
+            if self.__rebuild:
+                self.__conn.execute("DELETE FROM items")
+            self.__conn.executemany("INSERT OR REPLACE INTO items (id, size, mtime, hash) VALUES (?, ?, ?, ?)",
+                                    pending)
+            self.__conn.execute("COMMIT")
+        self.__rebuild = False
+        return len(pending)
+
+    def reset(self):
+        """Forgets every processed item, the next `changed` yields the whole store."""
+        with self.__lock:
+            self.__conn.execute("DELETE FROM items")
+        self.__pending = []
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return self.__conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def close(self):
+        with self.__lock:
+            self.__conn.close()
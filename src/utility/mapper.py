@@ -1,5 +1,6 @@
 import json
-from typing import Type, TypeVar, Any, Dict
+import keyword
+from typing import Type, TypeVar, Any, Dict, Callable
 
 T = TypeVar('T')
 
@@ -12,6 +13,56 @@ class JsonToObjectMapper:
         :param mapping: A dictionary representing the mapping from object attributes to JSON paths.
         """
         self.mapping = mapping
+        self.__required_fields = {json_path.split('.')[0].replace('[]', '') for json_path in mapping.values()}
+        self.__map = self.compile_mapping(mapping)
+        self.__map_values = self.compile_mapping(mapping, values=True)
+
+    @staticmethod
+    def compile_mapping(mapping: Dict[str, str], values: bool = False) -> Callable:
+        """
+        Generates the code of a function mapping JSON data with the given mapping, so the paths are split
+        once instead of for every object. The generated function follows `extract_value` step by step: a
+        missing key gives {}, a value that is not an object gives None, and a `[]` key returns the non-empty
+        items of its list, ignoring the rest of the path.
+
+        :param mapping: A dictionary representing the mapping from object attributes to JSON paths.
+        :param values: Generates a function returning the tuple of the attribute values instead.
+        :return: A function taking the JSON data and the class, returning the mapped object, or taking the JSON
+            data and returning the values of the attributes in the order of the mapping.
+        """
+        lines = ["def map(data):" if values else "def map(data, cls):"]
+        for i, json_path in enumerate(mapping.values()):
+            lines.append("    d = data")
+            lines += JsonToObjectMapper.__compile_path(json_path.split('.'), f"v{i}", "    ")
+        if values:
+            lines.append(f"    return ({''.join(f'v{i}, ' for i in range(len(mapping)))})")
+        arguments = []
+        for i, attr in enumerate(mapping):
+            if attr.isidentifier() and not keyword.iskeyword(attr):
+                arguments.append(f"{attr}=v{i}")
+            else:
+                arguments.append(f"**{{{attr!r}: v{i}}}")
+        if not values:
+            lines.append(f"    return cls({', '.join(arguments)})")
+        namespace = {}
+        exec(compile("\n".join(lines), f"<mapper {list(mapping)}>", "exec"), {'isinstance': isinstance, 'dict': dict},
+             namespace)
+        return namespace['map']
+
+    @staticmethod
+    def __compile_path(keys: list[str], target: str, indent: str) -> list[str]:
+        if not keys:
+            return [f"{indent}{target} = d"]
+        key = keys[0]
+        if '[]' in key:
+            # the items of the list are returned whole, whatever follows in the path
+            return [f"{indent}{target} = [s for s in d.get({key.replace('[]', '')!r}, []) if s]"]
+        return [f"{indent}if isinstance(d, dict):",
+                f"{indent}    d = d.get({key!r}, {{}})",
+                *JsonToObjectMapper.__compile_path(keys[1:], target, indent + "    "),
+                # once a value is not an object the path resolves to None
+                f"{indent}else:",
+                f"{indent}    {target} = None"]
 
     def extract_value(self, data, path):
         """
@@ -38,6 +89,23 @@ class JsonToObjectMapper:
                     return None
         return data
 
+    def required_fields(self) -> set[str]:
+        """
+        Returns the top-level JSON keys read by the mapping.
+
+        :return: The set of keys a JSON object needs to be mapped without missing data.
+        """
+        return set(self.__required_fields)
+
+    def has_required_fields(self, json_data: Dict[str, Any]) -> bool:
+        """
+        Checks whether the JSON data holds every top-level key read by the mapping.
+
+        :param json_data: A dictionary representing an object.
+        :return: True if the object can be mapped without missing data.
+        """
+        return isinstance(json_data, dict) and all(key in json_data for key in self.__required_fields)
+
     def map(self, json_data: Dict[str, Any], cls: Type[T]) -> T:
         """
         Maps JSON data to an object of the specified class based on the provided mapping.
@@ -46,9 +114,13 @@ class JsonToObjectMapper:
         :param cls: The class type to which the JSON data is to be mapped.
         :return: An instance of cls filled with data from the json_data.
         """
-        obj_data = {}
-        for attr, json_path in self.mapping.items():
-            value = self.extract_value(json_data, json_path)
-            obj_data[attr] = value
+        return self.__map(json_data, cls)
+
+    def map_values(self, json_data: Dict[str, Any]) -> tuple:
+        """
+        Extracts the values of the mapped attributes, e.g. to send them to another process instead of the object.
 
-        return cls(**obj_data)
+        :param json_data: A dictionary representing an object.
+        :return: The values of the attributes, in the order of the mapping.
+        """
+        return self.__map_values(json_data)
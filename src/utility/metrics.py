@@ -0,0 +1,239 @@
+import bisect
+import json
+import os
+import threading
+import time
+from os.path import abspath, join
+from typing import Callable
+
+from utility.variables import SCRAPE_METRICS_FLUSH_INTERVAL, SCRAPE_METRICS_FORMAT, SCRAPE_METRICS_LATENCY_BUCKETS, \
+    TEMP_PATH
+
+
+class ScrapeMetrics:
+    """
+    Structured instrumentation of the scrape requests, shared by every scraper of the process.
+
+    Records the latency histogram and the status codes of the requests of each api and endpoint, the time
+    spent waiting in the rate limiters versus in flight, the items cached per endpoint and their remaining
+    backlog. The metrics are flushed to a json or Prometheus text file every `flush_interval` seconds by a
+    background thread, the file always holds the totals since the start of the process.
+    """
+
+    def __init__(self, path: str, format: str = "json", flush_interval: float = SCRAPE_METRICS_FLUSH_INTERVAL,
+                 buckets: tuple[float, ...] = SCRAPE_METRICS_LATENCY_BUCKETS):
+        """
+        Args:
+            path (str): File the metrics are flushed to.
+            format (str, optional): "json" or "prometheus". Defaults to "json".
+            flush_interval (float, optional): Seconds between two flushes. Defaults to SCRAPE_METRICS_FLUSH_INTERVAL.
+            buckets (tuple[float, ...], optional): Upper bounds of the latency histogram buckets, in seconds.
+                Defaults to SCRAPE_METRICS_LATENCY_BUCKETS.
+        """
+        if format not in ("json", "prometheus"):
+            raise ValueError(f"Unsupported metrics format: {format}")
+        self.path = path
+        self.format = format
+        self.flush_interval = flush_interval
+        self.buckets = tuple(sorted(buckets))
+        self.started_at = time.time()
+        self.__lock = threading.Lock()
+        # histogram of each (api, endpoint): bucket counts, the last one is +Inf, sum and count
+        self.__latencies: dict[tuple[str, str], dict] = {}
+        self.__statuses: dict[tuple[str, str, str], int] = {}
+        self.__wait_seconds: dict[str, float] = {}
+        self.__in_flight_seconds: dict[str, float] = {}
+        self.__items: dict[str, int] = {}
+        self.__backlogs: dict[str, Callable[[], int]] = {}
+        self.__flusher: threading.Thread | None = None
+        self.__stopped = threading.Event()
+
+    # ------------------------------------- RECORD -------------------------------------
+
+    def record_request(self, api: str, endpoint: str | None, seconds: float, status_code: int | None):
+        """Records a request that received a response, or failed without one when `status_code` is None."""
+        key = (api, endpoint or "other")
+        with self.__lock:
+            histogram = self.__latencies.get(key)
+            if histogram is None:
+                histogram = {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+                self.__latencies[key] = histogram
+            histogram['buckets'][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+            status_key = (*key, str(status_code) if status_code is not None else "error")
+            self.__statuses[status_key] = self.__statuses.get(status_key, 0) + 1
+            self.__in_flight_seconds[api] = self.__in_flight_seconds.get(api, 0.0) + seconds
+        self.__start_flusher()
+
+    def record_wait(self, api: str, seconds: float):
+        """Records time spent waiting for the rate limiter of an api, including the Retry-After pauses."""
+        with self.__lock:
+            self.__wait_seconds[api] = self.__wait_seconds.get(api, 0.0) + seconds
+
+    def record_items(self, endpoint: str, n: int):
+        with self.__lock:
+            self.__items[endpoint] = self.__items.get(endpoint, 0) + n
+
+    def track_backlog(self, endpoint: str, backlog: Callable[[], int]):
+        """Registers the function returning the number of ids left to scrape of an endpoint, it is called
+        whenever the metrics are flushed."""
+        with self.__lock:
+            self.__backlogs[endpoint] = backlog
+
+    # ------------------------------------- EXPORT -------------------------------------
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            dict: Current value of every metric, in the layout of the json file.
+        """
+        with self.__lock:
+            latencies = {key: {**histogram, 'buckets': list(histogram['buckets'])}
+                         for key, histogram in self.__latencies.items()}
+            statuses = dict(self.__statuses)
+            wait_seconds = dict(self.__wait_seconds)
+            in_flight_seconds = dict(self.__in_flight_seconds)
+            items = dict(self.__items)
+            backlogs = dict(self.__backlogs)
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        # the requests are keyed by api first, the apis share endpoint names such as "other"
+        requests = {}
+        for (api, endpoint), histogram in latencies.items():
+            requests.setdefault(api, {})[endpoint] = {'latency': {
+                'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], histogram['buckets'])),
+                'sum': histogram['sum'],
+                'count': histogram['count'],
+            }}
+        for (api, endpoint, status), count in statuses.items():
+            requests[api][endpoint].setdefault('statuses', {})[status] = count
+        endpoints = {}
+        for endpoint, count in items.items():
+            endpoints.setdefault(endpoint, {}).update(items=count, items_per_second=count / elapsed)
+        for endpoint, backlog in backlogs.items():
+            try:
+                endpoints.setdefault(endpoint, {})['backlog'] = backlog()
+            except Exception as e:
+                print(f"WARNING: Unable to read the backlog of {endpoint}: {e}")
+        return {
+            'started_at': self.started_at,
+            'elapsed_seconds': elapsed,
+            'wait_seconds': wait_seconds,
+            'in_flight_seconds': in_flight_seconds,
+            'requests': requests,
+            'endpoints': endpoints,
+        }
+
+    def to_prometheus(self, snapshot: dict | None = None) -> str:
+        snapshot = snapshot if snapshot is not None else self.snapshot()
+        lines = [
+            "# HELP scrape_request_duration_seconds Latency of the scrape requests.",
+            "# TYPE scrape_request_duration_seconds histogram",
+        ]
+        for api, endpoint, metrics in self.__iter_requests(snapshot):
+            labels = f'api="{api}",endpoint="{endpoint}"'
+            cumulative = 0
+            for bound, count in metrics['latency']['buckets'].items():
+                cumulative += count
+                lines.append(f'scrape_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"scrape_request_duration_seconds_sum{{{labels}}} {metrics['latency']['sum']}")
+            lines.append(f"scrape_request_duration_seconds_count{{{labels}}} {metrics['latency']['count']}")
+        lines += ["# HELP scrape_responses_total Responses of the scrape requests by status code.",
+                  "# TYPE scrape_responses_total counter"]
+        for api, endpoint, metrics in self.__iter_requests(snapshot):
+            for status, count in metrics.get('statuses', {}).items():
+                lines.append(f'scrape_responses_total{{api="{api}",endpoint="{endpoint}",status="{status}"}} {count}')
+        for name, help, key in (("scrape_rate_limit_wait_seconds_total", "Time spent waiting for the rate limiter.",
+                                 'wait_seconds'),
+                                ("scrape_in_flight_seconds_total", "Time spent waiting for the responses.",
+                                 'in_flight_seconds')):
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{api="{api}"}} {seconds}' for api, seconds in snapshot[key].items()]
+        for name, type, help, key in (("scrape_items_total", "counter", "Items cached.", 'items'),
+                                      ("scrape_items_per_second", "gauge", "Items cached per second.",
+                                       'items_per_second'),
+                                      ("scrape_backlog", "gauge", "Ids left to scrape.", 'backlog')):
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {type}"]
+            lines += [f'{name}{{endpoint="{endpoint}"}} {metrics[key]}'
+                      for endpoint, metrics in snapshot['endpoints'].items() if key in metrics]
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """Writes the metrics to their file."""
+        snapshot = self.snapshot()
+        content = self.to_prometheus(snapshot) if self.format == "prometheus" else json.dumps(snapshot, indent=2)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # readers such as a node exporter never see a partially written file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, self.path)
+
+    def summary(self) -> str:
+        snapshot = self.snapshot()
+        lines = [f"Scrape metrics ({snapshot['elapsed_seconds']:.0f}s), written to {self.path}"]
+        for api in sorted(set(snapshot['wait_seconds']) | set(snapshot['in_flight_seconds'])):
+            lines.append(f"  {api}: {snapshot['in_flight_seconds'].get(api, 0.0):.1f}s in flight, "
+                         f"{snapshot['wait_seconds'].get(api, 0.0):.1f}s waiting for the rate limiter")
+        for api, endpoint, metrics in self.__iter_requests(snapshot):
+            latency = metrics['latency']
+            statuses = ", ".join(f"{status}: {count}" for status, count in sorted(metrics['statuses'].items()))
+            lines.append(f"  {api} {endpoint}: {latency['count']} requests ({statuses}), "
+                         f"{latency['sum'] / latency['count']:.3f}s mean latency, "
+                         f"p95 under {self.__quantile_bound(latency, 0.95)}")
+        for endpoint, metrics in snapshot['endpoints'].items():
+            parts = []
+            if 'items' in metrics:
+                parts.append(f"{metrics['items']} items, {metrics['items_per_second']:.2f} items/s")
+            if 'backlog' in metrics:
+                parts.append(f"{metrics['backlog']} ids left")
+            lines.append(f"  {endpoint}: {', '.join(parts)}")
+        return "\n".join(lines)
+
+    def has_data(self) -> bool:
+        with self.__lock:
+            return bool(self.__latencies or self.__items)
+
+    def stop(self):
+        """Stops the periodic flush."""
+        self.__stopped.set()
+
+    @staticmethod
+    def __iter_requests(snapshot: dict):
+        # (api, endpoint, metrics) of every endpoint that received requests
+        for api, endpoints in snapshot['requests'].items():
+            for endpoint, metrics in endpoints.items():
+                yield api, endpoint, metrics
+
+    @staticmethod
+    def __quantile_bound(latency: dict, quantile: float) -> str:
+        # upper bound of the bucket holding the quantile, the histogram keeps no exact values
+        target = quantile * latency['count']
+        cumulative = 0
+        for bound, count in latency['buckets'].items():
+            cumulative += count
+            if cumulative >= target:
+                return bound if bound == '+Inf' else f"{bound}s"
+        return '+Inf'
+
+    def __start_flusher(self):
+        if self.__flusher is not None:
+            return
+        with self.__lock:
+            if self.__flusher is not None:
+                return
+            self.__flusher = threading.Thread(target=self.__flush_loop, name="metrics-flusher", daemon=True)
+            self.__flusher.start()
+
+    def __flush_loop(self):
+        while not self.__stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"WARNING: Unable to flush the scrape metrics: {e}")
+
+
+SCRAPE_METRICS = ScrapeMetrics(
+    abspath(join(TEMP_PATH, "scrape_metrics.prom" if SCRAPE_METRICS_FORMAT == "prometheus" else "scrape_metrics.json")),
+    format=SCRAPE_METRICS_FORMAT,
+)
@@ -0,0 +1,144 @@
+import threading
+import time
+
+from utility.variables import MUSICBRAINZ_RATE_LIMIT, SPOTIFY_RATE_LIMIT_RESPONSE_CODE
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket shared by every request sent to one API, or with one credential of an API.
+
+    The refill rate adapts to the API feedback: it grows additively while responses succeed and is
+    cut multiplicatively when a 429 is received, so the throughput settles at the real rate ceiling
+    of the API instead of a guessed constant.
+
+    Attributes:
+        name (str): Name of the API, used to label the metrics of its requests.
+        rate (float): Current refill rate, in requests per second.
+        total_wait_time (float): Total time callers spent waiting in the queue, in seconds.
+        total_acquired (int): Number of tokens handed out since the creation of the limiter.
+        total_rate_limited (int): Number of 429 responses reported to the limiter.
+    """
+
+    def __init__(self, rate: float, min_rate: float, max_rate: float, burst: int = 1,
+                 increase_step: float = 0.05, decrease_factor: float = 0.5,
+                 rate_limit_codes: tuple[int, ...] = (SPOTIFY_RATE_LIMIT_RESPONSE_CODE,), name: str = "api"):
+        """
+        Args:
+            rate (float): Initial rate, in requests per second.
+            min_rate (float): Rate never goes below this value.
+            max_rate (float): Rate never goes above this value.
+            burst (int, optional): Number of tokens the bucket can hold. Defaults to 1.
+            increase_step (float, optional): Rate added after each successful response. Defaults to 0.05.
+            decrease_factor (float, optional): Rate multiplier applied after a 429 response. Defaults to 0.5.
+            rate_limit_codes (tuple[int, ...], optional): Status codes the API uses to signal rate limiting.
+                Defaults to (429,).
+            name (str, optional): Name of the API. Defaults to "api".
+        """
+        self.name = name
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.rate_limit_codes = rate_limit_codes
+        self.total_wait_time = 0.0
+        self.total_acquired = 0
+        self.total_rate_limited = 0
+        self.__tokens = float(burst)
+        self.__last_refill = time.monotonic()
+        # no token is handed out before this time, set by Retry-After
+        self.__paused_until = 0.0
+        self.__lock = threading.Lock()
+
+    def __refill(self, now: float):
+        # no token is added while a Retry-After pause is in progress
+        start = max(self.__last_refill, self.__paused_until)
+        if now > start:
+            self.__tokens = min(self.burst, self.__tokens + (now - start) * self.rate)
+        self.__last_refill = max(self.__last_refill, now)
+
+    def reserve(self) -> float:
+        """
+        Reserves a token and returns how long the caller must wait before using it. Useful for callers
+        that sleep on their own, e.g. `await asyncio.sleep(limiter.reserve())`.
+
+        Returns:
+            float: Number of seconds to wait before sending the request.
+        """
+        with self.__lock:
+            now = time.monotonic()
+            self.__refill(now)
+            self.__tokens -= 1
+            # the callers queued during a pause are spread after its end instead of firing together
+            delay = max(0.0, self.__paused_until - now) + max(0.0, -self.__tokens / self.rate)
+            self.total_wait_time += delay
+            self.total_acquired += 1
+            return delay
+
+    def delay(self) -> float:
+        """
+        Returns:
+            float: Number of seconds the next caller would wait, without reserving a token.
+        """
+        with self.__lock:
+            now = time.monotonic()
+            self.__refill(now)
+            return max(0.0, self.__paused_until - now) + max(0.0, (1 - self.__tokens) / self.rate)
+
+    def acquire(self) -> float:
+        """
+        Blocks until a token is available.
+
+        Returns:
+            float: Number of seconds the caller waited.
+        """
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def on_success(self):
+        """Increases the rate additively after a successful response."""
+        with self.__lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_rate_limited(self, retry_after: float):
+        """
+        Cuts the rate multiplicatively and pauses every caller of the limiter until `retry_after` seconds have passed.
+
+        Args:
+            retry_after (float): Value of the `Retry-After` header, in seconds.
+        """
+        with self.__lock:
+            now = time.monotonic()
+            self.__refill(now)
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self.__paused_until = max(self.__paused_until, now + retry_after)
+            # drop the accumulated tokens so the callers restart slowly after the pause
+            self.__tokens = min(self.__tokens, 0.0)
+            self.total_rate_limited += 1
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Current rate and queue statistics of the limiter.
+        """
+        with self.__lock:
+            return {
+                'rate': self.rate,
+                'total_acquired': self.total_acquired,
+                'total_rate_limited': self.total_rate_limited,
+                'total_wait_time': self.total_wait_time,
+                'average_wait_time': self.total_wait_time / self.total_acquired if self.total_acquired else 0.0,
+            }
+
+    def summary(self) -> str:
+        stats = self.stats()
+        return (f"Rate limiter: {stats['rate']:.2f} req/s, {stats['total_acquired']} requests, "
+                f"{stats['total_rate_limited']} rate limited, {stats['total_wait_time']:.1f}s waited in queue")
+
+
+# every credential of the spotify token pool has its own rate limiter, see `TokenPool`
+MUSICBRAINZ_RATE_LIMITER = RateLimiter(**MUSICBRAINZ_RATE_LIMIT, name="musicbrainz")
@@ -0,0 +1,157 @@
+import random
+import time
+from typing import Iterable, Iterator
+
+from utility.id_registry import IdRegistry
+from utility.lease import ScrapeLease
+from utility.variables import RETRY_POLICY
+
+
+class RetryPolicy:
+    """
+    Exponential backoff schedule of the failed ids.
+
+    Attributes:
+        base_delay (float): Delay before the first retry, in seconds.
+        factor (float): Multiplier applied to the delay after each failed attempt.
+        max_delay (float): Upper bound of the delay, in seconds.
+        max_attempts (int): Number of failed attempts after which an id is moved to the dead letters.
+        jitter (float): Random fraction added to the delay, spreads the retries of a failing batch.
+        in_flight_timeout (float): Time a claimed retry is hidden from other claims, in seconds.
+    """
+
+    def __init__(self, base_delay: float = 60, factor: float = 2, max_delay: float = 6 * 60 * 60,
+                 max_attempts: int = 5, jitter: float = 0.1, in_flight_timeout: float = 10 * 60):
+        self.base_delay = base_delay
+        self.factor = factor
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.jitter = jitter
+        self.in_flight_timeout = in_flight_timeout
+
+    def delay(self, attempt: int) -> float:
+        """
+        Args:
+            attempt (int): Number of failed attempts so far, starting at 1.
+
+        Returns:
+            float: Number of seconds to wait before the next attempt.
+        """
+        delay = min(self.max_delay, self.base_delay * self.factor ** max(0, attempt - 1))
+        return delay * (1 + random.random() * self.jitter)
+
+    @staticmethod
+    def is_retryable(status_code: int | None) -> bool:
+        """Rate limits, server errors and network errors (no status code) are transient, other client
+        errors such as an invalid id would fail again."""
+        return status_code is None or status_code == 429 or status_code >= 500
+
+
+class RetryQueue:
+    """
+    Retry subsystem on top of an `IdRegistry`.
+
+    Failed ids are scheduled with an exponential backoff and interleaved with the fresh pending ids by
+    `iter_work`, so retries never stall the main scrape loop. Ids failing `max_attempts` times, or with
+    an error that is not retryable, are moved to the dead-letter state where they can be inspected with
+    `dead_letters` and put back in the queue with `requeue_dead_letters`.
+
+    With a `ScrapeLease`, the pending ids are leased in batches instead of read, so several workers can share
+    the registry. Due retries are claimed, and are never handed out twice either.
+    """
+
+    def __init__(self, registry: IdRegistry, policy: RetryPolicy | None = None, lease: ScrapeLease | None = None):
+        self.__registry = registry
+        self.__policy = policy if policy is not None else RetryPolicy(**RETRY_POLICY)
+        self.__lease = lease
+
+    def record_failure(self, ids: Iterable[str], error: str, retryable: bool = True) -> tuple[int, int]:
+        """Schedules the next attempt of failed ids, or moves them to the dead letters.
+
+        Args:
+            ids (Iterable[str]): Ids whose request failed.
+            error (str): Description of the error, kept for inspection.
+            retryable (bool, optional): False sends the ids straight to the dead letters. Defaults to True.
+
+        Returns:
+            tuple[int, int]: Number of ids scheduled for a retry and number of ids moved to the dead letters.
+        """
+        retry_counts = self.__registry.get_retry_counts(ids)
+        now = time.time()
+        retries = []
+        dead = []
+        for id, retry_count in retry_counts.items():
+            attempt = retry_count + 1
+            if not retryable or attempt >= self.__policy.max_attempts:
+                dead.append((id, error))
+            else:
+                retries.append((id, now + self.__policy.delay(attempt), error))
+        self.__registry.schedule_retries(retries)
+        self.__registry.mark_dead(dead)
+        return len(retries), len(dead)
+
+    def record_status_failure(self, ids: Iterable[str], status_code: int | None, error: str) -> tuple[int, int]:
+        """Same as `record_failure`, the status code of the response decides whether the ids are retried."""
+        if status_code is not None:
+            error = f"{status_code}: {error}"
+        return self.record_failure(ids, error, retryable=RetryPolicy.is_retryable(status_code))
+
+    def claim_due_retries(self, n: int) -> list[str]:
+        """
+        Returns:
+            list[str]: Up to `n` failed ids whose next attempt is due.
+        """
+        now = time.time()
+        return self.__registry.claim_due_retries(n, now, now + self.__policy.in_flight_timeout)
+
+    def iter_work(self, batch_size: int) -> Iterator[list[str]]:
+        """Iterates over the pending ids in batches, and yields a batch of due retries whenever some are due.
+        Once the pending ids are exhausted, the retries that are due are drained and the iteration stops,
+        retries scheduled later are picked up by the next run.
+
+        Args:
+            batch_size (int): Maximum number of ids per batch.
+
+        Yields:
+            list[str]: Batch of ids to scrape.
+        """
+        for batch in self.__iter_pending(batch_size):
+            yield batch
+            retries = self.claim_due_retries(batch_size)
+            if retries:
+                yield retries
+        while retries := self.claim_due_retries(batch_size):
+            yield retries
+        next_retry_at = self.__registry.next_retry_at()
+        if next_retry_at is not None:
+            print(f"Next scheduled retry in {max(0, next_retry_at - time.time()):.0f} seconds.")
+
+    def __iter_pending(self, batch_size: int) -> Iterator[list[str]]:
+        if self.__lease is None:
+            yield from self.__registry.iter_pending(batch_size)
+            return
+        while batch := self.__lease.acquire(batch_size):
+            yield batch
+
+    def dead_letters(self) -> Iterator[tuple[str, int, float, str]]:
+        """
+        Yields:
+            tuple[str, int, float, str]: Id, number of attempts, time of the last attempt and last error.
+        """
+        return self.__registry.iter_dead()
+
+    def requeue_dead_letters(self, ids: Iterable[str] | None = None) -> int:
+        """Puts dead-letter ids back in the pending state with a fresh retry count.
+
+        Args:
+            ids (Iterable[str], optional): Ids to requeue. Defaults to None, for every dead-letter id.
+
+        Returns:
+            int: Number of requeued ids.
+        """
+        if ids is None:
+            ids = [id for id, _, _, _ in self.__registry.iter_dead()]
+        else:
+            ids = list(ids)
+        self.__registry.mark_pending(ids, reset_retries=True)
+        return len(ids)
@@ -0,0 +1,19 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def create_pooled_session(pool_size: int = 10) -> requests.Session:
+    """
+    Creates a `requests` session that keeps its connections alive and shares them between threads.
+
+    Args:
+        pool_size (int, optional): Maximum number of connections kept open per host. Defaults to 10.
+
+    Returns:
+        requests.Session: Session with a connection pool large enough for `pool_size` in-flight requests.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
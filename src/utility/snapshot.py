@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import pickle
+from os.path import exists, join as joinpath
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from utility.item_store import ItemStore
+
+# name of the file describing the snapshot of a folder
+SNAPSHOT_META_NAME = "meta.json"
+
+
+def store_signature(store: ItemStore, mapping: dict[str, str]) -> str:
+    """
+    Returns:
+        str: Hash of the ids, sizes and modification times of the items of the store, along with the mapping.
+            It changes whenever an item is added, removed or rewritten, without reading the items.
+    """
+    digest = hashlib.blake2b(json.dumps(mapping, sort_keys=True).encode(), digest_size=16)
+    for id, size, mtime in sorted(store.stats()):
+        digest.update(f"{id}\0{size}\0{mtime}\n".encode())
+    return digest.hexdigest()
+
+
+class ParsedSnapshot:
+    """
+    Columnar snapshot of the parsed items of an endpoint, so every insert step does not parse the same folder again.
+
+    Each column, the ids or the values of an attribute of the items, is stored in its own file as a sequence of
+    pickled batches, so a column is read and written one batch at a time rather than whole. The columns are not
+    memory-mapped, their values are lists and dicts of any size that a fixed-width layout could not hold.
+
+    The snapshot is valid for a single store signature, see `store_signature`. Saving a snapshot with another
+    signature, or with batches of other sizes, replaces every column, so the batches of the columns stay aligned.
+    """
+
+    def __init__(self, folder_path: str):
+        """
+        Args:
+            folder_path (str): Folder of the snapshot, created if it does not exist.
+        """
+        self.folder_path = folder_path
+        Path(folder_path).mkdir(parents=True, exist_ok=True)
+
+    def __meta(self) -> dict:
+        meta_path = joinpath(self.folder_path, SNAPSHOT_META_NAME)
+        if not exists(meta_path):
+            return {'signature': None, 'columns': [], 'batch_sizes': None}
+        with open(meta_path, "r") as f:
+            return json.load(f)
+
+    def __column_path(self, column: str) -> str:
+        return joinpath(self.folder_path, f"{column}.pickle")
+
+    def load(self, signature: str, columns: Iterable[str]) -> Iterator[dict[str, list]] | None:
+        """
+        Returns:
+            Iterator[dict[str, list]] | None: Batches of the values of each requested column and of the `id`
+                column, None if the snapshot was taken with another signature or misses a column.
+        """
+        columns = ['id', *columns]
+        meta = self.__meta()
+        if meta['signature'] != signature or not set(columns) <= set(meta['columns']):
+            return None
+        if not all(exists(self.__column_path(column)) for column in columns):
+            return None
+        return self.__iter_batches(columns)
+
+    def __iter_batches(self, columns: list[str]) -> Iterator[dict[str, list]]:
+        files = [open(self.__column_path(column), "rb") for column in columns]
+        try:
+            while True:
+                try:
+                    yield {column: pickle.load(f) for column, f in zip(columns, files)}
+                except EOFError:
+                    return
+        finally:
+            for f in files:
+                f.close()
+
+    def save(self, signature: str, columns: Iterable[str], batches: Iterable[dict[str, list]]):
+        """Writes the batches of values of the columns, which must include `id`, as they are produced. The
+        columns of the same signature are kept if they were saved in batches of the same sizes.
+        """
+        columns = list(columns)
+        meta = self.__meta()
+        # the meta is written last, an interrupted save leaves the previous columns invalid but never mixed
+        meta_path = joinpath(self.folder_path, SNAPSHOT_META_NAME)
+        if exists(meta_path):
+            os.remove(meta_path)
+        files = {column: open(f"{self.__column_path(column)}.tmp", "wb") for column in columns}
+        batch_sizes = []
+        try:
+            for batch in batches:
+                batch_sizes.append(len(batch['id']))
+                for column, f in files.items():
+                    pickle.dump(batch[column], f, protocol=pickle.HIGHEST_PROTOCOL)
+        finally:
+            for f in files.values():
+                f.close()
+        for column in columns:
+            os.replace(f"{self.__column_path(column)}.tmp", self.__column_path(column))
+        # a kept column is read along with the new ones, its batches must hold the same rows
+        same_batches = meta['signature'] == signature and meta.get('batch_sizes') == batch_sizes
+        kept = meta['columns'] if same_batches else []
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({'signature': signature, 'columns': sorted(set(kept) | set(columns)),
+                       'batch_sizes': batch_sizes}, f)
+        os.replace(tmp_path, meta_path)
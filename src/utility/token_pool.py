@@ -0,0 +1,259 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from os.path import abspath, join
+from typing import Any, Callable
+
+try:
+    import fcntl
+except ImportError:
+    # no file locking on windows, the pool is then only safe within a single process
+    fcntl = None
+
+from requests import Response
+
+from utility.auth_token import AuthToken
+from utility.rate_limiter import RateLimiter
+from utility.utility import send_request_with_wait
+from utility.variables import SPOTIFY_AUTH_URL, SPOTIFY_CLIENT_CREDENTIALS, SPOTIFY_CLIENT_ID, \
+    SPOTIFY_CLIENT_SECRET, SPOTIFY_RATE_LIMIT, SPOTIFY_TOKEN_REFRESH_MARGIN, TEMP_PATH
+
+# index of the credential a request is being sent with, set by `TokenPool.credential`
+CURRENT_CREDENTIAL: ContextVar[int | None] = ContextVar("CURRENT_CREDENTIAL", default=None)
+
+
+class TokenPool:
+    """
+    Pool of access tokens of several client credentials, handed out in rotation so the requests are spread
+    over the rate budget of every credential.
+
+    Every credential has its own `RateLimiter`. A request is sent with the credential whose limiter lets it
+    through the soonest, see `send_request`, so the pool multiplies the request budget, and a 429 received by
+    one credential only pauses that credential.
+
+    The tokens are cached in a json file shared by every scraper process of the machine. The file is only
+    written under an exclusive file lock, and a process re-reads it before fetching a token, so a token
+    refreshed by another process is reused instead of fetched again. A background thread refreshes the
+    tokens `refresh_margin` seconds before they expire, so request threads never wait on a token request.
+    """
+
+    def __init__(self, auth_url: str, credentials: list[tuple[str, str]], cache_path: str,
+                 refresh_margin: float = SPOTIFY_TOKEN_REFRESH_MARGIN, rate_limit: dict = SPOTIFY_RATE_LIMIT):
+        """
+        Args:
+            auth_url (str): Url of the token endpoint.
+            credentials (list[tuple[str, str]]): Client id and client secret of every credential of the pool.
+            cache_path (str): Json file caching the tokens, shared between processes.
+            refresh_margin (float, optional): Tokens are refreshed this many seconds before they expire.
+                Defaults to SPOTIFY_TOKEN_REFRESH_MARGIN.
+            rate_limit (dict, optional): Arguments of the `RateLimiter` of each credential.
+                Defaults to SPOTIFY_RATE_LIMIT.
+        """
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self.__tokens = [AuthToken(auth_url, client_id, client_secret) for client_id, client_secret in credentials]
+        self.rate_limiters = [RateLimiter(**rate_limit, name="spotify") for _ in self.__tokens]
+        self.__next = 0
+        # the rotation lock is never held during a token request, the refresh lock serializes the refreshes
+        self.__lock = threading.Lock()
+        self.__refresh_lock = threading.Lock()
+        self.__refresher: threading.Thread | None = None
+        self.__stopped = threading.Event()
+
+    def get_authorization(self) -> str:
+        """
+        Returns:
+            str: Authorization header of the credential of the request being sent, see `credential`, otherwise
+                of the next credential of the rotation. Only the first call, or a call made after every token
+                expired, waits for a token request.
+        """
+        index = CURRENT_CREDENTIAL.get()
+        if index is not None:
+            token = self.__tokens[index]
+            if token.is_expired():
+                with self.__refresh_lock:
+                    self.__refresh_expiring(margin=0)
+        else:
+            token = self.__tokens[self.__next_index(lambda i: 0.0)]
+        self.__start_refresher()
+        return f"{token.token_type} {token.access_token}"
+
+    @contextmanager
+    def credential(self):
+        """Selects the credential of a request, the valid credential whose rate limiter has the shortest queue.
+        `get_authorization` returns the header of this credential until the context exits.
+
+        Yields:
+            RateLimiter: Rate limiter of the selected credential.
+        """
+        index = self.__next_index(lambda i: self.rate_limiters[i].delay())
+        reset_token = CURRENT_CREDENTIAL.set(index)
+        try:
+            yield self.rate_limiters[index]
+        finally:
+            CURRENT_CREDENTIAL.reset(reset_token)
+
+    def send_request(self, request_func: Callable[..., Response], *args: Any, endpoint: str | None = None) -> Response:
+        """Sends a request with `send_request_with_wait`, through the rate limiter of the selected credential.
+        The request function reads its authorization header from `get_authorization`.
+        """
+        with self.credential() as rate_limiter:
+            return send_request_with_wait(request_func, *args, rate_limiter=rate_limiter, endpoint=endpoint)
+
+    @property
+    def total_wait_time(self) -> float:
+        return sum(rate_limiter.total_wait_time for rate_limiter in self.rate_limiters)
+
+    def summary(self) -> str:
+        return "\n".join(f"Credential {i + 1}: {rate_limiter.summary()}"
+                         for i, rate_limiter in enumerate(self.rate_limiters))
+
+    def refresh_token(self):
+        """Refreshes the tokens that are about to expire."""
+        with self.__refresh_lock:
+            self.__refresh_expiring(self.refresh_margin)
+
+    def stop(self):
+        """Stops the background refresh."""
+        self.__stopped.set()
+
+    def __next_index(self, delay: Callable[[int], float]) -> int:
+        with self.__lock:
+            index = self.__next_valid_index(delay)
+        if index is None:
+            with self.__refresh_lock:
+                self.__refresh_expiring(margin=0)
+            with self.__lock:
+                index = self.__next_valid_index(delay)
+            if index is None:
+                raise Exception("Unable to retrieve an access token for any of the client credentials.")
+        return index
+
+    def __next_valid_index(self, delay: Callable[[int], float]) -> int | None:
+        # the valid token with the shortest delay, ties are broken by the rotation order
+        order = [(self.__next + i) % len(self.__tokens) for i in range(len(self.__tokens))]
+        valid = [i for i in order if not self.__tokens[i].is_expired()]
+        if not valid:
+            return None
+        index = min(valid, key=delay)
+        self.__next = (index + 1) % len(self.__tokens)
+        return index
+
+    def __refresh_expiring(self, margin: float):
+        deadline = datetime.now() + timedelta(seconds=margin)
+        self.__load_cache()
+        if all(token.expires_in > deadline for token in self.__tokens):
+            return
+        with self.__file_lock():
+            # another process may have refreshed the tokens while we were waiting for the lock
+            self.__load_cache()
+            refreshed = False
+            for token in self.__tokens:
+                if token.expires_in > deadline:
+                    continue
+                try:
+                    token.get_new_token()
+                    refreshed = True
+                except Exception as e:
+                    print(f"WARNING: Unable to refresh the token of client {token.client_id}: {e}")
+            if refreshed:
+                self.__store_cache()
+
+    def __load_cache(self):
+        try:
+            with open(self.cache_path, "r") as f:
+                cache = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        for token in self.__tokens:
+            cached = cache.get(token.client_id)
+            if cached is None:
+                continue
+            expires_in = datetime.fromisoformat(cached['expires_in'])
+            # keep whichever token lives longer, ours may be newer than the file
+            if expires_in > token.expires_in:
+                token.access_token = cached['access_token']
+                token.token_type = cached['token_type']
+                token.expires_in = expires_in
+
+    def __store_cache(self):
+        cache = {
+            token.client_id: {
+                'access_token': token.access_token,
+                'token_type': token.token_type,
+                'expires_in': token.expires_in.isoformat()
+            }
+            for token in self.__tokens if token.access_token
+        }
+        # write to a temporary file first, readers never see a partially written cache
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, self.cache_path)
+
+    @contextmanager
+    def __file_lock(self):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.cache_path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __start_refresher(self):
+        if self.__refresher is not None:
+            return
+        with self.__lock:
+            if self.__refresher is not None:
+                return
+            self.__refresher = threading.Thread(target=self.__refresh_loop, name="token-refresher", daemon=True)
+            self.__refresher.start()
+
+    def __refresh_loop(self):
+        interval = max(1.0, self.refresh_margin / 4)
+        while not self.__stopped.wait(interval):
+            try:
+                self.refresh_token()
+            except Exception as e:
+                print(f"WARNING: Background token refresh failed: {e}")
+
+
+def parse_client_credentials(client_id: str | None, client_secret: str | None, extra: str) -> list[tuple[str, str]]:
+    """Lists the credentials of the token pool, the client id and secret followed by the extra credentials.
+
+    Args:
+        client_id (str | None): Client id of the primary credential, None when it is not set.
+        client_secret (str | None): Client secret of the primary credential.
+        extra (str): Comma separated `client_id:client_secret` pairs of the extra credentials.
+
+    Raises:
+        ValueError: An extra credential is not a `client_id:client_secret` pair.
+
+    Returns:
+        list[tuple[str, str]]: Client id and secret of each credential, without duplicates.
+    """
+    credentials = [(client_id, client_secret)] if client_id else []
+    for i, pair in enumerate(extra.split(",")):
+        if not pair.strip():
+            continue
+        client, _, secret = pair.strip().partition(":")
+        if not client or not secret:
+            raise ValueError(f"Entry {i + 1} of SPOTIFY_CLIENT_CREDENTIALS is not a `client_id:client_secret` pair.")
+        if (client, secret) not in credentials:
+            credentials.append((client, secret))
+    # without any credential the pool still has one, whose token requests fail with a clear error
+    return credentials or [(client_id, client_secret)]
+
+
+SPOTIFY_AUTH_TOKEN = TokenPool(
+    SPOTIFY_AUTH_URL,
+    parse_client_credentials(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_CLIENT_CREDENTIALS),
+    abspath(join(TEMP_PATH, "spotify_token_pool.json")),
+)
@@ -1,5 +1,6 @@
 import time
 from requests import Response
+from utility.metrics import SCRAPE_METRICS
 from utility.variables import SPOTIFY_RATE_LIMIT_RESPONSE_CODE
 from typing import Any, Callable
 
@@ -8,20 +9,66 @@ def is_success_code(code: int) -> bool:
     return 200 <= code < 300
 
 
-def send_request_with_wait(request_func: Callable[..., Response], *args: Any) -> Response:
+def get_retry_after(res: Response, default: float = 1.0) -> float:
+    """
+    Reads the `Retry-After` header of a rate limited response.
+
+    Args:
+        res (Response): Rate limited response.
+        default (float, optional): Seconds returned when the header is missing or malformed. Defaults to 1.0.
+
+    Returns:
+        float: Number of seconds to wait before sending the next request.
+    """
+    try:
+        return float(res.headers['Retry-After'])
+    except (KeyError, TypeError, ValueError):
+        return default
+
+
+def send_request_with_wait(request_func: Callable[..., Response], *args: Any, rate_limiter=None,
+                           endpoint: str | None = None) -> Response:
     """
     This function computes the callable request and evaluates the response. If the response
     code is a rate limit response, sleep until the rate limit is no longer applied.
 
+    When a rate limiter is given, a token is acquired before every attempt and the limiter is
+    notified of the outcome, so every caller sharing the limiter slows down or speeds up together.
+
+    The latency, status code and waiting time of every attempt are recorded in `SCRAPE_METRICS`.
+
     Args:
-        request_func (Callable[[], Response]): _description_
+        request_func (Callable[..., Response]): Function sending the request.
+        *args (Any): Arguments passed to `request_func`.
+        rate_limiter (RateLimiter, optional): Shared limiter of the API being called. Defaults to None.
+        endpoint (str, optional): Endpoint labelling the metrics of the request. Defaults to None.
 
     Returns:
-        Response: _description_
+        Response: The first response that is not rate limited.
     """
-    res = request_func(*args)
-    while (res.status_code == SPOTIFY_RATE_LIMIT_RESPONSE_CODE):
-        print(f"INFO: Exceeded rate limit, sleeping for {res.headers['Retry-After']} seconds")
-        time.sleep(int(res.headers['Retry-After']))
-        res = request_func(*args)
+    rate_limit_codes = rate_limiter.rate_limit_codes if rate_limiter else (SPOTIFY_RATE_LIMIT_RESPONSE_CODE,)
+    api = rate_limiter.name if rate_limiter else "api"
+    while True:
+        if rate_limiter:
+            SCRAPE_METRICS.record_wait(api, rate_limiter.acquire())
+        start = time.perf_counter()
+        try:
+            res = request_func(*args)
+        except Exception:
+            SCRAPE_METRICS.record_request(api, endpoint, time.perf_counter() - start, None)
+            raise
+        SCRAPE_METRICS.record_request(api, endpoint, time.perf_counter() - start, res.status_code)
+        if res.status_code not in rate_limit_codes:
+            break
+        retry_after = get_retry_after(res)
+        print(f"INFO: Exceeded rate limit, sleeping for {retry_after} seconds")
+        if rate_limiter:
+            # the limiter pauses every caller, the next acquire waits for the pause to end
+            rate_limiter.on_rate_limited(retry_after)
+        else:
+            time.sleep(retry_after)
+            SCRAPE_METRICS.record_wait(api, retry_after)
+    # a failing API, e.g. answering 5xx, must not raise the rate
+    if rate_limiter and is_success_code(res.status_code):
+        rate_limiter.on_success()
     return res
@@ -5,36 +5,115 @@ from os.path import abspath, join, dirname
 load_dotenv(abspath(join(dirname(__file__), "../.env")))
 
 # CONSTANTS
-SLEEP_TIMER_AVG = 10
+# number of requests kept in flight by the concurrent scrapers
+SCRAPE_CONCURRENCY = 8
+# exponential backoff of the failed ids, delays in seconds
+RETRY_POLICY = {'base_delay': 60, 'factor': 2, 'max_delay': 6 * 60 * 60, 'max_attempts': 5}
+# seconds a worker keeps its leased ids without a heartbeat, a crashed worker's ids are reclaimed after it
+SCRAPE_LEASE_DURATION = 10 * 60
+# metrics of the scrape requests, flushed to the temporary folder every interval as "json" or "prometheus" text
+SCRAPE_METRICS_FORMAT = getenv("SCRAPE_METRICS_FORMAT", "json")
+SCRAPE_METRICS_FLUSH_INTERVAL = 15
+# upper bounds of the request latency histogram buckets, in seconds
+SCRAPE_METRICS_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# number of items sent at a time to the worker processes of a parallel SpotifyParser
+PARSE_CHUNK_SIZE = 1000
+# parsed items waiting for the insert workers, the parser waits when the queue is full
+DATABASE_INSERT_QUEUE_SIZE = 1000
+# number of playlists decoded by a worker process at a time when loading the playlists in parallel
+LOAD_PLAYLISTS_SHARD_SIZE = 500
+# number of artists or albums read by a worker process at a time when loading the genres in parallel
+LOAD_GENRES_SHARD_SIZE = 2000
 
 # LOAD ENVIRONMENT VARIABLES
 SPOTIFY_CLIENT_ID = getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = getenv("SPOTIFY_CLIENT_SECRET")
+# extra credentials of the token pool added to the client id and secret, comma separated `client_id:client_secret`
+# pairs, see `parse_client_credentials`
+SPOTIFY_CLIENT_CREDENTIALS = getenv("SPOTIFY_CLIENT_CREDENTIALS", "")
 DATABASE_HOST = getenv("DATABASE_HOST")
 DATABASE_NAME = getenv("DATABASE_NAME")
 DATABASE_USER = getenv("DATABASE_USER")
 DATABASE_PASSWORD = getenv("DATABASE_PASSWORD")
+# "folder" stores one json file per item, "packed" stores the items in append-only segments
+ITEM_STORE_BACKEND = getenv("ITEM_STORE_BACKEND", "folder")
+# set to "zstd" to compress the items written to a packed store
+ITEM_STORE_COMPRESSION = getenv("ITEM_STORE_COMPRESSION") or None
+# decoder of the stored items: "auto" uses orjson when it is installed, or "json", "orjson", "ujson"
+JSON_DECODER = getenv("JSON_DECODER", "auto")
 
 # DEFINE PROGRAM CONSTANTS
-DATA_PATH = abspath(join(dirname(__file__), "../../data"))
-TEMP_PATH = abspath(join(dirname(__file__), "../../tmp"))
+# the data and temporary folders can be moved, e.g. by the benchmark to keep its data apart
+DATA_PATH = abspath(getenv("DATA_PATH") or join(dirname(__file__), "../../data"))
+TEMP_PATH = abspath(getenv("TEMP_PATH") or join(dirname(__file__), "../../tmp"))
 
 # DEFINE SPOTIFY CONSTANTS
-SPOTIFY_AUTH_URL = "https://accounts.spotify.com/api/token"
+# the api urls can point to a local stand-in of the apis, see `benchmark.replay_server`
+SPOTIFY_AUTH_URL = getenv("SPOTIFY_AUTH_URL", "https://accounts.spotify.com/api/token")
 SPOTIFY_RATE_LIMIT_RESPONSE_CODE = 429
+# answer to a conditional request when the item has not changed since its stored version
+SPOTIFY_UNCHANGED_RESPONSE_CODE = 304
+# tokens of the pool are refreshed in the background this many seconds before they expire
+SPOTIFY_TOKEN_REFRESH_MARGIN = 5 * 60
+# starting point and bounds of the adaptive rate limiter, in requests per second
+SPOTIFY_RATE_LIMIT = {'rate': 1.0, 'min_rate': 0.1, 'max_rate': 20.0, 'burst': 5}
 SPOTIFY_BATCH_MAX_ITEMS = 20
 SPOTIFY_ITEMS_CSV_NAME = "ids.csv"
+SPOTIFY_ITEMS_REGISTRY_NAME = "ids.sqlite"
 SPOTIFY_ITEMS_FOLDER_NAME = "items"
+SPOTIFY_PACKED_FOLDER_NAME = "packed"
+# manifests of the items processed by each consumer of an endpoint, e.g. `artists/manifests/genres.sqlite`
+SPOTIFY_MANIFESTS_FOLDER_NAME = "manifests"
+# columnar snapshots of the parsed items of an endpoint, shared by the insert steps
+SPOTIFY_SNAPSHOTS_FOLDER_NAME = "snapshots"
 SPOTIFY_MAPPING_FILE_NAME = "mapping.json"
-SPOTIFY_API_URL = "https://api.spotify.com/v1"
+SPOTIFY_API_URL = getenv("SPOTIFY_API_URL", "https://api.spotify.com/v1")
 SPOTIFY_DATA_PATH = abspath(join(DATA_PATH, 'spotify'))
+SPOTIFY_SCRAPE_ENDPOINTS = ['playlists', 'tracks', 'artists', 'albums', 'audiobooks']
+# endpoints with an item store, authors and chapters are extracted from the audiobooks
+SPOTIFY_STORE_ENDPOINTS = SPOTIFY_SCRAPE_ENDPOINTS + ['authors', 'chapters']
+# number of ids per request of each endpoint, in the priority order of the scheduler: the ids of the later
+# endpoints are discovered from the items of the earlier ones. Spotify doesn't batch playlists.
+SPOTIFY_SCRAPE_BATCH_SIZES = {'playlists': 1, 'albums': 20, 'artists': 45, 'tracks': 50, 'audiobooks': 45}
+# endpoints scraped one id at a time, their items are refreshed with conditional requests. A refresh of the
+# endpoints scraped in batches would download every item again, they are not requeued.
+SPOTIFY_REVALIDATED_ENDPOINTS = [endpoint for endpoint, batch_size in SPOTIFY_SCRAPE_BATCH_SIZES.items()
+                                 if batch_size == 1]
+# endpoints whose ids are discovered from each scraped endpoint by the crawler
+SPOTIFY_CRAWL_EDGES = {'playlists': ['tracks', 'artists', 'albums'], 'albums': ['tracks', 'artists'], 'artists': ['albums']}
+# ids discovered at this depth from the seed ids are scraped but not expanded
+SPOTIFY_CRAWL_MAX_DEPTH = 2
+# item types of the search enumerator and the endpoint their ids are added to
+SPOTIFY_SEARCH_TYPES = {'artist': 'artists', 'album': 'albums', 'playlist': 'playlists'}
+# the search api returns at most 50 items per page and no result past an offset of 1000
+SPOTIFY_SEARCH_PAGE_LIMIT = 50
+SPOTIFY_SEARCH_OFFSET_CAP = 1000
+# field of the paginated collection returned with the items of an endpoint
+SPOTIFY_PAGINATED_FIELDS = {'playlists': 'tracks', 'albums': 'tracks', 'audiobooks': 'chapters'}
+# endpoints accepting a `fields` filter, built from their mapping.json
+SPOTIFY_FIELDS_ENDPOINTS = ['playlists']
+# paths of the tracks of the playlists read by the loaders and the track inserters on top of the tracks mapping,
+# a track missing one of them is not harvested and is scraped whole instead
+SPOTIFY_HARVESTED_TRACK_PATHS = ['id', 'album.id', 'album.name', 'album.artists[].id', 'artists[].id',
+                                 'artists[].name', 'available_markets[]']
+# paths read by the scrapers and loaders on top of the mapping, e.g. to expand pages and discover ids
+SPOTIFY_FIELDS_EXTRA_PATHS = {
+    'playlists': ['id', 'snapshot_id', 'tracks.href', 'tracks.next', 'tracks.total', 'tracks.limit', 'tracks.offset',
+                  *(f"tracks.items[].track.{path}" for path in SPOTIFY_HARVESTED_TRACK_PATHS)],
+}
+# objects of other endpoints embedded in the items, requested with the fields of their own mapping
+SPOTIFY_FIELDS_NESTED_MAPPINGS = {'playlists': {'tracks': 'tracks.items[].track'}}
 DB_CSV_PATH = join(DATA_PATH, 'db/csv')
 
 # DEFINE MUSICBRAINZ CONSTANTS
 MUSICBRAINZ_DATA_PATH = abspath(join(DATA_PATH, 'musicbrainz'))
 MUSICBRAINZ_ITEMS_CSV_NAME = "artist_names.csv"
+MUSICBRAINZ_ITEMS_REGISTRY_NAME = "artist_names.sqlite"
 MUSICBRAINZ_ITEMS_FOLDER_NAME = "items"
-MUSICBRAINZ_API_URL = "https://musicbrainz.org/ws/2/release"
+MUSICBRAINZ_WS_URL = getenv("MUSICBRAINZ_WS_URL", "https://musicbrainz.org/ws/2")
+MUSICBRAINZ_API_URL = f"{MUSICBRAINZ_WS_URL}/release"
+# musicbrainz allows 1 request per second and answers 503 once the limit is exceeded
+MUSICBRAINZ_RATE_LIMIT = {'rate': 1.0, 'min_rate': 0.1, 'max_rate': 1.0, 'burst': 1, 'rate_limit_codes': (429, 503)}
 MUSICBRAINZ_ARTISTS_DATA_ITEMS = abspath(join(SPOTIFY_DATA_PATH, 'artists/items'))
 
 # CONSTANT FOR DATA CHOICES TO BE INSERTED INTO THE DB